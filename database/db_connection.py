@@ -0,0 +1,140 @@
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+# Writes waiting in the queue are committed together, up to this many per transaction.
+MAX_WRITES_PER_COMMIT = 500
+
+class DatabaseConnection:
+    # One long-lived connection per thread for reads and a single writer thread that owns the only
+    # write connection. Writers queue an operation and wait for it; the writer drains whatever is
+    # waiting and commits it as one transaction, each operation in its own savepoint so a failing one
+    # is rolled back alone. With WAL readers never wait for the writer and nothing else competes for
+    # the write lock, so a burst of status updates costs one commit instead of one each and no
+    # longer ends in "database is locked".
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._writer_conn = None
+        self._writer = threading.Thread(target=self._write_loop, name="db-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def reader(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def write(self, operation):
+        # Runs operation(cursor) inside a write transaction and returns its result once committed.
+        if threading.current_thread() is self._writer:
+            return operation(self._writer_conn.cursor())
+        future = Future()
+        with self._lock:
+            queued = not self._closed
+            if queued:
+                self._queue.put((operation, future))
+        if not queued:
+            # Late writes after shutdown (e.g. a worker finishing while the app quits) still land.
+            return self._write_direct(operation)
+        return future.result()
+
+    def _write_direct(self, operation):
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = operation(conn.cursor())
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            return result
+        finally:
+            conn.close()
+
+    def _write_loop(self):
+        conn = self._connect()
+        self._writer_conn = conn
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            while len(batch) < MAX_WRITES_PER_COMMIT:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(item is None for item in batch)
+            operations = [item for item in batch if item is not None]
+            if operations:
+                self._commit_batch(conn, operations)
+        conn.close()
+
+    def _commit_batch(self, conn, operations):
+        outcomes = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for operation, future in operations:
+                conn.execute('SAVEPOINT write_op')
+                try:
+                    result = operation(conn.cursor())
+                except Exception as e:
+                    conn.execute('ROLLBACK TO write_op')
+                    conn.execute('RELEASE write_op')
+                    outcomes.append((future, None, e))
+                else:
+                    conn.execute('RELEASE write_op')
+                    outcomes.append((future, result, None))
+            conn.execute('COMMIT')
+        except Exception as e:
+            print(f"[Database] Write transaction failed: {e}")
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            for operation, future in operations:
+                future.set_exception(e)
+            return
+        # Callers are released only after COMMIT, so they always read their own writes.
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._writer.join()
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+def get_connection(db_path):
+    # Every ImageTeaDB on the same file shares one writer.
+    key = os.path.abspath(db_path)
+    with _connections_lock:
+        connection = _connections.get(key)
+        if connection is None:
+            connection = DatabaseConnection(db_path)
+            _connections[key] = connection
+        return connection
+
+def close_all_connections():
+    with _connections_lock:
+        connections = list(_connections.values())
+    for connection in connections:
+        connection.close()
@@ -0,0 +1,75 @@
+import sqlite3
+
+def ensure_column(c, table, column, declaration):
+    c.execute(f'PRAGMA table_info({table})')
+    if column not in [row[1] for row in c.fetchall()]:
+        c.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+
+def _add_batch_job_columns(c):
+    # Offline batch jobs ("batch") run on the provider's batch API; live jobs are "live".
+    ensure_column(c, 'generation_jobs', 'execution', "TEXT DEFAULT 'live'")
+    ensure_column(c, 'generation_jobs', 'remote_job_id', 'TEXT')
+    ensure_column(c, 'generation_jobs', 'remote_status', 'TEXT')
+    ensure_column(c, 'generation_jobs', 'payload_path', 'TEXT')
+
+def _add_lookup_indexes(c):
+    # Older versions could store the same category twice for a file; keep the first copy so the
+    # unique index (also the UPSERT conflict target) can be built.
+    c.execute('''DELETE FROM category_mapping WHERE id NOT IN (
+                     SELECT MIN(id) FROM category_mapping GROUP BY file_id, platform_id, category_id)''')
+    c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_category_mapping_file_platform_category
+                 ON category_mapping(file_id, platform_id, category_id)''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_files_status ON files(status)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_api_tokens_filepath ON api_tokens(filepath)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_generation_job_rows_job_status ON generation_job_rows(job_id, status)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_generation_jobs_status ON generation_jobs(status)')
+
+def _add_search_index(c):
+    # External-content FTS5 index over the searchable text of files. It stores only the index, the
+    # triggers keep it in step with files, and status-only updates do not touch it.
+    try:
+        c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+                         filename, title, description, tags,
+                         content='files', content_rowid='id', tokenize='unicode61 remove_diacritics 2')''')
+    except sqlite3.OperationalError as e:
+        # SQLite builds without FTS5 keep working; search_files() falls back to LIKE.
+        print(f"[Database] Full-text search unavailable: {e}")
+        return
+    c.execute('''CREATE TRIGGER IF NOT EXISTS files_fts_insert AFTER INSERT ON files BEGIN
+                     INSERT INTO files_fts(rowid, filename, title, description, tags)
+                     VALUES (new.id, new.filename, new.title, new.description, new.tags);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS files_fts_delete AFTER DELETE ON files BEGIN
+                     INSERT INTO files_fts(files_fts, rowid, filename, title, description, tags)
+                     VALUES ('delete', old.id, old.filename, old.title, old.description, old.tags);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS files_fts_update AFTER UPDATE OF filename, title, description, tags ON files BEGIN
+                     INSERT INTO files_fts(files_fts, rowid, filename, title, description, tags)
+                     VALUES ('delete', old.id, old.filename, old.title, old.description, old.tags);
+                     INSERT INTO files_fts(rowid, filename, title, description, tags)
+                     VALUES (new.id, new.filename, new.title, new.description, new.tags);
+                 END''')
+    c.execute("INSERT INTO files_fts(files_fts) VALUES('rebuild')")
+
+# Forward-only and applied in order. Append new steps; never edit or reorder released ones.
+MIGRATIONS = [
+    (1, _add_batch_job_columns),
+    (2, _add_lookup_indexes),
+    (3, _add_search_index),
+]
+
+def get_schema_version(c):
+    c.execute('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)')
+    c.execute('SELECT MAX(version) FROM schema_version')
+    row = c.fetchone()
+    return row[0] if row and row[0] is not None else 0
+
+def migrate(c):
+    # Runs inside the caller's transaction, so a failing step leaves the schema untouched.
+    current = get_schema_version(c)
+    for version, migration in MIGRATIONS:
+        if version <= current:
+            continue
+        migration(c)
+        c.execute('INSERT INTO schema_version (version) VALUES (?)', (version,))
+        print(f"[Database] Migrated schema to version {version}")
@@ -1,18 +1,47 @@
-import sqlite3
 import json
+import re
 from config import BASE_PATH
 import os
+from database.db_connection import get_connection
+from database.db_migrations import migrate
 
 DB_PATH = os.path.join(BASE_PATH, 'database', 'database.db')
+FILE_COLUMNS = 'id, filepath, filename, title, description, tags, status, original_filename'
+# Relative weight of filename, title, description and tags when ranking search matches.
+SEARCH_RANK = 'bm25(files_fts, 4.0, 8.0, 1.0, 2.0)'
+_SEARCH_TERM = re.compile(r'"([^"]*)("?)|(\S+)')
+
+def build_search_query(text):
+    # FTS5 query for the search box: "quoted text" is an exact phrase, every other word matches as
+    # a prefix (so "sun" finds "sunset"), and all terms must match. A phrase whose closing quote
+    # has not been typed yet also matches as a prefix. Terms are reduced to word characters, so
+    # nothing the user types can break the query syntax.
+    terms = []
+    for phrase, closed, word in _SEARCH_TERM.findall(text):
+        tokens = re.findall(r'\w+', phrase or word)
+        if not tokens:
+            continue
+        terms.append('"' + ' '.join(tokens) + ('"' if closed else '"*'))
+    return ' '.join(terms)
 
 class ImageTeaDB:
     def __init__(self, db_path=DB_PATH):
         self.db_path = db_path
+        self._db = get_connection(db_path)
         self._init_db()
+        c = self._read()
+        c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='files_fts'")
+        self._has_search_index = c.fetchone() is not None
+
+    def _read(self):
+        return self._db.reader().cursor()
+
+    def _write(self, operation):
+        # Runs operation(cursor) on the shared writer thread; returns its result once committed.
+        return self._db.write(operation)
 
     def _init_db(self):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
+        def operation(c):
             c.execute('''CREATE TABLE IF NOT EXISTS api_keys (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 service TEXT,
@@ -55,11 +84,35 @@ class ImageTeaDB:
                 FOREIGN KEY(file_id) REFERENCES files(id),
                 FOREIGN KEY(platform_id) REFERENCES platform_list(id)
             )''')
-            conn.commit()
+            c.execute('''CREATE TABLE IF NOT EXISTS generation_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                service TEXT,
+                model TEXT,
+                api_key TEXT,
+                mode TEXT,
+                status TEXT,
+                total INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )''')
+            c.execute('''CREATE TABLE IF NOT EXISTS generation_job_rows (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id INTEGER,
+                file_id INTEGER,
+                filepath TEXT,
+                status TEXT,
+                attempts INTEGER DEFAULT 0,
+                error_message TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY(job_id) REFERENCES generation_jobs(id),
+                FOREIGN KEY(file_id) REFERENCES files(id)
+            )''')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_generation_job_rows_job ON generation_job_rows(job_id, filepath)')
+            migrate(c)
+        self._write(operation)
 
     def set_api_key(self, service, api_key, note=None, last_tested=None, status=None, model=None):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
+        def operation(c):
             c.execute('SELECT id FROM api_keys WHERE service=? AND api_key=?', (service, api_key))
             row = c.fetchone()
             if row:
@@ -69,141 +122,189 @@ class ImageTeaDB:
                 c.execute('''INSERT INTO api_keys (service, api_key, note, last_tested, status, model)
                              VALUES (?, ?, ?, ?, ?, ?)''',
                           (service, api_key, note, last_tested, status, model))
-            conn.commit()
+        self._write(operation)
 
     def get_api_key(self, service):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('SELECT api_key, note, last_tested, status, model FROM api_keys WHERE service=? ORDER BY id DESC LIMIT 1', (service,))
-            row = c.fetchone()
-            if row:
-                return {
-                    'api_key': row[0],
-                    'note': row[1],
-                    'last_tested': row[2],
-                    'status': row[3],
-                    'model': row[4]
-                }
-            return None
+        c = self._read()
+        c.execute('SELECT api_key, note, last_tested, status, model FROM api_keys WHERE service=? ORDER BY id DESC LIMIT 1', (service,))
+        row = c.fetchone()
+        if row:
+            return {
+                'api_key': row[0],
+                'note': row[1],
+                'last_tested': row[2],
+                'status': row[3],
+                'model': row[4]
+            }
+        return None
 
     def update_api_key_note(self, api_key, note):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('UPDATE api_keys SET note=? WHERE api_key=?', (note, api_key))
-            conn.commit()
+        self._write(lambda c: c.execute('UPDATE api_keys SET note=? WHERE api_key=?', (note, api_key)))
 
     def update_api_key_last_tested(self, api_key, last_tested):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('UPDATE api_keys SET last_tested=? WHERE api_key=?', (last_tested, api_key))
-            conn.commit()
+        self._write(lambda c: c.execute('UPDATE api_keys SET last_tested=? WHERE api_key=?', (last_tested, api_key)))
 
     def update_api_key_status(self, api_key, status):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('UPDATE api_keys SET status=? WHERE api_key=?', (status, api_key))
-            conn.commit()
+        self._write(lambda c: c.execute('UPDATE api_keys SET status=? WHERE api_key=?', (status, api_key)))
 
     def update_api_key_model(self, api_key, model):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('UPDATE api_keys SET model=? WHERE api_key=?', (model, api_key))
-            conn.commit()
+        self._write(lambda c: c.execute('UPDATE api_keys SET model=? WHERE api_key=?', (model, api_key)))
 
     def delete_api_key(self, service, api_key):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('DELETE FROM api_keys WHERE service=? AND api_key=?', (service, api_key))
-            conn.commit()
+        self._write(lambda c: c.execute('DELETE FROM api_keys WHERE service=? AND api_key=?', (service, api_key)))
 
     def add_file(self, filepath, filename, title=None, description=None, tags=None, status=None, original_filename=None):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            if original_filename is None:
-                original_filename = filename
+        if original_filename is None:
+            original_filename = filename
+        def operation(c):
             c.execute('''INSERT OR IGNORE INTO files (filepath, filename, title, description, tags, status, original_filename) VALUES (?, ?, ?, ?, ?, ?, ?)''',
                       (filepath, filename, title, description, tags, status, original_filename))
-            conn.commit()
+        self._write(operation)
 
     def update_metadata(self, filepath, title, description, tags, status=None):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
+        def operation(c):
             if status is not None:
                 c.execute('''UPDATE files SET title=?, description=?, tags=?, status=? WHERE filepath=?''',
                           (title, description, tags, status, filepath))
             else:
                 c.execute('''UPDATE files SET title=?, description=?, tags=? WHERE filepath=?''',
                           (title, description, tags, filepath))
-            conn.commit()
+        self._write(operation)
 
     def update_file_status(self, filepath, status):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('UPDATE files SET status=? WHERE filepath=?', (status, filepath))
-            conn.commit()
+        self._write(lambda c: c.execute('UPDATE files SET status=? WHERE filepath=?', (status, filepath)))
+
+    def set_status_many(self, filepaths, status):
+        params = [(status, filepath) for filepath in filepaths]
+        if params:
+            self._write(lambda c: c.executemany('UPDATE files SET status=? WHERE filepath=?', params))
 
     def delete_file(self, filepath):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('DELETE FROM files WHERE filepath=?', (filepath,))
-            conn.commit()
+        self._write(lambda c: c.execute('DELETE FROM files WHERE filepath=?', (filepath,)))
 
     def clear_files(self):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
+        def operation(c):
             c.execute('SELECT id FROM files')
             file_ids = [row[0] for row in c.fetchall()]
             if file_ids:
                 c.executemany('DELETE FROM category_mapping WHERE file_id=?', [(fid,) for fid in file_ids])
             c.execute('DELETE FROM files')
-            conn.commit()
+        self._write(operation)
 
     def get_all_files(self):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('SELECT id, filepath, filename, title, description, tags, status, original_filename FROM files')
-            return c.fetchall()
+        c = self._read()
+        c.execute(f'SELECT {FILE_COLUMNS} FROM files')
+        return c.fetchall()
+
+    # The queries below return rows in the same column order as get_all_files(). Id and path lists
+    # are passed as one JSON parameter, so they are not bound by SQLite's variable limit.
+
+    def get_file_by_id(self, file_id):
+        c = self._read()
+        c.execute(f'SELECT {FILE_COLUMNS} FROM files WHERE id=?', (file_id,))
+        return c.fetchone()
+
+    def get_file_by_filepath(self, filepath):
+        c = self._read()
+        c.execute(f'SELECT {FILE_COLUMNS} FROM files WHERE filepath=?', (filepath,))
+        return c.fetchone()
+
+    def get_files_by_ids(self, file_ids):
+        c = self._read()
+        c.execute(f'SELECT {FILE_COLUMNS} FROM files WHERE id IN (SELECT value FROM json_each(?)) ORDER BY id',
+                  (json.dumps([int(file_id) for file_id in file_ids]),))
+        return c.fetchall()
+
+    def get_files_by_status(self, statuses):
+        c = self._read()
+        c.execute(f'SELECT {FILE_COLUMNS} FROM files WHERE status IN (SELECT value FROM json_each(?)) ORDER BY id',
+                  (json.dumps(list(statuses)),))
+        return c.fetchall()
+
+    def get_files_page(self, after_id=0, limit=500):
+        # Keyset pagination: pass the last id of the previous page.
+        c = self._read()
+        c.execute(f'SELECT {FILE_COLUMNS} FROM files WHERE id>? ORDER BY id LIMIT ?', (after_id, limit))
+        return c.fetchall()
+
+    def iter_files(self, page_size=1000):
+        after_id = 0
+        while True:
+            page = self.get_files_page(after_id, page_size)
+            if not page:
+                return
+            yield from page
+            after_id = page[-1][0]
+
+    def get_existing_filepaths(self, filepaths):
+        c = self._read()
+        c.execute('SELECT filepath FROM files WHERE filepath IN (SELECT value FROM json_each(?))', (json.dumps(list(filepaths)),))
+        return {row[0] for row in c.fetchall()}
+
+    def count_files(self):
+        c = self._read()
+        c.execute('SELECT COUNT(*) FROM files')
+        return c.fetchone()[0]
+
+    def search_files(self, text, limit=None):
+        # Matching rows, best match first. Text without any word characters (e.g. "-") and
+        # SQLite builds without FTS5 fall back to a substring match.
+        query = build_search_query(text)
+        if not query or not self._has_search_index:
+            return self._search_files_like(text, limit)
+        c = self._read()
+        c.execute(f'''SELECT {FILE_COLUMNS} FROM files JOIN (
+                          SELECT rowid, {SEARCH_RANK} AS score FROM files_fts WHERE files_fts MATCH ?
+                      ) matches ON files.id = matches.rowid
+                      ORDER BY matches.score LIMIT ?''',
+                  (query, -1 if limit is None else limit))
+        return c.fetchall()
+
+    def _search_files_like(self, text, limit=None):
+        text = text.strip()
+        if not text:
+            return []
+        pattern = '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        c = self._read()
+        c.execute(f'''SELECT {FILE_COLUMNS} FROM files
+                      WHERE filepath LIKE ?1 ESCAPE '\\' OR filename LIKE ?1 ESCAPE '\\' OR title LIKE ?1 ESCAPE '\\'
+                         OR description LIKE ?1 ESCAPE '\\' OR tags LIKE ?1 ESCAPE '\\'
+                      ORDER BY id LIMIT ?2''',
+                  (pattern, -1 if limit is None else limit))
+        return c.fetchall()
 
     def get_all_api_keys(self):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('SELECT service, api_key, note, last_tested, status, model FROM api_keys')
-            return c.fetchall()
+        c = self._read()
+        c.execute('SELECT service, api_key, note, last_tested, status, model FROM api_keys')
+        return c.fetchall()
 
     def insert_api_token_stats(self, filepath, service, model, token_input, token_output, token_total):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
+        def operation(c):
             c.execute('''INSERT INTO api_tokens (filepath, service, model, token_input, token_output, token_total)
                          VALUES (?, ?, ?, ?, ?, ?)''',
                       (filepath, service, model, token_input, token_output, token_total))
-            conn.commit()
+        self._write(operation)
 
     def get_token_stats_sum(self):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('SELECT SUM(token_input), SUM(token_output), SUM(token_total) FROM api_tokens')
-            row = c.fetchone()
-            if row:
-                return tuple(x if x is not None else 0 for x in row)
-            return (0, 0, 0)
+        c = self._read()
+        c.execute('SELECT SUM(token_input), SUM(token_output), SUM(token_total) FROM api_tokens')
+        row = c.fetchone()
+        if row:
+            return tuple(x if x is not None else 0 for x in row)
+        return (0, 0, 0)
 
     def update_file_path_and_name(self, old_filepath, new_filepath, new_filename):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('UPDATE files SET filepath=?, filename=? WHERE filepath=?', (new_filepath, new_filename, old_filepath))
-            conn.commit()
+        self._write(lambda c: c.execute('UPDATE files SET filepath=?, filename=? WHERE filepath=?', (new_filepath, new_filename, old_filepath)))
 
     def batch_update_file_paths(self, rename_results):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
+        def operation(c):
             for old_filepath, new_filepath, old_filename, new_filename, success, error in rename_results:
                 if success and new_filepath and new_filename:
                     c.execute('UPDATE files SET filepath=?, filename=? WHERE filepath=?', (new_filepath, new_filename, old_filepath))
-            conn.commit()
+        self._write(operation)
 
     def undo_rename(self, filepaths):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
+        def operation(c):
             for filepath in filepaths:
                 c.execute('SELECT original_filename, filename, filepath FROM files WHERE filepath=?', (filepath,))
                 row = c.fetchone()
@@ -221,56 +322,55 @@ class ImageTeaDB:
                         c.execute('UPDATE files SET filepath=?, filename=? WHERE filepath=?', (original_filepath, original_filename, current_filepath))
                     except Exception as e:
                         print(f"Undo rename error: {current_filepath} -> {original_filepath} | {e}")
-            conn.commit()
+        self._write(operation)
 
     def clear_all_metadata(self):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
+        def operation(c):
             c.execute('UPDATE files SET title=NULL, description=NULL, tags=NULL, status="draft"')
             c.execute('DELETE FROM category_mapping WHERE file_id IN (SELECT id FROM files)')
-            conn.commit()
+        self._write(operation)
 
     def save_category_mapping(self, file_id, category_dict):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
+        def operation(c):
+            self._write_category_mapping(c, file_id, category_dict)
+        self._write(operation)
+
+    def _platform_id(self, c, platform, cache):
+        platform_id = cache.get(platform)
+        if platform_id is None:
+            c.execute('INSERT OR IGNORE INTO platform_list (name) VALUES (?)', (platform,))
+            c.execute('SELECT id FROM platform_list WHERE name=?', (platform,))
+            platform_id = c.fetchone()[0]
+            cache[platform] = platform_id
+        return platform_id
+
+    def _write_category_mapping(self, c, file_id, category_dict):
+        self._write_category_mappings(c, [(file_id, category_dict)])
+
+    def _write_category_mappings(self, c, items):
+        # items: (file_id, category_dict). Each platform present in a dict replaces that file's
+        # categories on the platform: stale ids are dropped and the rest is one UPSERT per row.
+        platform_ids = {}
+        kept = []
+        rows = []
+        for file_id, category_dict in items:
             for platform, category_id in category_dict.items():
                 if platform == "shutterstock" and isinstance(category_id, dict):
-                    for key in ["primary", "secondary"]:
-                        cat_val = category_id.get(key)
-                        if cat_val is not None:
-                            c.execute('SELECT id FROM platform_list WHERE name=?', (platform,))
-                            platform_row = c.fetchone()
-                            if platform_row:
-                                platform_id = platform_row[0]
-                            else:
-                                c.execute('INSERT INTO platform_list (name) VALUES (?)', (platform,))
-                                platform_id = c.lastrowid
-                            c.execute('SELECT id FROM category_mapping WHERE file_id=? AND platform_id=? AND category_id=?', (file_id, platform_id, cat_val))
-                            mapping_row = c.fetchone()
-                            cat_name = f"{cat_val} ({key})"
-                            if mapping_row:
-                                c.execute('UPDATE category_mapping SET category_id=?, category_name=? WHERE id=?',
-                                          (cat_val, cat_name, mapping_row[0]))
-                            else:
-                                c.execute('INSERT INTO category_mapping (file_id, platform_id, category_id, category_name) VALUES (?, ?, ?, ?)',
-                                          (file_id, platform_id, cat_val, cat_name))
+                    entries = [(category_id[key], f"{category_id[key]} ({key})") for key in ["primary", "secondary"]
+                               if category_id.get(key) is not None]
                 else:
-                    c.execute('SELECT id FROM platform_list WHERE name=?', (platform,))
-                    platform_row = c.fetchone()
-                    if platform_row:
-                        platform_id = platform_row[0]
-                    else:
-                        c.execute('INSERT INTO platform_list (name) VALUES (?)', (platform,))
-                        platform_id = c.lastrowid
-                    c.execute('SELECT id FROM category_mapping WHERE file_id=? AND platform_id=?', (file_id, platform_id))
-                    mapping_row = c.fetchone()
-                    if mapping_row:
-                        c.execute('UPDATE category_mapping SET category_id=?, category_name=? WHERE id=?',
-                                  (category_id, str(category_id), mapping_row[0]))
-                    else:
-                        c.execute('INSERT INTO category_mapping (file_id, platform_id, category_id, category_name) VALUES (?, ?, ?, ?)',
-                                  (file_id, platform_id, category_id, str(category_id)))
-            conn.commit()
+                    entries = [(category_id, str(category_id))]
+                if not entries:
+                    continue
+                platform_id = self._platform_id(c, platform, platform_ids)
+                kept.append((file_id, platform_id, json.dumps([entry[0] for entry in entries])))
+                rows.extend((file_id, platform_id, cat_val, cat_name) for cat_val, cat_name in entries)
+        if kept:
+            c.executemany('''DELETE FROM category_mapping WHERE file_id=? AND platform_id=?
+                             AND category_id NOT IN (SELECT value FROM json_each(?))''', kept)
+        if rows:
+            c.executemany('''INSERT INTO category_mapping (file_id, platform_id, category_id, category_name) VALUES (?, ?, ?, ?)
+                             ON CONFLICT(file_id, platform_id, category_id) DO UPDATE SET category_name=excluded.category_name''', rows)
 
     def get_category_maps(self):
         config_path = os.path.join(BASE_PATH, "configs", "ai_config.json")
@@ -281,41 +381,208 @@ class ImageTeaDB:
         return shutterstock_map, adobe_map
 
     def get_category_mapping(self):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('SELECT file_id, platform_id, category_id, category_name FROM category_mapping')
-            rows = c.fetchall()
-            c.execute('SELECT id, name FROM platform_list')
-            platform_map = {row[0]: row[1] for row in c.fetchall()}
-            mapping = []
-            for row in rows:
-                mapping.append({
-                    'file_id': row[0],
-                    'platform': platform_map.get(row[1], ''),
-                    'category_id': row[2],
-                    'category_name': row[3]
-                })
-            return mapping
+        c = self._read()
+        c.execute('SELECT file_id, platform_id, category_id, category_name FROM category_mapping')
+        rows = c.fetchall()
+        c.execute('SELECT id, name FROM platform_list')
+        platform_map = {row[0]: row[1] for row in c.fetchall()}
+        mapping = []
+        for row in rows:
+            mapping.append({
+                'file_id': row[0],
+                'platform': platform_map.get(row[1], ''),
+                'category_id': row[2],
+                'category_name': row[3]
+            })
+        return mapping
 
     def get_category_mapping_for_file(self, file_id):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('SELECT file_id, platform_id, category_id, category_name FROM category_mapping WHERE file_id=?', (file_id,))
-            rows = c.fetchall()
-            c.execute('SELECT id, name FROM platform_list')
-            platform_map = {row[0]: row[1] for row in c.fetchall()}
-            mapping = []
-            for row in rows:
-                mapping.append({
-                    'file_id': row[0],
-                    'platform': platform_map.get(row[1], ''),
-                    'category_id': row[2],
-                    'category_name': row[3]
-                })
-            return mapping
+        c = self._read()
+        c.execute('SELECT file_id, platform_id, category_id, category_name FROM category_mapping WHERE file_id=?', (file_id,))
+        rows = c.fetchall()
+        c.execute('SELECT id, name FROM platform_list')
+        platform_map = {row[0]: row[1] for row in c.fetchall()}
+        mapping = []
+        for row in rows:
+            mapping.append({
+                'file_id': row[0],
+                'platform': platform_map.get(row[1], ''),
+                'category_id': row[2],
+                'category_name': row[3]
+            })
+        return mapping
 
     def delete_all_api_tokens(self):
-        with sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('DELETE FROM api_tokens')
-            conn.commit()
\ No newline at end of file
+        self._write(lambda c: c.execute('DELETE FROM api_tokens'))
+
+    def create_generation_job(self, service, model, api_key, mode, rows, execution="live"):
+        status = "preparing" if execution == "batch" else "running"
+        def operation(c):
+            c.execute('''INSERT INTO generation_jobs (service, model, api_key, mode, status, total, execution)
+                         VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                      (service, model, api_key, mode, status, len(rows), execution))
+            job_id = c.lastrowid
+            c.executemany('''INSERT INTO generation_job_rows (job_id, file_id, filepath, status)
+                             VALUES (?, ?, ?, ?)''',
+                          [(job_id, row[0], row[1], "pending") for row in rows])
+            return job_id
+        return self._write(operation)
+
+    def finish_generation_job(self, job_id, status):
+        def operation(c):
+            c.execute('UPDATE generation_jobs SET status=?, updated_at=CURRENT_TIMESTAMP WHERE id=?', (status, job_id))
+            if status != "completed":
+                c.execute('''UPDATE generation_job_rows SET status=? WHERE job_id=? AND status=?''',
+                          ("pending", job_id, "processing"))
+        self._write(operation)
+
+    def get_interrupted_generation_job(self):
+        c = self._read()
+        c.execute('''SELECT id, service, model, api_key, mode, total, created_at FROM generation_jobs
+                     WHERE status=? ORDER BY id DESC LIMIT 1''', ("running",))
+        row = c.fetchone()
+        if not row:
+            return None
+        c.execute('''SELECT COUNT(*) FROM generation_job_rows WHERE job_id=? AND status IN (?, ?)''',
+                  (row[0], "pending", "processing"))
+        remaining = c.fetchone()[0]
+        return {
+            'id': row[0],
+            'service': row[1],
+            'model': row[2],
+            'api_key': row[3],
+            'mode': row[4],
+            'total': row[5],
+            'created_at': row[6],
+            'remaining': remaining
+        }
+
+    def get_unfinished_job_files(self, job_id):
+        c = self._read()
+        c.execute('''SELECT f.id, f.filepath, f.filename, f.title, f.description, f.tags, f.status, f.original_filename
+                     FROM generation_job_rows r JOIN files f ON f.id = r.file_id
+                     WHERE r.job_id=? AND r.status IN (?, ?)
+                     ORDER BY r.id''',
+                  (job_id, "pending", "processing"))
+        return c.fetchall()
+
+    def abandon_generation_job(self, job_id):
+        def operation(c):
+            c.execute('''UPDATE files SET status=? WHERE status=? AND id IN (
+                             SELECT file_id FROM generation_job_rows WHERE job_id=? AND status IN (?, ?))''',
+                      ("stopped", "processing", job_id, "pending", "processing"))
+            c.execute('UPDATE generation_jobs SET status=?, updated_at=CURRENT_TIMESTAMP WHERE id=?', ("abandoned", job_id))
+        self._write(operation)
+
+    def mark_batch_job_submitted(self, job_id, remote_job_id, payload_path):
+        def operation(c):
+            c.execute('''UPDATE generation_jobs SET status=?, remote_job_id=?, payload_path=?, updated_at=CURRENT_TIMESTAMP
+                         WHERE id=?''',
+                      ("submitted", remote_job_id, payload_path, job_id))
+            c.execute('''UPDATE generation_job_rows SET status=?, attempts=attempts+1, updated_at=CURRENT_TIMESTAMP
+                         WHERE job_id=? AND status=?''',
+                      ("processing", job_id, "pending"))
+            c.execute('''UPDATE files SET status=? WHERE id IN (
+                             SELECT file_id FROM generation_job_rows WHERE job_id=? AND status=?)''',
+                      ("queued", job_id, "processing"))
+        self._write(operation)
+
+    def fail_batch_job(self, job_id, error_message):
+        def operation(c):
+            c.execute('''UPDATE files SET status=? WHERE id IN (
+                             SELECT file_id FROM generation_job_rows WHERE job_id=? AND status IN (?, ?))''',
+                      ("failed", job_id, "pending", "processing"))
+            c.execute('''UPDATE generation_job_rows SET status=?, error_message=?, updated_at=CURRENT_TIMESTAMP
+                         WHERE job_id=? AND status IN (?, ?)''',
+                      ("failed", error_message, job_id, "pending", "processing"))
+            c.execute('UPDATE generation_jobs SET status=?, updated_at=CURRENT_TIMESTAMP WHERE id=?', ("failed", job_id))
+        self._write(operation)
+
+    def update_batch_job_remote_status(self, job_id, remote_status):
+        self._write(lambda c: c.execute('UPDATE generation_jobs SET remote_status=?, updated_at=CURRENT_TIMESTAMP WHERE id=?', (remote_status, job_id)))
+
+    def get_active_batch_jobs(self):
+        c = self._read()
+        c.execute('''SELECT id, service, model, api_key, remote_job_id, remote_status, payload_path, total, created_at
+                     FROM generation_jobs WHERE execution=? AND status=? ORDER BY id''', ("batch", "submitted"))
+        return [
+            {
+                'id': row[0],
+                'service': row[1],
+                'model': row[2],
+                'api_key': row[3],
+                'remote_job_id': row[4],
+                'remote_status': row[5],
+                'payload_path': row[6],
+                'total': row[7],
+                'created_at': row[8]
+            }
+            for row in c.fetchall()
+        ]
+
+    def get_preparing_batch_jobs(self):
+        c = self._read()
+        c.execute('''SELECT id, service, api_key FROM generation_jobs WHERE execution=? AND status=? ORDER BY id''',
+                  ("batch", "preparing"))
+        return [{'id': row[0], 'service': row[1], 'api_key': row[2]} for row in c.fetchall()]
+
+    def get_batch_job_files(self, job_id):
+        c = self._read()
+        c.execute('''SELECT r.file_id, r.filepath FROM generation_job_rows r
+                     WHERE r.job_id=? AND r.status IN (?, ?) ORDER BY r.id''',
+                  (job_id, "pending", "processing"))
+        return c.fetchall()
+
+    def record_generation_results(self, job_id, service, model, results, started=(), usage=()):
+        # Writes a group of job rows in one transaction: rows started since the last write, then
+        # finished rows (metadata and status, token stats, categories and job row state). usage holds
+        # (filepath, token_input, token_output, token_total) billed for rows that are not finished yet.
+        self._write(lambda c: self._write_generation_results(c, job_id, service, model, results, started, usage))
+
+    def _write_generation_results(self, c, job_id, service, model, results, started=(), usage=()):
+        # results: (file_id, filepath, title, description, tags, category, error_message,
+        # token_input, token_output, token_total). A title of None marks a row without any result:
+        # only its status changes and earlier metadata is kept. Any other row is written like the
+        # per-row path did: a token row even at zero tokens, and its categories whenever present.
+        if started:
+            c.executemany('UPDATE files SET status=? WHERE filepath=?', [("processing", filepath) for filepath in started])
+            c.executemany('''UPDATE generation_job_rows SET status=?, attempts=attempts+1, updated_at=CURRENT_TIMESTAMP
+                             WHERE job_id=? AND filepath=?''',
+                          [("processing", job_id, filepath) for filepath in started])
+        statuses = []
+        metadata = []
+        tokens = [(filepath, service, model, token_input, token_output, token_total)
+                  for filepath, token_input, token_output, token_total in usage]
+        job_rows = []
+        categories = []
+        for file_id, filepath, title, description, tags, category, error_message, token_input, token_output, token_total in results:
+            status = "success" if title else "failed"
+            if title is None:
+                statuses.append((status, filepath))
+            else:
+                metadata.append((title, description, tags, status, filepath))
+                tokens.append((filepath, service, model, token_input, token_output, token_total))
+                if isinstance(category, dict) and category:
+                    categories.append((file_id, category))
+            job_rows.append((status, error_message or None, job_id, filepath))
+        if statuses:
+            c.executemany('UPDATE files SET status=? WHERE filepath=?', statuses)
+        if metadata:
+            c.executemany('UPDATE files SET title=?, description=?, tags=?, status=? WHERE filepath=?', metadata)
+        if categories:
+            self._write_category_mappings(c, categories)
+        if tokens:
+            c.executemany('''INSERT INTO api_tokens (filepath, service, model, token_input, token_output, token_total)
+                             VALUES (?, ?, ?, ?, ?, ?)''', tokens)
+        if job_rows:
+            c.executemany('''UPDATE generation_job_rows SET status=?, error_message=?, updated_at=CURRENT_TIMESTAMP
+                             WHERE job_id=? AND filepath=?''', job_rows)
+            c.execute('UPDATE generation_jobs SET updated_at=CURRENT_TIMESTAMP WHERE id=?', (job_id,))
+
+    def ingest_batch_results(self, job_id, service, model, results, job_status="completed"):
+        # Everything lands in one transaction, so a crash mid-ingest leaves the job "submitted" and
+        # it is simply ingested again on the next poll.
+        def operation(c):
+            self._write_generation_results(c, job_id, service, model, results)
+            c.execute('UPDATE generation_jobs SET status=?, updated_at=CURRENT_TIMESTAMP WHERE id=?', (job_status, job_id))
+        self._write(operation)
@@ -123,8 +123,7 @@ class CSVExporterDialog(QDialog):
             return
         from database.db_operation import ImageTeaDB
         db = ImageTeaDB()
-        files = db.get_all_files()
-        total_files = len(files) * len(selected)
+        total_files = db.count_files() * len(selected)
         progress = QProgressDialog("Exporting CSV...", "Cancel", 0, total_files, self)
         progress.setWindowModality(Qt.WindowModal)
         progress.setMinimumDuration(0)
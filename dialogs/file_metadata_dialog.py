@@ -14,10 +14,7 @@ class FileMetadataDialog(QDialog):
         self._properties_widget = getattr(parent, "properties_widget", None)
         file_data = None
         if self.db:
-            for row in self.db.get_all_files():
-                if row[1] == filepath:
-                    file_data = row
-                    break
+            file_data = self.db.get_file_by_filepath(filepath)
         if not file_data:
             file_data = (None, filepath, "", "", "", "", "", "")
 
@@ -216,11 +213,8 @@ class FileMetadataDialog(QDialog):
         description = self.description_edit.toPlainText()
         tags = self.tags_edit.text()
         self.db.update_metadata(self.filepath, title, description, tags)
-        file_id = None
-        for row in self.db.get_all_files():
-            if row[1] == self.filepath:
-                file_id = row[0]
-                break
+        saved_row = self.db.get_file_by_filepath(self.filepath)
+        file_id = saved_row[0] if saved_row else None
         if file_id is not None:
             cat_dict = {}
             primary_val = self.shutterstock_primary_combo.currentData()
@@ -238,16 +232,14 @@ class FileMetadataDialog(QDialog):
                 self.db.save_category_mapping(file_id, cat_dict)
         if self._properties_widget is None and self.parent() is not None:
             self._properties_widget = getattr(self.parent(), "properties_widget", None)
-        if self._properties_widget is not None:
-            for row in self.db.get_all_files():
-                if row[1] == self.filepath:
-                    title = row[3] if len(row) > 3 and row[3] is not None else ""
-                    tags = row[5] if len(row) > 5 and row[5] is not None else ""
-                    title_length = len(title)
-                    tag_count = len([t for t in tags.split(",") if t.strip()]) if tags else 0
-                    row_data = [row[0]] + list(row[1:7]) + [row[7] if len(row) > 7 else ""] + [str(title_length), str(tag_count)]
-                    self._properties_widget.set_properties(row_data)
-                    break
+        if self._properties_widget is not None and saved_row:
+            row = saved_row
+            title = row[3] if len(row) > 3 and row[3] is not None else ""
+            tags = row[5] if len(row) > 5 and row[5] is not None else ""
+            title_length = len(title)
+            tag_count = len([t for t in tags.split(",") if t.strip()]) if tags else 0
+            row_data = [row[0]] + list(row[1:7]) + [row[7] if len(row) > 7 else ""] + [str(title_length), str(tag_count)]
+            self._properties_widget.set_properties(row_data)
         # Refresh table and thumbnails after saving metadata
         parent = self.parent()
         if parent is not None:
@@ -0,0 +1,74 @@
+import time
+import threading
+from helpers.config_cache_helper import load_ai_config
+
+def load_concurrency_config():
+    config = load_ai_config()
+    return {
+        "enabled": bool(config.get("adaptive_concurrency", True)),
+        "initial": int(config["batch_size"]),
+        "minimum": int(config.get("min_concurrency", 1)),
+        "maximum": int(config.get("max_concurrency", 20)),
+    }
+
+class AdaptiveConcurrencyController:
+    # Additive increase while latency stays near its baseline, multiplicative decrease on
+    # rate-limit/5xx responses. The limit is the number of requests the pipeline keeps in flight.
+    def __init__(self, initial, minimum=1, maximum=20, increase_step=1.0, decrease_factor=0.5, latency_tolerance=1.5):
+        self.minimum = max(1, int(minimum))
+        self.maximum = max(self.minimum, int(maximum))
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self._limit = float(min(max(int(initial), self.minimum), self.maximum))
+        self._baseline_ms = None
+        self._recent_ms = None
+        self._backoff_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self):
+        with self._lock:
+            return int(self._limit)
+
+    def on_success(self, latency_ms):
+        with self._lock:
+            if self._baseline_ms is None:
+                self._baseline_ms = float(latency_ms)
+                self._recent_ms = float(latency_ms)
+            else:
+                self._recent_ms = self._recent_ms * 0.7 + latency_ms * 0.3
+                # The baseline follows drops immediately but only creeps upward, so it tracks the
+                # uncongested latency rather than whatever the current load produces.
+                if latency_ms < self._baseline_ms:
+                    self._baseline_ms = float(latency_ms)
+                else:
+                    self._baseline_ms = self._baseline_ms * 0.98 + latency_ms * 0.02
+            if time.monotonic() < self._backoff_until:
+                return
+            old_limit = int(self._limit)
+            if self._recent_ms <= self._baseline_ms * self.latency_tolerance:
+                # One step per full window of successes, i.e. roughly +1 per round trip.
+                self._limit = min(self.maximum, self._limit + self.increase_step / max(self._limit, 1.0))
+            elif self._recent_ms > self._baseline_ms * self.latency_tolerance * 2:
+                self._limit = max(self.minimum, self._limit * 0.9)
+            if int(self._limit) != old_limit:
+                print(f"[AIMD] concurrency {old_limit} -> {int(self._limit)}")
+
+    def on_throttle(self):
+        with self._lock:
+            now = time.monotonic()
+            if now < self._backoff_until:
+                return
+            old_limit = int(self._limit)
+            self._limit = max(float(self.minimum), self._limit * self.decrease_factor)
+            # Ignore further throttles from requests that were already in flight when this one failed.
+            cooldown_ms = self._recent_ms if self._recent_ms else 1000
+            self._backoff_until = now + cooldown_ms / 1000.0
+            print(f"[AIMD] throttled, concurrency {old_limit} -> {int(self._limit)}")
+
+    def on_result(self, latency_ms, error_message=None, failure_kind=None):
+        if failure_kind == "throttle":
+            self.on_throttle()
+        elif not error_message:
+            self.on_success(latency_ms)
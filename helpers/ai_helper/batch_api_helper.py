@@ -0,0 +1,159 @@
+import os
+import json
+from config import BASE_PATH
+from helpers.config_cache_helper import load_ai_config
+from helpers.ai_helper.client_registry_helper import get_client
+from helpers.ai_helper.response_schema_helper import get_response_schema
+
+BATCH_PAYLOAD_DIR = os.path.join(BASE_PATH, "temp", "batch_jobs")
+
+GEMINI_FINISHED_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+GEMINI_RESULT_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED"}
+OPENAI_FINISHED_STATES = {"completed", "failed", "expired", "cancelled"}
+# Provider caps on one batch input file: OpenAI takes 50,000 requests and 200 MB, the Gemini File
+# API 2 GB. Bigger jobs are split into several remote batches.
+DEFAULT_MAX_REQUESTS = {"gemini": 50000, "openai": 50000}
+DEFAULT_MAX_PAYLOAD_MB = {"gemini": 1900, "openai": 190}
+
+def get_batch_job_settings():
+    config_json = load_ai_config()
+    settings = config_json.get("batch_job", {})
+    base_urls = settings.get("base_url", {}) or {}
+    max_requests = settings.get("max_requests", {}) or {}
+    max_payload_mb = settings.get("max_payload_mb", {}) or {}
+    services = ("gemini", "openai")
+    return {
+        "poll_seconds": max(5, int(settings.get("poll_seconds", 60))),
+        "base_url": {service: (base_urls.get(service) or "").strip() for service in services},
+        "max_requests": {service: max(1, int(max_requests.get(service) or DEFAULT_MAX_REQUESTS[service])) for service in services},
+        "max_payload_bytes": {
+            service: int(float(max_payload_mb.get(service) or DEFAULT_MAX_PAYLOAD_MB[service]) * 1024 * 1024)
+            for service in services
+        },
+    }
+
+def get_batch_payload_path(job_id, service):
+    os.makedirs(BATCH_PAYLOAD_DIR, exist_ok=True)
+    return os.path.join(BATCH_PAYLOAD_DIR, f"job_{job_id}_{service}.jsonl")
+
+def get_batch_display_name(job_id):
+    # Also how a job whose submission was interrupted is found again on the provider side.
+    return f"image-tea-job-{job_id}"
+
+def get_batch_client(service, api_key):
+    # batch_job.base_url points a service at another endpoint (e.g. a local fake batch server).
+    base_url = get_batch_job_settings()["base_url"].get(service)
+    if service == "gemini":
+        import google.genai as genai
+        from google.genai import types
+        if base_url:
+            return get_client(f"gemini@{base_url}", api_key, lambda: genai.Client(api_key=api_key, http_options=types.HttpOptions(base_url=base_url)))
+        return get_client("gemini", api_key, lambda: genai.Client(api_key=api_key))
+    from openai import OpenAI
+    if base_url:
+        return get_client(f"openai@{base_url}", api_key, lambda: OpenAI(api_key=api_key, base_url=base_url, max_retries=0))
+    return get_client("openai", api_key, lambda: OpenAI(api_key=api_key, max_retries=0))
+
+def build_batch_line(service, model, key, images, prompt):
+    schema = get_response_schema(service, model)
+    if service == "gemini":
+        from helpers.ai_helper.gemini_helper import build_batch_request
+        return {"key": key, "request": build_batch_request(images, prompt, schema)}
+    from helpers.ai_helper.openai_helper import build_batch_request
+    return {"custom_id": key, "method": "POST", "url": "/v1/responses", "body": build_batch_request(model, images, prompt, schema)}
+
+def submit_batch(service, api_key, model, payload_path, display_name):
+    client = get_batch_client(service, api_key)
+    if service == "gemini":
+        from google.genai import types
+        uploaded = client.files.upload(file=payload_path, config=types.UploadFileConfig(display_name=display_name, mime_type="jsonl"))
+        job = client.batches.create(model=model, src=uploaded.name, config=types.CreateBatchJobConfig(display_name=display_name))
+        return job.name
+    with open(payload_path, "rb") as f:
+        uploaded = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=uploaded.id,
+        endpoint="/v1/responses",
+        completion_window="24h",
+        metadata={"display_name": display_name}
+    )
+    return batch.id
+
+def find_remote_batch(service, api_key, display_name):
+    # Remote id of the batch created under display_name, or None if it was never created.
+    client = get_batch_client(service, api_key)
+    if service == "gemini":
+        for job in client.batches.list():
+            if job.display_name == display_name:
+                return job.name
+        return None
+    for batch in client.batches.list(limit=100):
+        if (batch.metadata or {}).get("display_name") == display_name:
+            return batch.id
+    return None
+
+def poll_batch(service, api_key, remote_id):
+    # Returns (remote state, finished, output reference or None).
+    client = get_batch_client(service, api_key)
+    if service == "gemini":
+        job = client.batches.get(name=remote_id)
+        state = getattr(job.state, "name", None) or str(job.state)
+        finished = state in GEMINI_FINISHED_STATES
+        output = None
+        if state in GEMINI_RESULT_STATES and job.dest is not None:
+            output = job.dest.file_name
+        return state, finished, output
+    batch = client.batches.retrieve(remote_id)
+    finished = batch.status in OPENAI_FINISHED_STATES
+    output = None
+    if finished and (batch.output_file_id or batch.error_file_id):
+        output = {"output": batch.output_file_id, "error": batch.error_file_id}
+    return batch.status, finished, output
+
+def cancel_batch(service, api_key, remote_id):
+    client = get_batch_client(service, api_key)
+    if service == "gemini":
+        client.batches.cancel(name=remote_id)
+    else:
+        client.batches.cancel(remote_id)
+
+def _iter_jsonl(data):
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    for line in data.splitlines():
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+def _error_text(error):
+    if isinstance(error, dict):
+        return error.get("message") or json.dumps(error)
+    return str(error)
+
+def fetch_batch_results(service, api_key, output):
+    # Maps each request key to the live helpers' result tuple, without the failure kind.
+    client = get_batch_client(service, api_key)
+    results = {}
+    if service == "gemini":
+        from helpers.ai_helper.gemini_helper import parse_batch_response
+        for line in _iter_jsonl(client.files.download(file=output)):
+            key = line.get("key")
+            if "response" in line and line["response"]:
+                results[key] = parse_batch_response(line["response"])
+            else:
+                error = line.get("error") or line.get("status") or "No response"
+                results[key] = ('', '', '', {}, f"[Gemini ERROR] {_error_text(error)}", 0, 0, 0)
+        return results
+    from helpers.ai_helper.openai_helper import parse_batch_response
+    for file_id in (output.get("output"), output.get("error")):
+        if not file_id:
+            continue
+        for line in _iter_jsonl(client.files.content(file_id).text):
+            key = line.get("custom_id")
+            response = line.get("response") or {}
+            if response.get("status_code") == 200 and response.get("body"):
+                results[key] = parse_batch_response(response["body"])
+            else:
+                error = line.get("error") or (response.get("body") or {}).get("error") or f"HTTP {response.get('status_code')}"
+                results[key] = ('', '', '', {}, f"[OpenAI ERROR] {_error_text(error)}", 0, 0, 0)
+    return results
@@ -0,0 +1,40 @@
+import threading
+
+# Provider clients are expensive to build and own an HTTP connection pool, so one client per
+# (service, api_key) is kept for the lifetime of the app and shared by all worker threads.
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(service, api_key, factory):
+    key = (service, api_key)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = factory()
+            _clients[key] = client
+        return client
+
+def discard_client(service, api_key):
+    with _clients_lock:
+        client = _clients.pop((service, api_key), None)
+    _close_client(client)
+
+def close_all_clients():
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        _close_client(client)
+
+def _close_client(client):
+    if client is None:
+        return
+    close = getattr(client, "close", None)
+    if callable(close):
+        try:
+            close()
+        except Exception as e:
+            print(f"[ClientRegistry] Failed to close client: {e}")
@@ -0,0 +1,106 @@
+import time
+import hashlib
+import threading
+from google.genai import types
+from helpers.config_cache_helper import load_ai_config
+from helpers.ai_helper.prompt_template_helper import get_prompt_template
+
+# Extend the cache's TTL when a job is still using it this close to expiry.
+REFRESH_MARGIN_SECONDS = 120
+
+def get_context_cache_settings():
+    config_json = load_ai_config()
+    settings = config_json.get("gemini_context_cache", {})
+    return bool(settings.get("enabled", True)), max(60, int(settings.get("ttl_seconds", 1800)))
+
+def is_cache_error(error):
+    message = str(error).lower()
+    return "cachedcontent" in message or "cached content" in message or "cached_content" in message
+
+class PromptCacheManager:
+    # The guidelines, category maps and response format are the same for every file of a job. They
+    # are uploaded once per (API key, model) as a Gemini cached content and each request only sends
+    # the image plus the filename/uniqueness line. Entries are dropped (and the remote caches
+    # deleted) when the job ends; the TTL bounds anything left behind by a crash.
+    def __init__(self):
+        self._entries = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def get(self, client, api_key, model):
+        enabled, ttl = get_context_cache_settings()
+        if not enabled:
+            return None
+        static_text = get_prompt_template().static_text
+        if static_text is None:
+            # The prompt outside the uniqueness line changes per request; nothing to cache.
+            return None
+        key = (api_key, model, hashlib.sha1(static_text.encode("utf-8")).hexdigest())
+        with self._key_lock(key):
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.get("unavailable"):
+                    return None
+                if entry["expires_at"] - time.time() > REFRESH_MARGIN_SECONDS:
+                    return entry["name"]
+                try:
+                    client.caches.update(name=entry["name"], config=types.UpdateCachedContentConfig(ttl=f"{ttl}s"))
+                    entry["expires_at"] = time.time() + ttl
+                    return entry["name"]
+                except Exception as e:
+                    print(f"[Gemini Cache] Failed to extend {entry['name']}, creating a new one: {e}")
+                    self._entries.pop(key, None)
+            try:
+                cache = client.caches.create(
+                    model=model,
+                    config=types.CreateCachedContentConfig(
+                        contents=[static_text],
+                        display_name="image-tea-prompt",
+                        ttl=f"{ttl}s"
+                    )
+                )
+            except Exception as e:
+                # Usually the prompt is below the model's minimum cacheable size or the model has no
+                # explicit caching; do not ask again for the rest of the job.
+                print(f"[Gemini Cache] Context caching unavailable for {model}, sending the full prompt: {e}")
+                self._entries[key] = {"unavailable": True}
+                return None
+            self._entries[key] = {"name": cache.name, "client": client, "expires_at": time.time() + ttl}
+            print(f"[Gemini Cache] Cached static prompt for {model} as {cache.name}")
+            return cache.name
+
+    def invalidate(self, api_key, model, name):
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if key[0] == api_key and key[1] == model and entry.get("name") == name:
+                    self._entries.pop(key, None)
+
+    def release(self):
+        with self._lock:
+            entries = [entry for entry in self._entries.values() if entry.get("name")]
+            self._entries.clear()
+            self._locks.clear()
+        for entry in entries:
+            try:
+                entry["client"].caches.delete(name=entry["name"])
+            except Exception as e:
+                print(f"[Gemini Cache] Failed to delete {entry['name']}: {e}")
+
+_prompt_caches = PromptCacheManager()
+
+def get_prompt_cache(client, api_key, model):
+    return _prompt_caches.get(client, api_key, model)
+
+def invalidate_prompt_cache(api_key, model, name):
+    _prompt_caches.invalidate(api_key, model, name)
+
+def release_prompt_caches(background=True):
+    # Deleting is a network round trip per cache, so keep it off the UI thread.
+    if background:
+        threading.Thread(target=_prompt_caches.release, name="gemini-cache-release", daemon=True).start()
+    else:
+        _prompt_caches.release()
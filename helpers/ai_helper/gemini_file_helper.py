@@ -0,0 +1,249 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, CancelledError, InvalidStateError
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import google.genai as genai
+from config import BASE_PATH
+from helpers.payload_cache_helper import get_file_digest
+from helpers.ai_helper.client_registry_helper import get_client
+from helpers.ai_helper.retry_helper import call_with_retry, RetryAborted
+
+REGISTRY_PATH = os.path.join(BASE_PATH, "temp", "gemini_uploaded_files.json")
+# Uploaded files live for 48 hours; do not hand out one that is about to expire mid-request.
+EXPIRY_MARGIN_SECONDS = 15 * 60
+DEFAULT_FILE_TTL_SECONDS = 47 * 60 * 60
+ACTIVATION_POLL_SECONDS = 1.0
+ACTIVATION_TIMEOUT_SECONDS = 600
+UPLOAD_WORKERS = 2
+
+class FileActivationError(Exception):
+    pass
+
+def _file_state(file_info):
+    state = getattr(file_info, 'state', None) or getattr(file_info, 'status', None)
+    return getattr(state, 'name', None) or (str(state) if state is not None else None)
+
+def _file_name(file_info):
+    return file_info.name if hasattr(file_info, 'name') else getattr(file_info, 'id', None)
+
+def _expires_at(file_info):
+    expiration_time = getattr(file_info, 'expiration_time', None)
+    if expiration_time is not None and hasattr(expiration_time, 'timestamp'):
+        return expiration_time.timestamp()
+    return time.time() + DEFAULT_FILE_TTL_SECONDS
+
+class UploadedFileRegistry:
+    # Remote Gemini files by (API key, content hash), persisted so a clip regenerated later,
+    # even after a restart, reuses its upload until it expires. Keys are stored hashed.
+    def __init__(self, path):
+        self.path = path
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _key(self, api_key, digest):
+        key_id = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+        return f"{key_id}:{digest}"
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            self._entries = {}
+        except Exception as e:
+            print(f"[Gemini Files] Failed to load upload registry: {e}")
+            self._entries = {}
+
+    def _save(self):
+        now = time.time()
+        self._entries = {k: v for k, v in self._entries.items() if v.get("expires_at", 0) > now}
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, indent=2)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            print(f"[Gemini Files] Failed to save upload registry: {e}")
+
+    def get(self, api_key, digest):
+        with self._lock:
+            self._load()
+            entry = self._entries.get(self._key(api_key, digest))
+        if entry and entry.get("expires_at", 0) - time.time() > EXPIRY_MARGIN_SECONDS:
+            return entry.get("name")
+        return None
+
+    def put(self, api_key, digest, file_info):
+        with self._lock:
+            self._load()
+            self._entries[self._key(api_key, digest)] = {
+                "name": _file_name(file_info),
+                "expires_at": _expires_at(file_info),
+            }
+            self._save()
+
+    def discard(self, api_key, digest):
+        with self._lock:
+            self._load()
+            if self._entries.pop(self._key(api_key, digest), None) is not None:
+                self._save()
+
+class FileActivationPoller:
+    # One background thread polls every file that is still PROCESSING and resolves the futures
+    # of whoever waits for it, instead of every worker running its own sleep loop.
+    def __init__(self, poll_interval=ACTIVATION_POLL_SECONDS, timeout=ACTIVATION_TIMEOUT_SECONDS):
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def watch(self, client, api_key, name):
+        future = Future()
+        with self._condition:
+            entry = self._pending.get((api_key, name))
+            if entry is None:
+                entry = {"client": client, "futures": [], "deadline": time.monotonic() + self.timeout}
+                self._pending[(api_key, name)] = entry
+            entry["futures"].append(future)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="gemini-file-poller", daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+        return future
+
+    def _resolve(self, key, result=None, error=None):
+        with self._condition:
+            entry = self._pending.pop(key, None)
+        if entry is None:
+            return
+        for future in entry["futures"]:
+            try:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+            except InvalidStateError:
+                # Cancelled by a stopped worker in the meantime.
+                pass
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                items = list(self._pending.items())
+            for key, entry in items:
+                if all(future.cancelled() for future in entry["futures"]):
+                    self._resolve(key)
+                    continue
+                name = key[1]
+                try:
+                    file_info = entry["client"].files.get(name=name)
+                except Exception as e:
+                    print(f"[Gemini Files] Polling {name} failed: {e}")
+                    file_info = None
+                state = _file_state(file_info) if file_info is not None else None
+                if state == 'ACTIVE':
+                    self._resolve(key, result=file_info)
+                elif state == 'FAILED':
+                    self._resolve(key, error=FileActivationError(f"File {name} failed processing, status: {state}"))
+                elif time.monotonic() > entry["deadline"]:
+                    self._resolve(key, error=FileActivationError(f"File {name} not ACTIVE after upload, status: {state}"))
+            with self._condition:
+                if self._pending:
+                    self._condition.wait(self.poll_interval)
+
+_registry = UploadedFileRegistry(REGISTRY_PATH)
+_poller = FileActivationPoller()
+_upload_pool = None
+_upload_pool_lock = threading.Lock()
+
+def _resolved(file_info):
+    future = Future()
+    future.set_result(file_info)
+    return future
+
+def prepare_video_file(client, api_key, video_path, stop_flag=None):
+    # Returns a future that resolves to the ACTIVE remote file. Reuses an earlier upload of the same
+    # content with the same key; otherwise uploads now and lets the poller wait for activation.
+    digest = get_file_digest(video_path)
+    name = _registry.get(api_key, digest)
+    if name:
+        try:
+            file_info = client.files.get(name=name)
+            state = _file_state(file_info)
+            if state == 'ACTIVE':
+                return _resolved(file_info)
+            if state == 'PROCESSING':
+                return _poller.watch(client, api_key, name)
+        except Exception as e:
+            print(f"[Gemini Files] Uploaded file {name} is no longer usable: {e}")
+        _registry.discard(api_key, digest)
+    file_info = call_with_retry(lambda: client.files.upload(file=video_path), stop_flag=stop_flag, label="Gemini", api_key=api_key)
+    _registry.put(api_key, digest, file_info)
+    if _file_state(file_info) == 'ACTIVE':
+        return _resolved(file_info)
+    return _poller.watch(client, api_key, _file_name(file_info))
+
+def wait_for_file(future, stop_flag=None):
+    while True:
+        if stop_flag and stop_flag.get('stop'):
+            future.cancel()
+            raise RetryAborted()
+        try:
+            return future.result(timeout=0.25)
+        except FutureTimeoutError:
+            continue
+        except CancelledError:
+            raise RetryAborted()
+
+def get_active_video_file(client, api_key, video_path, stop_flag=None):
+    return wait_for_file(prepare_video_file(client, api_key, video_path, stop_flag), stop_flag)
+
+def _get_upload_pool():
+    global _upload_pool
+    with _upload_pool_lock:
+        if _upload_pool is None:
+            _upload_pool = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="gemini-upload")
+        return _upload_pool
+
+def start_video_upload(api_key, video_path, stop_flag=None):
+    # Uploads in the background and resolves once the file is ACTIVE, without tying up an API
+    # worker (or any thread) while Gemini processes the video.
+    result = Future()
+
+    def forward(source):
+        try:
+            if source.cancelled():
+                result.cancel()
+            elif source.exception() is not None:
+                result.set_exception(source.exception())
+            else:
+                result.set_result(source.result())
+        except InvalidStateError:
+            pass
+
+    def upload():
+        if result.cancelled():
+            return
+        try:
+            client = get_client("gemini", api_key, lambda: genai.Client(api_key=api_key))
+            source = prepare_video_file(client, api_key, video_path, stop_flag)
+        except BaseException as e:
+            try:
+                result.set_exception(e)
+            except InvalidStateError:
+                pass
+            return
+        result.add_done_callback(lambda _: source.cancel() if result.cancelled() else None)
+        source.add_done_callback(forward)
+
+    _get_upload_pool().submit(upload)
+    return result
@@ -2,11 +2,20 @@ import time
 import os
 import json
 import re
+import base64
 import google.genai as genai
 from google.genai import types
-from config import BASE_PATH
-from helpers.ai_helper.ai_variation_helper import generate_timestamp, generate_token
-from helpers.image_compression_helper import compress_and_save_image
+from helpers.ai_helper.prompt_template_helper import build_prompt, build_group_prompt, build_prompt_suffix, build_group_prompt_suffix
+from helpers.ai_helper.gemini_cache_helper import get_prompt_cache, invalidate_prompt_cache, is_cache_error
+from helpers.ai_helper.group_request_helper import image_label, match_group_results, split_token_usage, unanswered_result
+from helpers.ai_helper.response_schema_helper import get_response_schema, is_schema_error, mark_schema_unsupported
+from helpers.image_compression_helper import get_max_image_dimension
+from helpers.payload_cache_helper import load_payload
+from helpers.ai_helper.rate_limiter_helper import get_rate_limiter
+from helpers.ai_helper.client_registry_helper import get_client
+from helpers.ai_helper.gemini_file_helper import get_active_video_file, FileActivationError
+from helpers.video_keyframe_helper import get_video_mode, extract_keyframes, keyframe_prompt_note
+from helpers.ai_helper.retry_helper import call_with_retry, get_failure_kind, is_truncated_json, RetryAborted, TruncatedResponseError
 
 _generation_times_gemini = []
 
@@ -20,81 +29,6 @@ def track_gemini_generation_time(duration_ms):
     last_time = _generation_times_gemini[-1] if _generation_times_gemini else 0
     return gen_time, avg_time, longest_time, last_time
 
-def load_gemini_prompt_vars():
-    prompt_path = os.path.join(BASE_PATH, "configs", "ai_config.json")
-    with open(prompt_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    prompt_data = data["prompt"]
-    shutterstock_map = data["shutterstock_category_map"]
-    adobe_map = data["adobe_stock_category_map"]
-    return (
-        prompt_data["title_requirements"],
-        prompt_data["description_requirements"],
-        prompt_data["keywords_requirements"],
-        prompt_data["general_guides"],
-        prompt_data["strict_donts"],
-        prompt_data["unique_token"],
-        prompt_data["negative_prompt"],
-        prompt_data["system_prompt"],
-        prompt_data["custom_prompt"],
-        data["min_title_length"],
-        data["max_title_length"],
-        data["max_description_length"],
-        data["required_tag_count"],
-        shutterstock_map,
-        adobe_map
-    )
-
-def format_gemini_prompt(
-    title_requirements,
-    description_requirements,
-    keywords_requirements,
-    general_guides,
-    strict_donts,
-    unique_token,
-    negative_prompt,
-    system_prompt,
-    custom_prompt,
-    min_title_length,
-    max_title_length,
-    max_description_length,
-    required_tag_count,
-    shutterstock_map,
-    adobe_map,
-    filename=None
-):
-    prompt = (
-        "Create high-quality image or video digital assets metadata following these guidelines:\n\n"
-        f"1. Title Requirements:\n{title_requirements}\n\n"
-        f"2. Description Requirements:\n{description_requirements}\n\n"
-        f"3. Keywords Requirements:\n{keywords_requirements}\n\n"
-        f"4. General Guidelines:\n{general_guides}\n\n"
-        f"5. Strict Don'ts:\n{strict_donts}\n\n"
-        f"6. Uniqueness:\n{unique_token}\n"
-    )
-    prompt = prompt.replace("_MIN_LEN_", str(min_title_length))
-    prompt = prompt.replace("_MAX_LEN_", str(max_title_length))
-    prompt = prompt.replace("_MAX_DESC_LEN_", str(max_description_length))
-    prompt = prompt.replace("_TAGS_COUNT_", str(required_tag_count))
-    prompt = prompt.replace("_TIMESTAMP_", generate_timestamp())
-    prompt = prompt.replace("_TOKEN_", generate_token())
-    prompt += (
-        "\n\nShutterstock categories (number:name):\n"
-        "Select TWO relevant categories for Shutterstock: one as PRIMARY (the most relevant), and one as SECONDARY (the next most relevant). Both must be chosen from the list below and must be related to the content.\n"
-        f"{json.dumps(shutterstock_map, indent=2)}\n"
-        "Adobe Stock categories (number:name):\n"
-        f"{json.dumps(adobe_map, indent=2)}\n"
-    )
-    if filename:
-        prompt = f"Filename: {filename}\n{prompt}"
-    if custom_prompt and custom_prompt.strip():
-        prompt = f"{prompt}\n\nMANDATORY: {custom_prompt.strip()}\n"
-    full_prompt = f"{prompt}\n\nNegative Prompt:\n{negative_prompt}\n\n{system_prompt}"
-    # Do not remove
-    # print("Gemini Prompt:")
-    # print(full_prompt)
-    return full_prompt
-
 def title_case_except(text):
     exceptions = {"to", "and", "at", "in", "on", "for", "with", "of", "the", "a", "an", "but", "or", "nor", "so", "yet", "as", "by", "from", "into", "over", "per", "via"}
     words = text.split()
@@ -118,137 +52,282 @@ def sanitize_text(text):
     text = text.strip()
     return text
 
-def generate_metadata_gemini(api_key, model, image_path, prompt=None, stop_flag=None):
-    if stop_flag and stop_flag.get('stop'):
-        return '', '', '', '', 0, 0, 0
-    start_time = time.perf_counter()
-    try:
-        client = genai.Client(api_key=api_key)
-        ext = os.path.splitext(image_path)[1].lower()
-        is_video = ext in ['.mp4', '.mpeg', '.mov', '.avi', '.flv', '.mpg', '.webm', '.wmv', '.3gp', '.3gpp']
-        filename = os.path.basename(image_path)
-        if not prompt:
-            (
-                title_requirements,
-                description_requirements,
-                keywords_requirements,
-                general_guides,
-                strict_donts,
-                unique_token,
-                negative_prompt,
-                system_prompt,
-                custom_prompt,
-                min_title_length,
-                max_title_length,
-                max_description_length,
-                required_tag_count,
-                shutterstock_map,
-                adobe_map
-            ) = load_gemini_prompt_vars()
-            prompt = format_gemini_prompt(
-                title_requirements,
-                description_requirements,
-                keywords_requirements,
-                general_guides,
-                strict_donts,
-                unique_token,
-                negative_prompt,
-                system_prompt,
-                custom_prompt,
-                min_title_length,
-                max_title_length,
-                max_description_length,
-                required_tag_count,
-                shutterstock_map,
-                adobe_map,
-                filename=filename
+def _response_text(response):
+    text = None
+    if hasattr(response, "candidates") and response.candidates:
+        try:
+            text = response.candidates[0].content.parts[0].text
+        except Exception:
+            text = str(response)
+    elif hasattr(response, "text"):
+        text = response.text
+    elif isinstance(response, dict) and 'text' in response:
+        text = response['text']
+    else:
+        text = str(response)
+    return text
+
+def _strip_code_fence(text):
+    if text.strip().startswith('```'):
+        text = text.strip().lstrip('`').lstrip('json').strip()
+        if text.endswith('```'):
+            text = text[:text.rfind('```')].strip()
+    return text
+
+def _request_json(client, api_key, model, contents, stop_flag=None, cache_name=None, schema=None):
+    # Returns (parsed JSON or None, parse error or None, [input, output, total] tokens).
+    # Raises RetryAborted when the job is stopped.
+    limiter = get_rate_limiter("gemini", api_key, model)
+    usage_totals = [0, 0, 0]
+    config_args = {}
+    if cache_name:
+        config_args["cached_content"] = cache_name
+    if schema is not None:
+        config_args["response_mime_type"] = "application/json"
+        config_args["response_json_schema"] = schema
+    config = types.GenerateContentConfig(**config_args) if config_args else None
+
+    def request_metadata():
+        reserved_tokens = limiter.acquire(stop_flag)
+        if reserved_tokens is None:
+            raise RetryAborted()
+        try:
+            response = client.models.generate_content(
+                model=model,
+                contents=contents,
+                config=config
             )
-        if is_video:
-            myfile = client.files.upload(file=image_path)
-            file_id = myfile.name if hasattr(myfile, 'name') else getattr(myfile, 'id', None)
-            status = None
-            max_wait_seconds = 600
-            poll_interval = 1
-            waited = 0
-            while waited < max_wait_seconds:
-                if stop_flag and stop_flag.get('stop'):
-                    return '', '', '', '', 0, 0, 0
-                fileinfo = client.files.get(name=file_id)
-                status = getattr(fileinfo, 'state', None) or getattr(fileinfo, 'status', None)
-                if status == 'ACTIVE':
-                    break
-                time.sleep(poll_interval)
-                waited += poll_interval
-            if status != 'ACTIVE':
-                print(f"[Gemini ERROR] File {file_id} not ACTIVE after upload, status: {status}")
-                return '', '', '', '', 0, 0, 0
-            contents = [myfile, prompt]
-        else:
-            compressed_path = compress_and_save_image(image_path)
-            if not compressed_path:
-                print(f"[Gemini ERROR] Failed to compress image: {image_path}")
-                return '', '', '', '', 0, 0, 0
-            with open(compressed_path, 'rb') as f:
-                image_bytes = f.read()
-            contents = [types.Part.from_bytes(data=image_bytes, mime_type='image/jpeg'), prompt]
-        if stop_flag and stop_flag.get('stop'):
-            return '', '', '', '', 0, 0, 0
-        response = client.models.generate_content(
-            model=model,
-            contents=contents
-        )
+        except Exception:
+            limiter.record_usage(reserved_tokens, 0)
+            raise
         # Do not remove
         # print("Gemini RAW response:")
         # print(response)
-        token_input = 0
-        token_output = 0
-        token_total = 0
         usage = getattr(response, "usage_metadata", None)
+        token_total = 0
         if usage:
-            token_input = getattr(usage, "prompt_token_count", 0)
-            token_output = getattr(usage, "candidates_token_count", 0)
-            token_total = getattr(usage, "total_token_count", 0)
-        text = None
-        if hasattr(response, "candidates") and response.candidates:
-            try:
-                text = response.candidates[0].content.parts[0].text
-            except Exception:
-                text = str(response)
-        elif hasattr(response, "text"):
-            text = response.text
-        elif isinstance(response, dict) and 'text' in response:
-            text = response['text']
-        else:
-            text = str(response)
+            usage_totals[0] += getattr(usage, "prompt_token_count", 0) or 0
+            usage_totals[1] += getattr(usage, "candidates_token_count", 0) or 0
+            token_total = getattr(usage, "total_token_count", 0) or 0
+            usage_totals[2] += token_total
+        limiter.record_usage(reserved_tokens, token_total)
+        text = _response_text(response)
         # Do not remove
         # print("Gemini RAW text:")
         # print(text)
+        if schema is None:
+            # Schema-constrained replies are bare JSON and are parsed as they come.
+            text = _strip_code_fence(text)
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            if is_truncated_json(text, e):
+                raise TruncatedResponseError(f"Truncated response: {e}")
+            raise
+
+    try:
+        return call_with_retry(request_metadata, stop_flag=stop_flag, label="Gemini", api_key=api_key), None, usage_totals
+    except (json.JSONDecodeError, TruncatedResponseError) as e:
+        return None, e, usage_totals
+    except Exception as e:
+        if schema is None or not is_schema_error(e):
+            raise
+        print(f"[Gemini] {model} rejected the response schema, falling back to free-form JSON: {e}")
+        mark_schema_unsupported("gemini", model)
+    return _request_json(client, api_key, model, contents, stop_flag, cache_name)
+
+def _request_with_prompt_cache(client, api_key, model, contents, build_cached, build_full, stop_flag=None, schema=None):
+    # contents ends with the prompt. With a cached static prefix only the per-file part is sent;
+    # if the cache vanished server-side the request is repeated once with the full prompt.
+    cache_name = get_prompt_cache(client, api_key, model)
+    if cache_name:
         try:
-            if text.strip().startswith('```'):
-                text = text.strip().lstrip('`').lstrip('json').strip()
-                if text.endswith('```'):
-                    text = text[:text.rfind('```')].strip()
-            meta = json.loads(text)
-            title = meta.get('title', '')
-            description = meta.get('description', '')
-            tags = ', '.join(meta.get('tags', [])) if isinstance(meta.get('tags'), list) else str(meta.get('tags', ''))
-            tags = tags.lower()
-            category = meta.get('category', {})
+            return _request_json(client, api_key, model, contents + [build_cached()], stop_flag, cache_name, schema)
+        except Exception as e:
+            if not is_cache_error(e):
+                raise
+            print(f"[Gemini Cache] {cache_name} is no longer usable, sending the full prompt: {e}")
+            invalidate_prompt_cache(api_key, model, cache_name)
+    return _request_json(client, api_key, model, contents + [build_full()], stop_flag, schema=schema)
+
+def _metadata_fields(meta):
+    title = meta.get('title', '')
+    description = meta.get('description', '')
+    tags = ', '.join(meta.get('tags', [])) if isinstance(meta.get('tags'), list) else str(meta.get('tags', ''))
+    tags = tags.lower()
+    category = meta.get('category', {})
+    if title:
+        title = title_case_except(title)
+        title = sanitize_text(title)
+    if description:
+        description = sanitize_text(description)
+    return title, description, tags, category
+
+def generate_metadata_gemini(api_key, model, image_path, prompt=None, stop_flag=None, image_bytes=None):
+    if stop_flag and stop_flag.get('stop'):
+        return '', '', '', {}, '', 0, 0, 0, None
+    start_time = time.perf_counter()
+    try:
+        client = get_client("gemini", api_key, lambda: genai.Client(api_key=api_key))
+        ext = os.path.splitext(image_path)[1].lower()
+        is_video = ext in ['.mp4', '.mpeg', '.mov', '.avi', '.flv', '.mpg', '.webm', '.wmv', '.3gp', '.3gpp']
+        filename = os.path.basename(image_path)
+        custom_prompt = prompt
+        prompt_note = ''
+        if is_video and get_video_mode() == "keyframes":
+            # A few downscaled frames instead of the whole clip: no upload and no activation wait.
+            frames = extract_keyframes(image_path)
+            if not frames:
+                error_message = f"[Gemini ERROR] Failed to extract keyframes: {image_path}"
+                print(error_message)
+                return '', '', '', {}, error_message, 0, 0, 0, None
+            contents = [types.Part.from_bytes(data=frame, mime_type='image/jpeg') for frame in frames]
+            prompt_note = keyframe_prompt_note(len(frames))
+        elif is_video:
+            try:
+                myfile = get_active_video_file(client, api_key, image_path, stop_flag)
+            except RetryAborted:
+                return '', '', '', {}, '', 0, 0, 0, None
+            except FileActivationError as e:
+                error_message = f"[Gemini ERROR] {e}"
+                print(error_message)
+                return '', '', '', {}, error_message, 0, 0, 0, None
+            contents = [myfile]
+        else:
+            if image_bytes is None:
+                image_bytes = load_payload(image_path, get_max_image_dimension("gemini"))
+            if not image_bytes:
+                error_message = f"[Gemini ERROR] Failed to compress image: {image_path}"
+                print(error_message)
+                return '', '', '', {}, error_message, 0, 0, 0, None
+            contents = [types.Part.from_bytes(data=image_bytes, mime_type='image/jpeg')]
+        if stop_flag and stop_flag.get('stop'):
+            return '', '', '', {}, '', 0, 0, 0, None
+        try:
+            if custom_prompt:
+                meta, parse_error, usage_totals = _request_json(
+                    client, api_key, model, contents + [prompt_note + custom_prompt], stop_flag,
+                    schema=get_response_schema("gemini", model)
+                )
+            else:
+                # Do not remove
+                # print("Gemini Prompt:")
+                # print(build_prompt(filename))
+                meta, parse_error, usage_totals = _request_with_prompt_cache(
+                    client, api_key, model, contents,
+                    lambda: prompt_note + build_prompt_suffix(filename),
+                    lambda: prompt_note + build_prompt(filename),
+                    stop_flag,
+                    get_response_schema("gemini", model)
+                )
+        except RetryAborted:
+            return '', '', '', {}, '', 0, 0, 0, None
+        token_input, token_output, token_total = usage_totals
+        try:
+            if parse_error is not None:
+                raise parse_error
+            title, description, tags, category = _metadata_fields(meta)
             error_message = ''
         except Exception as e:
             print(f"[Gemini JSON PARSE ERROR] {e}")
             title = description = tags = ''
             category = {}
             error_message = f"[Gemini JSON PARSE ERROR] {e}"
-        if title:
-            title = title_case_except(title)
-            title = sanitize_text(title)
-        if description:
-            description = sanitize_text(description)
-        return title, description, tags, category, error_message, token_input, token_output, token_total
+        return title, description, tags, category, error_message, token_input, token_output, token_total, None
     except Exception as e:
         print(f"[Gemini ERROR] {e}")
-        return '', '', '', {}, f"[Gemini ERROR] {e}", 0, 0, 0
+        return '', '', '', {}, f"[Gemini ERROR] {e}", 0, 0, 0, get_failure_kind(e)
     finally:
         duration_ms = int((time.perf_counter() - start_time) * 1000)
-        track_gemini_generation_time(duration_ms)
\ No newline at end of file
+        track_gemini_generation_time(duration_ms)
+
+def generate_metadata_gemini_group(api_key, model, image_paths, stop_flag=None, payloads=None):
+    # Several still images in one request so the long shared prompt is paid for once. Returns one
+    # result tuple per path; an image the response did not answer gets an unanswered_result (the
+    # caller records its tokens and retries it on its own).
+    empty = ('', '', '', {}, '', 0, 0, 0, None)
+    if stop_flag and stop_flag.get('stop'):
+        return [empty for _ in image_paths]
+    try:
+        client = get_client("gemini", api_key, lambda: genai.Client(api_key=api_key))
+        payloads = payloads or [None] * len(image_paths)
+        results = [None] * len(image_paths)
+        included = []
+        contents = []
+        for index, (image_path, image_bytes) in enumerate(zip(image_paths, payloads)):
+            if image_bytes is None:
+                image_bytes = load_payload(image_path, get_max_image_dimension("gemini"))
+            if not image_bytes:
+                error_message = f"[Gemini ERROR] Failed to compress image: {image_path}"
+                print(error_message)
+                results[index] = ('', '', '', {}, error_message, 0, 0, 0, None)
+                continue
+            contents.append(image_label(len(included), os.path.basename(image_path)))
+            contents.append(types.Part.from_bytes(data=image_bytes, mime_type='image/jpeg'))
+            included.append(index)
+        if not included:
+            return results
+        filenames = [os.path.basename(image_paths[index]) for index in included]
+        if stop_flag and stop_flag.get('stop'):
+            return [empty for _ in image_paths]
+        try:
+            meta, parse_error, usage_totals = _request_with_prompt_cache(
+                client, api_key, model, contents,
+                lambda: build_group_prompt_suffix(filenames),
+                lambda: build_group_prompt(filenames),
+                stop_flag,
+                get_response_schema("gemini", model, len(filenames))
+            )
+        except RetryAborted:
+            return [empty for _ in image_paths]
+        if parse_error is not None:
+            print(f"[Gemini JSON PARSE ERROR] Grouped response for {len(included)} images: {parse_error}")
+            matched = [None] * len(filenames)
+        else:
+            matched = match_group_results(meta, filenames)
+        for position, share in enumerate(split_token_usage(usage_totals, len(included))):
+            if matched[position] is None:
+                results[included[position]] = unanswered_result(share)
+                continue
+            try:
+                title, description, tags, category = _metadata_fields(matched[position])
+                error_message = ''
+            except Exception as e:
+                print(f"[Gemini JSON PARSE ERROR] {e}")
+                title = description = tags = ''
+                category = {}
+                error_message = f"[Gemini JSON PARSE ERROR] {e}"
+            results[included[position]] = (title, description, tags, category, error_message) + tuple(share) + (None,)
+        return results
+    except Exception as e:
+        print(f"[Gemini ERROR] {e}")
+        error_message = f"[Gemini ERROR] {e}"
+        failure_kind = get_failure_kind(e)
+        return [('', '', '', {}, error_message, 0, 0, 0, failure_kind) for _ in image_paths]
+
+def build_batch_request(images, prompt, schema=None):
+    # One GenerateContentRequest for a batch job payload line, in the REST JSON form.
+    parts = [{"inline_data": {"mime_type": "image/jpeg", "data": base64.b64encode(data).decode("ascii")}} for data in images]
+    parts.append({"text": prompt})
+    request = {"contents": [{"role": "user", "parts": parts}]}
+    if schema is not None:
+        request["generation_config"] = {"response_mime_type": "application/json", "response_json_schema": schema}
+    return request
+
+def parse_batch_response(response):
+    # generate_metadata_gemini's result without the failure kind, from one GenerateContentResponse of a batch job.
+    usage = response.get("usageMetadata") or response.get("usage_metadata") or {}
+    token_input = usage.get("promptTokenCount", usage.get("prompt_token_count", 0)) or 0
+    token_output = usage.get("candidatesTokenCount", usage.get("candidates_token_count", 0)) or 0
+    token_total = usage.get("totalTokenCount", usage.get("total_token_count", 0)) or 0
+    try:
+        parts = response["candidates"][0]["content"]["parts"]
+        text = next(part["text"] for part in parts if "text" in part and not part.get("thought"))
+        meta = json.loads(_strip_code_fence(text))
+        title, description, tags, category = _metadata_fields(meta)
+        error_message = ''
+    except Exception as e:
+        title = description = tags = ''
+        category = {}
+        error_message = f"[Gemini JSON PARSE ERROR] {e}"
+    return title, description, tags, category, error_message, token_input, token_output, token_total
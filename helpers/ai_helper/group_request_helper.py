@@ -0,0 +1,56 @@
+import os
+from helpers.config_cache_helper import load_ai_config
+
+MAX_IMAGES_PER_REQUEST = 10
+
+def get_images_per_request():
+    config_json = load_ai_config()
+    return min(max(int(config_json.get("images_per_request", 1)), 1), MAX_IMAGES_PER_REQUEST)
+
+def image_label(index, filename):
+    return f"Image {index + 1}: {filename}"
+
+def _result_items(meta):
+    if isinstance(meta, list):
+        return meta
+    if isinstance(meta, dict):
+        for key in ("results", "images", "items", "metadata"):
+            if isinstance(meta.get(key), list):
+                return meta[key]
+        # Also accept an object keyed by filename.
+        if meta and all(isinstance(value, dict) for value in meta.values()):
+            return [dict(value, filename=name) for name, value in meta.items()]
+    return []
+
+def match_group_results(meta, filenames):
+    # Maps the items of a grouped response back to the requested images, by filename first and
+    # by position for items that lost or mangled their filename. Unanswered images map to None.
+    items = [item for item in _result_items(meta) if isinstance(item, dict)]
+    lookup = {name.lower(): index for index, name in enumerate(filenames)}
+    matched = [None] * len(filenames)
+    unmatched = []
+    for item in items:
+        name = os.path.basename(str(item.get("filename", "")).strip()).lower()
+        index = lookup.get(name)
+        if index is not None and matched[index] is None:
+            matched[index] = item
+        else:
+            unmatched.append(item)
+    if unmatched and len(items) == len(filenames):
+        free = [index for index, item in enumerate(matched) if item is None]
+        for index, item in zip(free, unmatched):
+            matched[index] = item
+    return matched
+
+def split_token_usage(usage_totals, count):
+    # The request is billed once; spread it over the images it was sent for so per-file stats still add up.
+    shares = []
+    for total in usage_totals:
+        base, remainder = divmod(int(total or 0), max(count, 1))
+        shares.append([base + (1 if index < remainder else 0) for index in range(count)])
+    return list(zip(*shares)) if count else []
+
+def unanswered_result(share):
+    # An image the grouped response did not answer: no metadata (a title of None, so the caller sends
+    # it again on its own), but still its share of the tokens the grouped request was billed.
+    return (None, '', '', {}, '') + tuple(share) + (None,)
@@ -4,9 +4,15 @@ import base64
 import time
 import re
 from openai import OpenAI
-from config import BASE_PATH
-from helpers.ai_helper.ai_variation_helper import generate_timestamp, generate_token
-from helpers.image_compression_helper import compress_and_save_image
+from helpers.ai_helper.prompt_template_helper import build_prompt, build_group_prompt
+from helpers.ai_helper.group_request_helper import image_label, match_group_results, split_token_usage, unanswered_result
+from helpers.ai_helper.response_schema_helper import get_response_schema, is_schema_error, mark_schema_unsupported
+from helpers.image_compression_helper import get_max_image_dimension
+from helpers.payload_cache_helper import load_payload
+from helpers.video_keyframe_helper import extract_keyframes, keyframe_prompt_note
+from helpers.ai_helper.rate_limiter_helper import get_rate_limiter
+from helpers.ai_helper.client_registry_helper import get_client
+from helpers.ai_helper.retry_helper import call_with_retry, get_failure_kind, is_truncated_json, RetryAborted, TruncatedResponseError
 
 _generation_times_openai = []
 
@@ -20,81 +26,6 @@ def track_openai_generation_time(duration_ms):
     last_time = _generation_times_openai[-1] if _generation_times_openai else 0
     return gen_time, avg_time, longest_time, last_time
 
-def load_openai_prompt_vars():
-    prompt_path = os.path.join(BASE_PATH, "configs", "ai_config.json")
-    with open(prompt_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    prompt_data = data["prompt"]
-    shutterstock_map = data["shutterstock_category_map"]
-    adobe_map = data["adobe_stock_category_map"]
-    return (
-        prompt_data["title_requirements"],
-        prompt_data["description_requirements"],
-        prompt_data["keywords_requirements"],
-        prompt_data["general_guides"],
-        prompt_data["strict_donts"],
-        prompt_data["unique_token"],
-        prompt_data["negative_prompt"],
-        prompt_data["system_prompt"],
-        prompt_data["custom_prompt"],
-        data["min_title_length"],
-        data["max_title_length"],
-        data["max_description_length"],
-        data["required_tag_count"],
-        shutterstock_map,
-        adobe_map
-    )
-
-def format_openai_prompt(
-    title_requirements,
-    description_requirements,
-    keywords_requirements,
-    general_guides,
-    strict_donts,
-    unique_token,
-    negative_prompt,
-    system_prompt,
-    custom_prompt,
-    min_title_length,
-    max_title_length,
-    max_description_length,
-    required_tag_count,
-    shutterstock_map,
-    adobe_map,
-    filename=None
-):
-    prompt = (
-        "Create high-quality image or video digital assets metadata following these guidelines:\n\n"
-        f"1. Title Requirements:\n{title_requirements}\n\n"
-        f"2. Description Requirements:\n{description_requirements}\n\n"
-        f"3. Keywords Requirements:\n{keywords_requirements}\n\n"
-        f"4. General Guidelines:\n{general_guides}\n\n"
-        f"5. Strict Don'ts:\n{strict_donts}\n\n"
-        f"6. Uniqueness:\n{unique_token}\n"
-    )
-    prompt = prompt.replace("_MIN_LEN_", str(min_title_length))
-    prompt = prompt.replace("_MAX_LEN_", str(max_title_length))
-    prompt = prompt.replace("_MAX_DESC_LEN_", str(max_description_length))
-    prompt = prompt.replace("_TAGS_COUNT_", str(required_tag_count))
-    prompt = prompt.replace("_TIMESTAMP_", generate_timestamp())
-    prompt = prompt.replace("_TOKEN_", generate_token())
-    prompt += (
-        "\n\nShutterstock categories (number:name):\n"
-        "Select TWO relevant categories for Shutterstock: one as PRIMARY (the most relevant), and one as SECONDARY (the next most relevant). Both must be chosen from the list below and must be related to the content.\n"
-        f"{json.dumps(shutterstock_map, indent=2)}\n"
-        "Adobe Stock categories (number:name):\n"
-        f"{json.dumps(adobe_map, indent=2)}\n"
-    )
-    if filename:
-        prompt = f"Filename: {filename}\n{prompt}"
-    if custom_prompt and custom_prompt.strip():
-        prompt = f"{prompt}\n\nMANDATORY: {custom_prompt.strip()}\n"
-    full_prompt = f"{prompt}\n\nNegative Prompt:\n{negative_prompt}\n\n{system_prompt}"
-    # Do not remove
-    # print("OpenAI Prompt:")
-    # print(full_prompt)
-    return full_prompt
-
 def title_case_except(text):
     exceptions = {"to", "and", "at", "in", "on", "for", "with", "of", "the", "a", "an", "but", "or", "nor", "so", "yet", "as", "by", "from", "into", "over", "per", "via"}
     words = text.split()
@@ -118,136 +49,262 @@ def sanitize_text(text):
     text = text.strip()
     return text
 
-def generate_metadata_openai(api_key, model, image_path, prompt=None, stop_flag=None):
+def _response_text(response):
+    text = None
+    if hasattr(response, "output") and response.output:
+        for msg in response.output:
+            if hasattr(msg, "content") and msg.content:
+                for part in msg.content:
+                    if hasattr(part, "text"):
+                        text = part.text
+                        break
+                if text:
+                    break
+    if not text:
+        text = getattr(response, "output_text", None)
+    if not text:
+        text = str(response)
+    return text
+
+def _image_content(image_bytes):
+    image_b64 = base64.b64encode(image_bytes).decode("utf-8")
+    return {"type": "input_image", "image_url": f"data:image/jpeg;base64,{image_b64}"}
+
+def _text_format(schema):
+    return {"format": {"type": "json_schema", "name": "image_metadata", "schema": schema, "strict": True}}
+
+def _strip_code_fence(text):
+    if text.strip().startswith('```'):
+        text = text.strip().lstrip('`').lstrip('json').strip()
+        if text.endswith('```'):
+            text = text[:text.rfind('```')].strip()
+    return text
+
+def _request_json(client, api_key, model, messages, stop_flag=None, schema=None):
+    # Returns (parsed JSON or None, parse error or None, [input, output, total] tokens).
+    # Raises RetryAborted when the job is stopped.
+    limiter = get_rate_limiter("openai", api_key, model)
+    usage_totals = [0, 0, 0]
+    request_args = {"text": _text_format(schema)} if schema is not None else {}
+
+    def request_metadata():
+        reserved_tokens = limiter.acquire(stop_flag)
+        if reserved_tokens is None:
+            raise RetryAborted()
+        try:
+            response = client.responses.create(
+                model=model,
+                input=messages,
+                **request_args
+            )
+        except Exception:
+            limiter.record_usage(reserved_tokens, 0)
+            raise
+        # Do not remove
+        # print("OpenAI RAW response:")
+        # print(response)
+        usage = getattr(response, "usage", None)
+        token_total = 0
+        if usage:
+            usage_totals[0] += getattr(usage, "input_tokens", 0) or 0
+            usage_totals[1] += getattr(usage, "output_tokens", 0) or 0
+            token_total = getattr(usage, "total_tokens", 0) or 0
+            usage_totals[2] += token_total
+        limiter.record_usage(reserved_tokens, token_total)
+        text = _response_text(response)
+        # Do not remove
+        # print("OpenAI RAW text:")
+        # print(text)
+        if schema is None:
+            # Schema-constrained replies are bare JSON and are parsed as they come.
+            text = _strip_code_fence(text)
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            if is_truncated_json(text, e):
+                raise TruncatedResponseError(f"Truncated response: {e}")
+            raise
+
+    try:
+        return call_with_retry(request_metadata, stop_flag=stop_flag, label="OpenAI", api_key=api_key), None, usage_totals
+    except (json.JSONDecodeError, TruncatedResponseError) as e:
+        return None, e, usage_totals
+    except Exception as e:
+        if schema is None or not is_schema_error(e):
+            raise
+        print(f"[OpenAI] {model} rejected the response schema, falling back to free-form JSON: {e}")
+        mark_schema_unsupported("openai", model)
+    return _request_json(client, api_key, model, messages, stop_flag)
+
+def _metadata_fields(meta):
+    title = meta.get('title', '')
+    description = meta.get('description', '')
+    tags = ', '.join(meta.get('tags', [])) if isinstance(meta.get('tags'), list) else str(meta.get('tags', ''))
+    tags = tags.lower()
+    category = meta.get('category', {})
+    if title:
+        title = title_case_except(title)
+        title = sanitize_text(title)
+    if description:
+        description = sanitize_text(description)
+    return title, description, tags, category
+
+def generate_metadata_openai(api_key, model, image_path, prompt=None, stop_flag=None, image_bytes=None):
     if stop_flag and stop_flag.get('stop'):
-        return '', '', '', {}, '', 0, 0, 0
+        return '', '', '', {}, '', 0, 0, 0, None
     start_time = time.perf_counter()
     try:
         ext = os.path.splitext(image_path)[1].lower()
         is_video = ext in ['.mp4', '.mpeg', '.mov', '.avi', '.flv', '.mpg', '.webm', '.wmv', '.3gp', '.3gpp']
         filename = os.path.basename(image_path)
-        if is_video:
-            error_message = (
-                "OpenAI Vision API belum mendukung input video secara langsung. "
-                "Silakan gunakan gambar atau pilih layanan Gemini untuk video. "
-                "Jika di masa depan OpenAI sudah mendukung video, fitur ini akan segera ditambahkan."
-            )
-            return '', '', '', {}, error_message, 0, 0, 0
-        client = OpenAI(api_key=api_key)
+        client = get_client("openai", api_key, lambda: OpenAI(api_key=api_key, max_retries=0))
         if not prompt:
-            (
-                title_requirements,
-                description_requirements,
-                keywords_requirements,
-                general_guides,
-                strict_donts,
-                unique_token,
-                negative_prompt,
-                system_prompt,
-                custom_prompt,
-                min_title_length,
-                max_title_length,
-                max_description_length,
-                required_tag_count,
-                shutterstock_map,
-                adobe_map
-            ) = load_openai_prompt_vars()
-            prompt = format_openai_prompt(
-                title_requirements,
-                description_requirements,
-                keywords_requirements,
-                general_guides,
-                strict_donts,
-                unique_token,
-                negative_prompt,
-                system_prompt,
-                custom_prompt,
-                min_title_length,
-                max_title_length,
-                max_description_length,
-                required_tag_count,
-                shutterstock_map,
-                adobe_map,
-                filename=filename
-            )
-        compressed_path = compress_and_save_image(image_path)
-        if not compressed_path:
-            error_message = f"[OpenAI ERROR] Failed to compress image: {image_path}"
-            return '', '', '', {}, error_message, 0, 0, 0
-        with open(compressed_path, "rb") as f:
-            image_bytes = f.read()
-        image_b64 = base64.b64encode(image_bytes).decode("utf-8")
-        image_data_url = f"data:image/jpeg;base64,{image_b64}"
+            prompt = build_prompt(filename)
+            # Do not remove
+            # print("OpenAI Prompt:")
+            # print(prompt)
+        if is_video:
+            # The Responses API takes no video input, so videos are always sent as sampled keyframes.
+            frames = extract_keyframes(image_path)
+            if not frames:
+                error_message = f"[OpenAI ERROR] Failed to extract keyframes: {image_path}"
+                return '', '', '', {}, error_message, 0, 0, 0, None
+            prompt = keyframe_prompt_note(len(frames)) + prompt
+        else:
+            if image_bytes is None:
+                image_bytes = load_payload(image_path, get_max_image_dimension("openai"))
+            if not image_bytes:
+                error_message = f"[OpenAI ERROR] Failed to compress image: {image_path}"
+                return '', '', '', {}, error_message, 0, 0, 0, None
+            frames = [image_bytes]
+        content = [{"type": "input_text", "text": prompt}]
+        content.extend(_image_content(frame) for frame in frames)
         messages = [
             {
                 "role": "user",
-                "content": [
-                    {"type": "input_text", "text": prompt},
-                    {"type": "input_image", "image_url": image_data_url}
-                ]
+                "content": content
             }
         ]
         if stop_flag and stop_flag.get('stop'):
-            return '', '', '', {}, '', 0, 0, 0
-        response = client.responses.create(
-            model=model,
-            input=messages
-        )
-        # Do not remove
-        # print("OpenAI RAW response:")
-        # print(response)
-        token_input = 0
-        token_output = 0
-        token_total = 0
-        usage = getattr(response, "usage", None)
-        if usage:
-            token_input = getattr(usage, "input_tokens", 0)
-            token_output = getattr(usage, "output_tokens", 0)
-            token_total = getattr(usage, "total_tokens", 0)
-        text = None
-        if hasattr(response, "output") and response.output:
-            for msg in response.output:
-                if hasattr(msg, "content") and msg.content:
-                    for part in msg.content:
-                        if hasattr(part, "text"):
-                            text = part.text
-                            break
-                    if text:
-                        break
-        if not text:
-            text = getattr(response, "output_text", None)
-        if not text:
-            text = str(response)
-        # Do not remove
-        # print("OpenAI RAW text:")
-        # print(text)
+            return '', '', '', {}, '', 0, 0, 0, None
+        try:
+            meta, parse_error, usage_totals = _request_json(client, api_key, model, messages, stop_flag, get_response_schema("openai", model))
+        except RetryAborted:
+            return '', '', '', {}, '', 0, 0, 0, None
+        token_input, token_output, token_total = usage_totals
         try:
-            if text.strip().startswith('```'):
-                text = text.strip().lstrip('`').lstrip('json').strip()
-                if text.endswith('```'):
-                    text = text[:text.rfind('```')].strip()
-            meta = json.loads(text)
-            title = meta.get('title', '')
-            description = meta.get('description', '')
-            tags = ', '.join(meta.get('tags', [])) if isinstance(meta.get('tags'), list) else str(meta.get('tags', ''))
-            tags = tags.lower()
-            category = meta.get('category', {})
+            if parse_error is not None:
+                raise parse_error
+            title, description, tags, category = _metadata_fields(meta)
             error_message = ''
         except Exception as e:
             print(f"[OpenAI JSON PARSE ERROR] {e}")
             title = description = tags = ''
             category = {}
             error_message = f"[OpenAI JSON PARSE ERROR] {e}"
-        if title:
-            title = title_case_except(title)
-            title = sanitize_text(title)
-        if description:
-            description = sanitize_text(description)
-        return title, description, tags, category, error_message, token_input, token_output, token_total
+        return title, description, tags, category, error_message, token_input, token_output, token_total, None
     except Exception as e:
         error_message = f"[OpenAI ERROR] {e}"
         print(error_message)
-        return '', '', '', {}, error_message, 0, 0, 0
+        return '', '', '', {}, error_message, 0, 0, 0, get_failure_kind(e)
     finally:
         duration_ms = int((time.perf_counter() - start_time) * 1000)
-        track_openai_generation_time(duration_ms)
\ No newline at end of file
+        track_openai_generation_time(duration_ms)
+
+def generate_metadata_openai_group(api_key, model, image_paths, stop_flag=None, payloads=None):
+    # Several still images in one request so the long shared prompt is paid for once. Returns one
+    # result tuple per path; an image the response did not answer gets an unanswered_result (the
+    # caller records its tokens and retries it on its own).
+    empty = ('', '', '', {}, '', 0, 0, 0, None)
+    if stop_flag and stop_flag.get('stop'):
+        return [empty for _ in image_paths]
+    try:
+        client = get_client("openai", api_key, lambda: OpenAI(api_key=api_key, max_retries=0))
+        payloads = payloads or [None] * len(image_paths)
+        results = [None] * len(image_paths)
+        included = []
+        image_content = []
+        for index, (image_path, image_bytes) in enumerate(zip(image_paths, payloads)):
+            if image_bytes is None:
+                image_bytes = load_payload(image_path, get_max_image_dimension("openai"))
+            if not image_bytes:
+                results[index] = ('', '', '', {}, f"[OpenAI ERROR] Failed to compress image: {image_path}", 0, 0, 0, None)
+                continue
+            image_content.append({"type": "input_text", "text": image_label(len(included), os.path.basename(image_path))})
+            image_content.append(_image_content(image_bytes))
+            included.append(index)
+        if not included:
+            return results
+        filenames = [os.path.basename(image_paths[index]) for index in included]
+        messages = [
+            {
+                "role": "user",
+                "content": [{"type": "input_text", "text": build_group_prompt(filenames)}] + image_content
+            }
+        ]
+        if stop_flag and stop_flag.get('stop'):
+            return [empty for _ in image_paths]
+        try:
+            meta, parse_error, usage_totals = _request_json(
+                client, api_key, model, messages, stop_flag, get_response_schema("openai", model, len(filenames))
+            )
+        except RetryAborted:
+            return [empty for _ in image_paths]
+        if parse_error is not None:
+            print(f"[OpenAI JSON PARSE ERROR] Grouped response for {len(included)} images: {parse_error}")
+            matched = [None] * len(filenames)
+        else:
+            matched = match_group_results(meta, filenames)
+        for position, share in enumerate(split_token_usage(usage_totals, len(included))):
+            if matched[position] is None:
+                results[included[position]] = unanswered_result(share)
+                continue
+            try:
+                title, description, tags, category = _metadata_fields(matched[position])
+                error_message = ''
+            except Exception as e:
+                print(f"[OpenAI JSON PARSE ERROR] {e}")
+                title = description = tags = ''
+                category = {}
+                error_message = f"[OpenAI JSON PARSE ERROR] {e}"
+            results[included[position]] = (title, description, tags, category, error_message) + tuple(share) + (None,)
+        return results
+    except Exception as e:
+        error_message = f"[OpenAI ERROR] {e}"
+        print(error_message)
+        failure_kind = get_failure_kind(e)
+        return [('', '', '', {}, error_message, 0, 0, 0, failure_kind) for _ in image_paths]
+
+def build_batch_request(model, images, prompt, schema=None):
+    # The body of one /v1/responses call in a batch job payload.
+    content = [{"type": "input_text", "text": prompt}]
+    content.extend(_image_content(data) for data in images)
+    body = {"model": model, "input": [{"role": "user", "content": content}]}
+    if schema is not None:
+        body["text"] = _text_format(schema)
+    return body
+
+def parse_batch_response(body):
+    # generate_metadata_openai's result without the failure kind, from one Responses API body of a batch job.
+    usage = body.get("usage") or {}
+    token_input = usage.get("input_tokens", 0) or 0
+    token_output = usage.get("output_tokens", 0) or 0
+    token_total = usage.get("total_tokens", 0) or 0
+    try:
+        text = None
+        for item in body.get("output") or []:
+            for part in item.get("content") or []:
+                if part.get("text"):
+                    text = part["text"]
+                    break
+            if text:
+                break
+        text = text or body.get("output_text")
+        meta = json.loads(_strip_code_fence(text))
+        title, description, tags, category = _metadata_fields(meta)
+        error_message = ''
+    except Exception as e:
+        title = description = tags = ''
+        category = {}
+        error_message = f"[OpenAI JSON PARSE ERROR] {e}"
+    return title, description, tags, category, error_message, token_input, token_output, token_total
@@ -0,0 +1,115 @@
+import json
+import threading
+from helpers.config_cache_helper import load_ai_config
+from helpers.ai_helper.ai_variation_helper import generate_timestamp, generate_token
+
+VARIATION_PLACEHOLDERS = ("_TIMESTAMP_", "_TOKEN_")
+
+class PromptTemplate:
+    # Everything that only depends on ai_config.json (requirement sections, length placeholders,
+    # category maps, custom/negative/system prompt) is rendered once; render() only fills the
+    # per-file filename and the _TIMESTAMP_/_TOKEN_ slots, wherever in the prompt they appear.
+    def __init__(self, config):
+        prompt_data = config["prompt"]
+        head = (
+            "Create high-quality image or video digital assets metadata following these guidelines:\n\n"
+            f"1. Title Requirements:\n{prompt_data['title_requirements']}\n\n"
+            f"2. Description Requirements:\n{prompt_data['description_requirements']}\n\n"
+            f"3. Keywords Requirements:\n{prompt_data['keywords_requirements']}\n\n"
+            f"4. General Guidelines:\n{prompt_data['general_guides']}\n\n"
+            f"5. Strict Don'ts:\n{prompt_data['strict_donts']}\n\n"
+        )
+        uniqueness = f"6. Uniqueness:\n{prompt_data['unique_token']}\n"
+        tail = (
+            "\n\nShutterstock categories (number:name):\n"
+            "Select TWO relevant categories for Shutterstock: one as PRIMARY (the most relevant), and one as SECONDARY (the next most relevant). Both must be chosen from the list below and must be related to the content.\n"
+            f"{json.dumps(config['shutterstock_category_map'], indent=2)}\n"
+            "Adobe Stock categories (number:name):\n"
+            f"{json.dumps(config['adobe_stock_category_map'], indent=2)}\n"
+        )
+        custom_prompt = prompt_data["custom_prompt"]
+        if custom_prompt and custom_prompt.strip():
+            tail = f"{tail}\n\nMANDATORY: {custom_prompt.strip()}\n"
+        tail = f"{tail}\n\nNegative Prompt:\n{prompt_data['negative_prompt']}\n\n{prompt_data['system_prompt']}"
+        for placeholder, key in (("_MIN_LEN_", "min_title_length"), ("_MAX_LEN_", "max_title_length"),
+                                 ("_MAX_DESC_LEN_", "max_description_length"), ("_TAGS_COUNT_", "required_tag_count")):
+            head = head.replace(placeholder, str(config[key]))
+            uniqueness = uniqueness.replace(placeholder, str(config[key]))
+            tail = tail.replace(placeholder, str(config[key]))
+        self.guidelines = head
+        self.uniqueness = uniqueness
+        self.tail = tail
+        self.placeholders = [placeholder for placeholder in VARIATION_PLACEHOLDERS if placeholder in head + uniqueness + tail]
+        # Everything except the filename and the uniqueness line; identical for every file of a job,
+        # so it can be cached server-side (Gemini context caching) and sent only once. None when a
+        # _TIMESTAMP_/_TOKEN_ outside the uniqueness line makes it differ per request.
+        static_text = f"{self.guidelines}{self.tail}"
+        varies = any(placeholder in static_text for placeholder in VARIATION_PLACEHOLDERS)
+        self.static_text = None if varies else static_text
+
+    def _variation(self):
+        # One value per placeholder and request, shared by every section that uses it.
+        values = {"_TIMESTAMP_": generate_timestamp, "_TOKEN_": generate_token}
+        return {placeholder: values[placeholder]() for placeholder in self.placeholders}
+
+    def _fill(self, text, variation):
+        for placeholder, value in variation.items():
+            text = text.replace(placeholder, value)
+        return text
+
+    def render(self, filename=None):
+        variation = self._variation()
+        prompt = self._fill(f"{self.guidelines}{self.uniqueness}{self.tail}", variation)
+        if filename:
+            return f"Filename: {filename}\n{prompt}"
+        return prompt
+
+    def render_dynamic(self, filename=None):
+        # The per-file remainder of render() when static_text is already part of the request.
+        uniqueness = self._fill(self.uniqueness, self._variation())
+        if filename:
+            return f"Filename: {filename}\n{uniqueness}"
+        return uniqueness
+
+    def _group_listing(self, filenames):
+        listing = "\n".join(f"Image {index + 1}: {name}" for index, name in enumerate(filenames))
+        return f"This request contains {len(filenames)} images, in this order:\n{listing}\n\n"
+
+    def _group_instruction(self, count):
+        return (
+            f"MULTIPLE IMAGES: apply every rule above to each image independently. Respond with a JSON array "
+            f"containing exactly {count} objects, one per image and in the same order. Each object has a "
+            "\"filename\" field with the image's filename exactly as listed above, plus all fields of the response format above.\n"
+        )
+
+    def render_group(self, filenames):
+        return f"{self._group_listing(filenames)}{self.render()}\n{self._group_instruction(len(filenames))}"
+
+    def render_group_dynamic(self, filenames):
+        return f"{self._group_listing(filenames)}{self._fill(self.uniqueness, self._variation())}\n{self._group_instruction(len(filenames))}"
+
+_prompt_template = None
+_prompt_template_source = None
+_prompt_template_lock = threading.Lock()
+
+def get_prompt_template():
+    global _prompt_template, _prompt_template_source
+    config = load_ai_config()
+    with _prompt_template_lock:
+        # The config cache hands out a new dict whenever ai_config.json changes on disk.
+        if _prompt_template is None or _prompt_template_source is not config:
+            _prompt_template = PromptTemplate(config)
+            _prompt_template_source = config
+        return _prompt_template
+
+def build_prompt(filename=None):
+    return get_prompt_template().render(filename)
+
+def build_group_prompt(filenames):
+    return get_prompt_template().render_group(filenames)
+
+def build_prompt_suffix(filename=None):
+    return get_prompt_template().render_dynamic(filename)
+
+def build_group_prompt_suffix(filenames):
+    return get_prompt_template().render_group_dynamic(filenames)
@@ -0,0 +1,130 @@
+import time
+import threading
+from helpers.config_cache_helper import load_ai_config
+
+DEFAULT_ESTIMATED_TOKENS = 3000
+
+class TokenBucket:
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def refill(self, now):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+            self.updated_at = now
+
+    def wait_time(self, amount):
+        # A single request larger than the whole bucket is allowed once the bucket is full,
+        # otherwise it could never be sent.
+        needed = min(float(amount), self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.refill_per_second
+
+class RateLimiter:
+    # RPM and TPM buckets for one (service, api_key, model). A limit of 0 disables that bucket.
+    def __init__(self, rpm=0, tpm=0, estimated_tokens=DEFAULT_ESTIMATED_TOKENS):
+        self.rpm = int(rpm or 0)
+        self.tpm = int(tpm or 0)
+        self.request_bucket = TokenBucket(self.rpm, self.rpm / 60.0) if self.rpm > 0 else None
+        self.token_bucket = TokenBucket(self.tpm, self.tpm / 60.0) if self.tpm > 0 else None
+        self.estimated_tokens = float(estimated_tokens)
+        self._condition = threading.Condition()
+
+    def set_limits(self, rpm, tpm):
+        # Keeps the current fill level so changing a limit between jobs cannot be used to burst.
+        with self._condition:
+            rpm = int(rpm or 0)
+            tpm = int(tpm or 0)
+            if rpm != self.rpm:
+                old_tokens = self.request_bucket.tokens if self.request_bucket is not None else rpm
+                self.request_bucket = TokenBucket(rpm, rpm / 60.0) if rpm > 0 else None
+                if self.request_bucket is not None:
+                    self.request_bucket.tokens = min(float(rpm), old_tokens)
+                self.rpm = rpm
+            if tpm != self.tpm:
+                old_tokens = self.token_bucket.tokens if self.token_bucket is not None else tpm
+                self.token_bucket = TokenBucket(tpm, tpm / 60.0) if tpm > 0 else None
+                if self.token_bucket is not None:
+                    self.token_bucket.tokens = min(float(tpm), old_tokens)
+                self.tpm = tpm
+            self._condition.notify_all()
+
+    def acquire(self, stop_flag=None):
+        # Returns the number of tokens reserved for this request, or None if stopped while waiting.
+        with self._condition:
+            while True:
+                if stop_flag and stop_flag.get('stop'):
+                    return None
+                now = time.monotonic()
+                wait_seconds = 0.0
+                if self.request_bucket is not None:
+                    self.request_bucket.refill(now)
+                    wait_seconds = max(wait_seconds, self.request_bucket.wait_time(1))
+                if self.token_bucket is not None:
+                    self.token_bucket.refill(now)
+                    wait_seconds = max(wait_seconds, self.token_bucket.wait_time(self.estimated_tokens))
+                if wait_seconds <= 0:
+                    reserved = int(self.estimated_tokens)
+                    if self.request_bucket is not None:
+                        self.request_bucket.tokens -= 1
+                    if self.token_bucket is not None:
+                        self.token_bucket.tokens -= reserved
+                    return reserved
+                # Sleep on the condition so record_usage() can wake waiters early, and cap the wait so
+                # a stop request is noticed within half a second.
+                self._condition.wait(min(wait_seconds, 0.5))
+
+    def record_usage(self, reserved_tokens, actual_tokens):
+        if reserved_tokens is None:
+            return
+        with self._condition:
+            actual_tokens = int(actual_tokens or 0)
+            if self.token_bucket is not None:
+                # Settle the reservation against the real usage; overshoot leaves the bucket in debt.
+                self.token_bucket.refill(time.monotonic())
+                self.token_bucket.tokens += reserved_tokens - actual_tokens
+            if actual_tokens > 0:
+                self.estimated_tokens = self.estimated_tokens * 0.8 + actual_tokens * 0.2
+            self._condition.notify_all()
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def load_rate_limit_config(service, model):
+    # 0 disables a limit, which is what ships: caps depend on the account tier, so users opt in by
+    # adding their tier's rpm/tpm per model. Until then 429s are handled by retries and AIMD.
+    config = load_ai_config()
+    service_limits = config.get("rate_limits", {}).get(service, {})
+    limits = dict(service_limits.get("default", {}))
+    limits.update(service_limits.get(model, {}))
+    return int(limits.get("rpm", 0)), int(limits.get("tpm", 0))
+
+def get_rate_limiter(service, api_key, model):
+    key = (service, api_key, model)
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(key)
+        if limiter is None:
+            try:
+                rpm, tpm = load_rate_limit_config(service, model)
+            except Exception as e:
+                print(f"[RateLimiter] Failed to load rate limits for {service}/{model}: {e}")
+                rpm, tpm = 0, 0
+            limiter = RateLimiter(rpm, tpm)
+            _rate_limiters[key] = limiter
+        return limiter
+
+def refresh_rate_limits():
+    with _rate_limiters_lock:
+        items = list(_rate_limiters.items())
+    for (service, api_key, model), limiter in items:
+        try:
+            rpm, tpm = load_rate_limit_config(service, model)
+        except Exception as e:
+            print(f"[RateLimiter] Failed to reload rate limits for {service}/{model}: {e}")
+            continue
+        limiter.set_limits(rpm, tpm)
@@ -0,0 +1,84 @@
+import threading
+from helpers.config_cache_helper import load_ai_config
+from helpers.ai_helper.retry_helper import get_status_code
+
+class ResponseSchema:
+    # JSON schema of the metadata response, built once from the configured tag count and category
+    # maps. Both providers constrain decoding to it, so the reply is bare JSON that always parses.
+    def __init__(self, config):
+        tag_count = int(config["required_tag_count"])
+        shutterstock_ids = sorted(int(key) for key in config["shutterstock_category_map"])
+        adobe_stock_ids = sorted(int(key) for key in config["adobe_stock_category_map"])
+        self.properties = {
+            "title": {"type": "string"},
+            "description": {"type": "string"},
+            "tags": {"type": "array", "items": {"type": "string"}, "minItems": tag_count, "maxItems": tag_count},
+            "category": {
+                "type": "object",
+                "properties": {
+                    "shutterstock": {
+                        "type": "object",
+                        "properties": {
+                            "primary": {"type": "integer", "enum": shutterstock_ids},
+                            "secondary": {"type": "integer", "enum": shutterstock_ids},
+                        },
+                        "required": ["primary", "secondary"],
+                        "additionalProperties": False,
+                    },
+                    "adobe_stock": {"type": "integer", "enum": adobe_stock_ids},
+                },
+                "required": ["shutterstock", "adobe_stock"],
+                "additionalProperties": False,
+            },
+        }
+        self.single = self._object(self.properties)
+        self._groups = {}
+
+    def _object(self, properties):
+        return {
+            "type": "object",
+            "properties": properties,
+            "required": list(properties),
+            "additionalProperties": False,
+        }
+
+    def group(self, count):
+        # OpenAI wants an object at the root, so grouped replies are {"results": [...]}, which
+        # match_group_results already understands.
+        schema = self._groups.get(count)
+        if schema is None:
+            item = self._object(dict({"filename": {"type": "string"}}, **self.properties))
+            schema = self._object({"results": {"type": "array", "items": item, "minItems": count, "maxItems": count}})
+            self._groups[count] = schema
+        return schema
+
+_response_schema = None
+_response_schema_source = None
+_unsupported_models = set()
+_response_schema_lock = threading.Lock()
+
+def get_response_schema(service, model, group_size=None):
+    # None when structured output is off or the model turned the schema down earlier.
+    global _response_schema, _response_schema_source
+    config = load_ai_config()
+    if not config.get("structured_output", True):
+        return None
+    with _response_schema_lock:
+        if (service, model) in _unsupported_models:
+            return None
+        if _response_schema is None or _response_schema_source is not config:
+            _response_schema = ResponseSchema(config)
+            _response_schema_source = config
+        if group_size is None:
+            return _response_schema.single
+        return _response_schema.group(group_size)
+
+def is_schema_error(error):
+    if get_status_code(error) != 400:
+        return False
+    message = str(error).lower()
+    return "schema" in message or "response_format" in message or "text.format" in message
+
+def mark_schema_unsupported(service, model):
+    with _response_schema_lock:
+        _unsupported_models.add((service, model))
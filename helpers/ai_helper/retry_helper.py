@@ -0,0 +1,161 @@
+import re
+import time
+import random
+import threading
+from helpers.config_cache_helper import load_ai_config
+
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+TRANSIENT_EXCEPTION_NAMES = ("Timeout", "Connection", "RemoteProtocol")
+# Machine-readable error reasons (OpenAI error codes, Google ErrorInfo reasons) no retry can fix.
+PERMANENT_REASONS = {"insufficient_quota", "billing_hard_limit_reached", "invalid_api_key", "API_KEY_INVALID"}
+# Gemini reports a bad key as a 400 with this ErrorInfo reason rather than a 401.
+INVALID_KEY_REASONS = {"invalid_api_key", "API_KEY_INVALID"}
+
+class RetryAborted(Exception):
+    pass
+
+class TruncatedResponseError(Exception):
+    pass
+
+_throttle_listeners = {}
+_throttle_listeners_lock = threading.Lock()
+
+def set_throttle_listener(api_key, callback):
+    with _throttle_listeners_lock:
+        _throttle_listeners[api_key] = callback
+
+def clear_throttle_listener(api_key):
+    with _throttle_listeners_lock:
+        _throttle_listeners.pop(api_key, None)
+
+def _notify_throttle(api_key):
+    with _throttle_listeners_lock:
+        callback = _throttle_listeners.get(api_key)
+    if callback is not None:
+        callback()
+
+def load_retry_config():
+    config = load_ai_config()
+    retry = config.get("retry", {})
+    return (
+        int(retry.get("max_attempts", 4)),
+        float(retry.get("base_delay_seconds", 1.0)),
+        float(retry.get("max_delay_seconds", 60.0))
+    )
+
+def is_truncated_json(text, error):
+    # A JSON object cut off mid-reply (e.g. at the output token limit): it opens like one and the
+    # decoder ran out of input. Prose or an empty reply is a plain parse error, not worth a retry.
+    if not text or not text.lstrip().startswith('{'):
+        return False
+    return error.msg.startswith("Unterminated string") or error.pos >= len(text.rstrip())
+
+def get_status_code(exc):
+    for attr in ("status_code", "code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, "response", None)
+    value = getattr(response, "status_code", None)
+    if isinstance(value, int):
+        return value
+    return None
+
+def get_error_reasons(exc):
+    reasons = set()
+    code = getattr(exc, "code", None)
+    if isinstance(code, str):
+        reasons.add(code)
+    details = getattr(exc, "details", None)
+    if isinstance(details, dict):
+        error = details.get("error", details)
+        for detail in (error.get("details") if isinstance(error, dict) else None) or []:
+            if isinstance(detail, dict) and detail.get("reason"):
+                reasons.add(detail["reason"])
+    return reasons
+
+def get_retry_after(exc):
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        try:
+            value = headers.get("retry-after-ms")
+            if value:
+                return float(value) / 1000.0
+            value = headers.get("retry-after")
+            if value:
+                return float(value)
+        except (TypeError, ValueError):
+            pass
+    # Gemini reports the delay in the RetryInfo detail of the error body, e.g. 'retryDelay': '37s'.
+    match = re.search(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s", str(exc))
+    if match:
+        return float(match.group(1))
+    return None
+
+def classify_error(exc):
+    # Returns (is_transient, is_throttle).
+    if isinstance(exc, TruncatedResponseError):
+        return True, False
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True, False
+    if get_error_reasons(exc) & PERMANENT_REASONS:
+        return False, False
+    status_code = get_status_code(exc)
+    if status_code is not None:
+        if status_code in TRANSIENT_STATUS_CODES or status_code >= 500:
+            return True, status_code == 429 or status_code >= 500
+        return False, False
+    if any(name in type(exc).__name__ for name in TRANSIENT_EXCEPTION_NAMES):
+        return True, False
+    # Anything else (a parse error, a local failure) is permanent: a retry would bill the request again.
+    return False, False
+
+def get_failure_kind(exc):
+    # Returned with a failed live request so the worker can react without parsing the message:
+    # "invalid_key" when the provider rejected the key itself, "forbidden" when it refused this key
+    # access (403), "throttle" for a rate limit or an overloaded provider, else None.
+    status_code = get_status_code(exc)
+    if status_code == 401 or get_error_reasons(exc) & INVALID_KEY_REASONS:
+        return "invalid_key"
+    if status_code == 403:
+        return "forbidden"
+    if status_code is not None and (status_code == 429 or status_code >= 500):
+        return "throttle"
+    return None
+
+def _sleep(seconds, stop_flag):
+    deadline = time.monotonic() + seconds
+    while True:
+        if stop_flag and stop_flag.get('stop'):
+            raise RetryAborted()
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, 0.25))
+
+def call_with_retry(func, stop_flag=None, label="AI", api_key=None):
+    max_attempts, base_delay, max_delay = load_retry_config()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return func()
+        except RetryAborted:
+            raise
+        except Exception as e:
+            is_transient, is_throttle = classify_error(e)
+            if is_throttle and api_key:
+                _notify_throttle(api_key)
+            if not is_transient or attempt >= max_attempts:
+                raise
+            # Full jitter keeps workers that failed together from retrying together; a server-provided
+            # Retry-After is treated as a lower bound.
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** (attempt - 1))))
+            retry_after = get_retry_after(e)
+            if retry_after is not None:
+                if retry_after > max_delay:
+                    raise
+                delay = retry_after + random.uniform(0, base_delay)
+            print(f"[{label} RETRY] attempt {attempt}/{max_attempts} failed ({type(e).__name__}: {e}), retrying in {delay:.1f}s")
+            _sleep(delay, stop_flag)
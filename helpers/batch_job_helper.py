@@ -0,0 +1,291 @@
+import os
+import json
+import uuid
+from PySide6.QtCore import QThread, Signal, QObject, QTimer
+from helpers.ai_helper.batch_api_helper import (
+    get_batch_job_settings,
+    get_batch_payload_path,
+    get_batch_display_name,
+    find_remote_batch,
+    build_batch_line,
+    submit_batch,
+    poll_batch,
+    fetch_batch_results,
+)
+from helpers.ai_helper.prompt_template_helper import build_prompt
+from helpers.compression_pool_helper import get_compression_pool, wait_for_payload
+from helpers.image_compression_helper import get_max_image_dimension, is_compressible_image, is_video_file
+from helpers.payload_cache_helper import load_payload
+from helpers.video_keyframe_helper import extract_keyframes, keyframe_prompt_note
+
+# Offline "batch job" execution: the requests are written to JSONL payloads and submitted to the
+# provider's batch API (about half the price, separate quota, results within 24h). A selection
+# larger than one batch input file allows is split into several jobs. The remote job id is stored
+# with each generation job; a timer polls submitted jobs and ingests finished results into the
+# database in one transaction.
+
+# Files compressed ahead of the one being written to the payload.
+PREFETCH_AHEAD = 32
+
+def batch_request_key(file_id):
+    return f"file-{file_id}"
+
+class BatchJobSignals(QObject):
+    progress = Signal(int, int)
+    submitted = Signal(int, str)
+    job_finished = Signal(int, str, int)
+
+class BatchJobSubmitWorker(QThread):
+    def __init__(self, db, service, api_key, model, mode, rows, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.service = service
+        self.api_key = api_key
+        self.model = model
+        self.mode = mode
+        self.rows = rows
+        self.signals = BatchJobSignals()
+        self.submitted_jobs = []
+        self.error = None
+
+    def _prepare_images(self, row, payload_future, max_dimension):
+        image_path = row[1]
+        if is_video_file(image_path):
+            # The batch APIs take inline data only, so videos are always sent as keyframes.
+            frames = extract_keyframes(image_path)
+            return frames, keyframe_prompt_note(len(frames)) if frames else ''
+        image_bytes = wait_for_payload(payload_future)
+        if image_bytes is None:
+            image_bytes = load_payload(image_path, max_dimension)
+        return ([image_bytes] if image_bytes else []), ''
+
+    def _fail_row(self, image_path, error_message):
+        print(f"[BatchJob] {error_message}")
+        self.db.update_file_status(image_path, "failed")
+
+    def _submit_chunk(self, rows, chunk_path):
+        # Each chunk becomes its own batch generation job. A crash before its remote id is stored
+        # leaves it "preparing"; the first poll after the next start reconciles it.
+        job_id = self.db.create_generation_job(self.service, self.model, self.api_key, self.mode, rows, execution="batch")
+        payload_path = get_batch_payload_path(job_id, self.service)
+        try:
+            os.replace(chunk_path, payload_path)
+            remote_id = submit_batch(self.service, self.api_key, self.model, payload_path, get_batch_display_name(job_id))
+        except Exception as e:
+            self.db.fail_batch_job(job_id, str(e))
+            raise
+        self.db.mark_batch_job_submitted(job_id, remote_id, payload_path)
+        print(f"[BatchJob] Job {job_id}: {len(rows)} requests submitted to {self.service} as {remote_id}")
+        self.submitted_jobs.append(job_id)
+        self.signals.submitted.emit(job_id, remote_id)
+
+    def run(self):
+        settings = get_batch_job_settings()
+        max_requests = settings["max_requests"][self.service]
+        max_bytes = settings["max_payload_bytes"][self.service]
+        max_dimension = get_max_image_dimension(self.service)
+        total = len(self.rows)
+        chunk_path = get_batch_payload_path(f"pending_{uuid.uuid4().hex}", self.service)
+        chunk_rows = []
+        chunk_bytes = 0
+        f = None
+        try:
+            pool = get_compression_pool()
+            # Compress a bounded window ahead instead of queuing every file at once: a large job's
+            # payloads would otherwise all sit in memory before the first line is written.
+            futures = {}
+            queued = 0
+            for index, row in enumerate(self.rows):
+                while queued < min(total, index + PREFETCH_AHEAD):
+                    upcoming = self.rows[queued]
+                    if is_compressible_image(upcoming[1]):
+                        futures[upcoming[0]] = pool.submit(load_payload, upcoming[1], max_dimension)
+                    queued += 1
+                file_id, image_path = row[0], row[1]
+                images, note = self._prepare_images(row, futures.pop(file_id, None), max_dimension)
+                if not images:
+                    self._fail_row(image_path, f"Failed to prepare {image_path} for the batch job")
+                    self.signals.progress.emit(index + 1, total)
+                    continue
+                prompt = note + build_prompt(os.path.basename(image_path))
+                line = build_batch_line(self.service, self.model, batch_request_key(file_id), images, prompt)
+                data = (json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8")
+                if len(data) > max_bytes:
+                    self._fail_row(image_path, f"{image_path} is too large for a batch payload")
+                    self.signals.progress.emit(index + 1, total)
+                    continue
+                if chunk_rows and (len(chunk_rows) >= max_requests or chunk_bytes + len(data) > max_bytes):
+                    f.close()
+                    f = None
+                    self._submit_chunk(chunk_rows, chunk_path)
+                    chunk_path = get_batch_payload_path(f"pending_{uuid.uuid4().hex}", self.service)
+                    chunk_rows = []
+                    chunk_bytes = 0
+                if f is None:
+                    f = open(chunk_path, "wb")
+                f.write(data)
+                chunk_rows.append(row)
+                chunk_bytes += len(data)
+                self.signals.progress.emit(index + 1, total)
+            if f is not None:
+                f.close()
+                f = None
+            if chunk_rows:
+                self._submit_chunk(chunk_rows, chunk_path)
+            if not self.submitted_jobs:
+                raise RuntimeError("No file could be prepared")
+        except Exception as e:
+            print(f"[BatchJob] Failed to submit batch job: {e}")
+            self.error = str(e)
+        finally:
+            if f is not None:
+                f.close()
+            if os.path.exists(chunk_path):
+                os.remove(chunk_path)
+
+class BatchJobPollWorker(QThread):
+    def __init__(self, db, reconcile=False, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.reconcile = reconcile
+        self.signals = BatchJobSignals()
+
+    def _reconcile_preparing_jobs(self):
+        # Only run at startup, when no submission can still be in progress. The provider may have
+        # created the batch before the crash (and will bill it), so look it up by display name.
+        for job in self.db.get_preparing_batch_jobs():
+            try:
+                remote_id = find_remote_batch(job['service'], job['api_key'], get_batch_display_name(job['id']))
+            except Exception as e:
+                print(f"[BatchJob] Could not look up interrupted job {job['id']}: {e}")
+                continue
+            if remote_id:
+                print(f"[BatchJob] Job {job['id']} was submitted as {remote_id} before the interruption")
+                self.db.mark_batch_job_submitted(job['id'], remote_id, get_batch_payload_path(job['id'], job['service']))
+            else:
+                print(f"[BatchJob] Job {job['id']} was interrupted before it was submitted")
+                self.db.fail_batch_job(job['id'], "Interrupted before it was submitted")
+
+    def _ingest(self, job, output):
+        results = fetch_batch_results(job['service'], job['api_key'], output)
+        rows = []
+        for file_id, filepath in self.db.get_batch_job_files(job['id']):
+            result = results.get(batch_request_key(file_id))
+            if result is None:
+                result = ('', '', '', {}, "No result in the batch output", 0, 0, 0)
+            rows.append((file_id, filepath) + tuple(result))
+        self.db.ingest_batch_results(job['id'], job['service'], job['model'], rows)
+        return sum(1 for row in rows if row[2])
+
+    def run(self):
+        if self.reconcile:
+            self._reconcile_preparing_jobs()
+        for job in self.db.get_active_batch_jobs():
+            try:
+                state, finished, output = poll_batch(job['service'], job['api_key'], job['remote_job_id'])
+            except Exception as e:
+                print(f"[BatchJob] Polling job {job['id']} failed: {e}")
+                continue
+            if state != job['remote_status']:
+                print(f"[BatchJob] Job {job['id']} ({job['remote_job_id']}): {state}")
+                self.db.update_batch_job_remote_status(job['id'], state)
+            if not finished:
+                continue
+            if output is None:
+                self.db.fail_batch_job(job['id'], f"Batch job ended as {state}")
+                self.signals.job_finished.emit(job['id'], state, 0)
+                continue
+            try:
+                succeeded = self._ingest(job, output)
+            except Exception as e:
+                # Left "submitted": the results are fetched and ingested again on the next poll.
+                print(f"[BatchJob] Ingesting job {job['id']} failed: {e}")
+                continue
+            try:
+                if job['payload_path'] and os.path.exists(job['payload_path']):
+                    os.remove(job['payload_path'])
+            except OSError:
+                pass
+            print(f"[BatchJob] Job {job['id']} finished: {succeeded}/{job['total']} files succeeded")
+            self.signals.job_finished.emit(job['id'], state, succeeded)
+
+def _refresh_after_batch(window):
+    from helpers.batch_processing_helper import update_token_stats_ui
+    window.table.refresh_table()
+    update_token_stats_ui(window)
+
+def submit_batch_job(window):
+    from PySide6.QtWidgets import QMessageBox
+    from helpers.batch_processing_helper import collect_generation_rows
+    if getattr(window, 'is_generating', False) or getattr(window, '_batch_job_submit_worker', None) is not None:
+        return
+    selection = collect_generation_rows(window)
+    if selection is None:
+        return
+    api_key, model, service, rows, row_map, mode = selection
+    reply = QMessageBox.question(
+        window,
+        "Submit Batch Job",
+        f"Submit {len(rows)} files as an offline {service} batch job?\n\n"
+        "Batch jobs cost less and use a separate quota, but results can take up to 24 hours. "
+        "They are imported automatically while Image Tea is open.",
+        QMessageBox.Yes | QMessageBox.No
+    )
+    if reply != QMessageBox.Yes:
+        return
+    worker = BatchJobSubmitWorker(window.db, service, api_key, model, mode, rows)
+    window._batch_job_submit_worker = worker
+    window.table.progress_bar.setVisible(True)
+    window.table.progress_bar.setMinimum(0)
+    window.table.progress_bar.setMaximum(len(rows))
+    window.table.progress_bar.setValue(0)
+    window.table.progress_bar.setFormat('Preparing batch job...')
+
+    def on_progress(current, total):
+        window.table.progress_bar.setMaximum(total)
+        window.table.progress_bar.setValue(current)
+
+    def on_done():
+        window._batch_job_submit_worker = None
+        jobs = ", ".join(str(job_id) for job_id in worker.submitted_jobs)
+        if worker.error:
+            message = f"Batch job failed: {worker.error}"
+            if jobs:
+                message += f" (submitted before the failure: {jobs})"
+        else:
+            message = f"Batch job {jobs} submitted" if len(worker.submitted_jobs) == 1 else f"Batch jobs {jobs} submitted"
+        window.table.progress_bar.setFormat(message)
+        if hasattr(window, "statusbar"):
+            window.statusbar.set_status(message)
+        _refresh_after_batch(window)
+
+    worker.signals.progress.connect(on_progress)
+    worker.finished.connect(on_done)
+    worker.start()
+
+def check_batch_jobs(window, reconcile=False):
+    if getattr(window, '_batch_job_poll_worker', None) is not None:
+        return
+    worker = BatchJobPollWorker(window.db, reconcile)
+    window._batch_job_poll_worker = worker
+
+    def on_job_finished(job_id, state, succeeded):
+        message = f"Batch job {job_id} finished ({state}): {succeeded} files updated"
+        if hasattr(window, "statusbar"):
+            window.statusbar.set_status(message)
+        _refresh_after_batch(window)
+
+    def on_finished():
+        window._batch_job_poll_worker = None
+
+    worker.signals.job_finished.connect(on_job_finished)
+    worker.finished.connect(on_finished)
+    worker.start()
+
+def start_batch_job_monitor(window):
+    timer = QTimer(window)
+    timer.setInterval(get_batch_job_settings()["poll_seconds"] * 1000)
+    timer.timeout.connect(lambda: check_batch_jobs(window))
+    timer.start()
+    window._batch_job_timer = timer
+    check_batch_jobs(window, reconcile=True)
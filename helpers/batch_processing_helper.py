@@ -1,99 +1,414 @@
-import json
 import os
-from PySide6.QtCore import Qt, QThread, Signal, QObject, QPropertyAnimation, QEasingCurve, QByteArray
+from PySide6.QtCore import Qt, QThread, Signal, QObject, QTimer, QPropertyAnimation, QEasingCurve, QByteArray
 from PySide6.QtGui import QColor
-from config import BASE_PATH
 import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from helpers.config_cache_helper import load_ai_config
+from helpers.adaptive_concurrency_helper import AdaptiveConcurrencyController, load_concurrency_config
+from helpers.ai_helper.rate_limiter_helper import refresh_rate_limits
+from helpers.ai_helper.retry_helper import set_throttle_listener, clear_throttle_listener
+from helpers.ai_helper.client_registry_helper import discard_client
+from helpers.compression_pool_helper import CompressionPrefetcher, wait_for_payload
+from helpers.image_compression_helper import is_video_file
+from helpers.video_keyframe_helper import get_video_mode
+from helpers.ai_helper.group_request_helper import get_images_per_request
 
 def get_batch_size():
-    config_path = os.path.join(BASE_PATH, "configs", "ai_config.json")
-    with open(config_path, 'r', encoding='utf-8') as f:
-        config = json.load(f)
+    config = load_ai_config()
     return int(config['batch_size'])
 
+def get_key_drop_threshold():
+    config = load_ai_config()
+    return int(config.get('key_drop_threshold', 3))
+
+def get_result_flush_settings():
+    config = load_ai_config()
+    settings = config.get('result_flush', {})
+    return max(1, int(settings.get('max_rows', 200))), max(0, int(settings.get('max_delay_ms', 3000)))
+
+_worker_pool = None
+_worker_pool_size = 0
+_worker_pool_lock = threading.Lock()
+
+def get_worker_pool(max_workers):
+    # One executor is kept alive across jobs; it is only rebuilt when a job needs more workers than it has.
+    global _worker_pool, _worker_pool_size
+    with _worker_pool_lock:
+        if _worker_pool is None or _worker_pool_size < max_workers:
+            old_pool = _worker_pool
+            _worker_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ImageTeaWorker")
+            _worker_pool_size = max_workers
+            if old_pool is not None:
+                old_pool.shutdown(wait=False)
+        return _worker_pool
+
+class ResultWriteBuffer:
+    # Started and finished rows are written in groups, one transaction per flush, instead of several
+    # transactions per file. A flush happens after max_rows rows or max_delay_ms, whichever comes
+    # first. A crash loses at most the unflushed rows; they are still pending in the job and are
+    # generated again on resume.
+    def __init__(self, db, job_id, service, model, on_flushed=None):
+        self.db = db
+        self.job_id = job_id
+        self.service = service
+        self.model = model
+        self.on_flushed = on_flushed
+        self.max_rows, max_delay_ms = get_result_flush_settings()
+        self.started = []
+        self.results = []
+        self.usage = []
+        self._timer = QTimer()
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(max_delay_ms)
+        self._timer.timeout.connect(self.flush)
+
+    def add_started(self, filepath):
+        self.started.append(filepath)
+        self._schedule()
+
+    def add_result(self, result):
+        self.results.append(result)
+        self._schedule()
+
+    def add_usage(self, usage):
+        self.usage.append(usage)
+        self._schedule()
+
+    def _schedule(self):
+        if len(self.started) + len(self.results) + len(self.usage) >= self.max_rows:
+            self.flush()
+        elif not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self):
+        self._timer.stop()
+        if not self.started and not self.results and not self.usage:
+            return
+        started, results, usage = self.started, self.results, self.usage
+        self.started, self.results, self.usage = [], [], []
+        self.db.record_generation_results(self.job_id, self.service, self.model, results, started, usage)
+        if self.on_flushed is not None:
+            self.on_flushed()
+
 class BatchWorkerSignals(QObject):
     finished = Signal(list)
     progress = Signal(int, int)
     row_status = Signal(int, str)
+    row_started = Signal(object)
+    row_finished = Signal(object, object)
+    row_usage = Signal(object, object)
+    key_dropped = Signal(str, str)
+
+class KeySlot:
+    def __init__(self, api_key, concurrency=1, controller=None):
+        self.api_key = api_key
+        self.concurrency = max(1, int(concurrency))
+        self.controller = controller
+        self.in_flight = 0
+        self.active = True
+        self.consecutive_throttles = 0
+
+    @property
+    def limit(self):
+        if self.controller is not None:
+            return self.controller.limit
+        return self.concurrency
+
+    @property
+    def max_workers(self):
+        if self.controller is not None:
+            return self.controller.maximum
+        return self.concurrency
+
+    def has_capacity(self):
+        return self.active and self.in_flight < self.limit
 
 class BatchWorker(QThread):
-    def __init__(self, api_key, model, batch, service, metadata_func, row_map, parent=None, stop_flag=None):
+    def __init__(self, api_key, model, rows, service, metadata_func, row_map, parent=None, stop_flag=None, concurrency=None, controller=None, key_slots=None, group_metadata_func=None):
         super().__init__(parent)
         self.api_key = api_key
         self.model = model
-        self.batch = batch
+        self.rows = rows
         self.service = service
         self.metadata_func = metadata_func
+        self.group_metadata_func = group_metadata_func
+        self.group_size = get_images_per_request() if group_metadata_func is not None else 1
         self.row_map = row_map
+        if not key_slots:
+            key_slots = [KeySlot(api_key, concurrency if concurrency else get_batch_size(), controller)]
+        self.key_slots = key_slots
+        self.key_drop_threshold = get_key_drop_threshold()
+        self.video_mode = get_video_mode()
         self.signals = BatchWorkerSignals()
-        self._results = []
         self._errors = []
         self._should_stop = False
         self._external_stop_flag = stop_flag
-        self._threads = []
-        self._lock = threading.Lock()
         self._completed = 0
+        self._solo = set()
 
     def stop(self):
         self._should_stop = True
         if self._external_stop_flag is not None:
             self._external_stop_flag['stop'] = True
 
+    def _is_stopped(self):
+        stop_flag = self._external_stop_flag
+        return self._should_stop or bool(stop_flag and stop_flag.get('stop'))
+
+    def _pick_slot(self):
+        best = None
+        for slot in self.key_slots:
+            if not slot.has_capacity():
+                continue
+            if best is None or slot.in_flight / slot.limit < best.in_flight / best.limit:
+                best = slot
+        return best
+
+    def _has_active_slot(self):
+        return any(slot.active for slot in self.key_slots)
+
+    def _drop_slot(self, slot, reason):
+        if not slot.active:
+            return
+        slot.active = False
+        masked_key = '*' * max(len(slot.api_key) - 5, 0) + slot.api_key[-5:]
+        print(f"[MultiKey] Dropping API key {masked_key}: {reason}")
+        self.signals.key_dropped.emit(slot.api_key, reason)
+
+    def _check_slot_health(self, slot, error_message, failure_kind):
+        # Returns True when the row should be handed to another key instead of being reported.
+        if failure_kind == "invalid_key":
+            self._drop_slot(slot, "invalid")
+            return self._has_active_slot()
+        if failure_kind == "forbidden":
+            # Out of this job, but the key is not marked invalid: a 403 can be a missing model or
+            # region permission rather than a bad key.
+            self._drop_slot(slot, "forbidden")
+            return self._has_active_slot()
+        if failure_kind == "throttle":
+            slot.consecutive_throttles += 1
+            if len(self.key_slots) > 1 and slot.consecutive_throttles >= self.key_drop_threshold:
+                self._drop_slot(slot, "quota")
+            return len(self.key_slots) > 1 and self._has_active_slot()
+        if not error_message:
+            slot.consecutive_throttles = 0
+        return False
+
+    def _needs_staging(self, row):
+        return self.video_mode == "upload" and self.service == "gemini" and is_video_file(row[1])
+
+    def _pick_staging_slot(self):
+        # Staging does not use a slot's window, so only spread the uploads across the active keys.
+        best = None
+        for slot in self.key_slots:
+            if not slot.active:
+                continue
+            if best is None or slot.in_flight / slot.limit < best.in_flight / best.limit:
+                best = slot
+        return best
+
+    def _staging_limit(self):
+        # Server-side processing dominates, so let a few more videos activate than can be sent at once.
+        return max(4, 2 * sum(slot.limit for slot in self.key_slots if slot.active))
+
+    def _can_group(self, row):
+        return self.group_size > 1 and row[0] not in self._solo and not is_video_file(row[1])
+
+    def _take_rows(self, pending):
+        # The next row, plus up to group_size - 1 further still images for the same request.
+        # Responses are matched back by filename, so a group never holds two files with the same name.
+        rows = [pending.popleft()]
+        if not self._can_group(rows[0]):
+            return rows
+        names = {os.path.basename(rows[0][1]).lower()}
+        skipped = []
+        scanned = 0
+        while pending and len(rows) < self.group_size and scanned < self.group_size * 4:
+            row = pending.popleft()
+            scanned += 1
+            name = os.path.basename(row[1]).lower()
+            if self._can_group(row) and name not in names:
+                rows.append(row)
+                names.add(name)
+            else:
+                skipped.append(row)
+        pending.extendleft(reversed(skipped))
+        return rows
+
+    def _submit(self, pool, slot, rows, stop_flag, prefetcher, in_flight):
+        slot.in_flight += 1
+        payload_futures = [prefetcher.get(row) for row in rows]
+        future = pool.submit(self._run_task, slot.api_key, [row[1] for row in rows], stop_flag, payload_futures)
+        in_flight[future] = (rows, slot)
+
+    def _run_task(self, api_key, image_paths, stop_flag, payload_futures):
+        payloads = [wait_for_payload(future) for future in payload_futures]
+        t0 = time.perf_counter()
+        if len(image_paths) == 1:
+            results = [self.metadata_func(api_key, self.model, image_paths[0], None, stop_flag, payloads[0])]
+        else:
+            results = self.group_metadata_func(api_key, self.model, image_paths, stop_flag, payloads)
+        # Per image, so grouped requests and a short last group feed AIMD comparable latencies.
+        latency_ms = int((time.perf_counter() - t0) * 1000) // len(image_paths)
+        return results, latency_ms
+
+    def _request_error(self, results):
+        # (error message, failure kind) every row of the request shares (the request itself failed),
+        # else ('', None).
+        errors = {(result.get("error_message") or '', result.get("failure_kind")) if isinstance(result, dict) else ('', None)
+                  for result in results}
+        return errors.pop() if len(errors) == 1 else ('', None)
+
+    def _finish_row(self, row, result, prefetcher, total):
+        prefetcher.discard(row)
+        if self._is_stopped():
+            return
+        self._completed += 1
+        self.signals.row_finished.emit(row, result)
+        self.signals.progress.emit(self._completed, total)
+
     def run(self):
-        self._results = []
         self._errors = []
         self._completed = 0
+        self._solo = set()
         stop_flag = self._external_stop_flag
-        threads = []
-        results = [None] * len(self.batch)
-        errors = [None] * len(self.batch)
-
-        def task_wrapper(idx, row):
-            if self._should_stop or (stop_flag and stop_flag.get('stop')):
-                return
-            try:
-                image_path = row[1]
-                prompt = None
-                result = self.metadata_func(self.api_key, self.model, image_path, prompt, stop_flag)
-                with self._lock:
-                    if not self._should_stop and not (stop_flag and stop_flag.get('stop')):
-                        results[idx] = (idx, result)
-            except Exception as e:
-                with self._lock:
-                    if not self._should_stop and not (stop_flag and stop_flag.get('stop')):
-                        errors[idx] = str(e)
-            finally:
-                with self._lock:
-                    self._completed += 1
-                    if not self._should_stop and not (stop_flag and stop_flag.get('stop')):
-                        self.signals.progress.emit(self._completed, len(self.batch))
-
-        for idx, row in enumerate(self.batch):
-            t = threading.Thread(target=task_wrapper, args=(idx, row))
-            threads.append(t)
-            t.start()
-
-        while self._completed < len(self.batch):
-            if self._should_stop or (stop_flag and stop_flag.get('stop')):
+        total = len(self.rows)
+        pool = get_worker_pool(sum(slot.max_workers for slot in self.key_slots))
+        # Throttles absorbed by in-place retries never reach the row result, so let them reach AIMD directly.
+        for slot in self.key_slots:
+            if slot.controller is not None:
+                set_throttle_listener(slot.api_key, slot.controller.on_throttle)
+        pending = deque(row for row in self.rows if not self._needs_staging(row))
+        pending_videos = deque(row for row in self.rows if self._needs_staging(row))
+        requeued = {}
+        in_flight = {}
+        prefetcher = CompressionPrefetcher(self.service)
+        # Videos that still have to be uploaded and activated wait here without holding an API slot.
+        staged = {}
+        ready = deque()
+        # Keep every key's window full: a new row is submitted as soon as any in-flight row finishes,
+        # so a slow request only occupies its own slot instead of holding back a whole batch.
+        while True:
+            if self._is_stopped():
+                break
+            while ready:
+                row, slot = ready[0]
+                if not slot.active:
+                    ready.popleft()
+                    pending_videos.appendleft(row)
+                    continue
+                if not slot.has_capacity():
+                    break
+                ready.popleft()
+                self._submit(pool, slot, [row], stop_flag, prefetcher, in_flight)
+            while pending_videos and len(staged) < self._staging_limit():
+                slot = self._pick_staging_slot()
+                if slot is None:
+                    break
+                from helpers.ai_helper.gemini_file_helper import start_video_upload
+                row = pending_videos.popleft()
+                self.signals.row_started.emit(row)
+                staged[start_video_upload(slot.api_key, row[1], stop_flag)] = (row, slot)
+            while pending:
+                slot = self._pick_slot()
+                if slot is None:
+                    break
+                rows = self._take_rows(pending)
+                for row in rows:
+                    self.signals.row_started.emit(row)
+                self._submit(pool, slot, rows, stop_flag, prefetcher, in_flight)
+            # Compress the next files in the background while the current ones wait on the network.
+            prefetcher.fill(pending, sum(slot.limit for slot in self.key_slots if slot.active) * self.group_size)
+            if not in_flight and not staged and not ready:
+                pending.extend(pending_videos)
+                pending_videos.clear()
+                if pending and not self._has_active_slot():
+                    while pending:
+                        row = pending.popleft()
+                        self._completed += 1
+                        self._errors.append(f"{row[1]}: No healthy API key left")
+                        self.signals.row_finished.emit(row, None)
+                        self.signals.progress.emit(self._completed, total)
                 break
-            self.msleep(50)
+            done, _ = wait(list(in_flight) + list(staged), timeout=0.05, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in staged:
+                    # Upload failures are reported by the API call itself, which retries the upload.
+                    ready.append(staged.pop(future))
+                    continue
+                rows, slot = in_flight.pop(future)
+                slot.in_flight -= 1
+                requeue = False
+                crashed = False
+                try:
+                    results, latency_ms = future.result()
+                    error_message, failure_kind = self._request_error(results)
+                    if slot.controller is not None:
+                        slot.controller.on_result(latency_ms, error_message, failure_kind)
+                    requeue = self._check_slot_health(slot, error_message, failure_kind)
+                except Exception as e:
+                    results = [None] * len(rows)
+                    crashed = True
+                    for row in rows:
+                        self._errors.append(f"{row[1]}: {e}")
+                for row, result in reversed(list(zip(rows, results))):
+                    if requeue and isinstance(result, dict) and requeued.get(row[0], 0) < len(self.key_slots):
+                        requeued[row[0]] = requeued.get(row[0], 0) + 1
+                        (pending_videos if self._needs_staging(row) else pending).appendleft(row)
+                        continue
+                    if isinstance(result, dict) and result.get("title") is None:
+                        # The grouped response did not answer this image. Its share of the billed
+                        # tokens is recorded now; the solo retry is billed on its own.
+                        if result.get("token_total"):
+                            self.signals.row_usage.emit(row, result)
+                        if not self._is_stopped():
+                            self._solo.add(row[0])
+                            pending.appendleft(row)
+                            continue
+                        result = None
+                    self._finish_row(row, result, prefetcher, total)
+
+        prefetcher.cancel_all()
+        for future in staged:
+            future.cancel()
+        for slot in self.key_slots:
+            clear_throttle_listener(slot.api_key)
 
-        if self._should_stop or (stop_flag and stop_flag.get('stop')):
-            time.sleep(3)
-            self._results = []
+        if self._is_stopped():
             self._errors = []
             self.signals.finished.emit([])
             return
 
-        self._results = [r for r in results if r is not None]
-        self._errors = [e for e in errors if e is not None]
         self.signals.finished.emit(self._errors)
 
 def batch_generate_metadata(window):
     if getattr(window, 'is_generating', False):
         return
+    selection = collect_generation_rows(window)
+    if selection is None:
+        return
+    api_key, model, service, rows, row_map, mode = selection
+
+    # --- WARNING DIALOG FOR > 1000 FILES ---
+    if mode == "all" and len(rows) >= 1000:
+        try:
+            from dialogs.api_call_warning_dialog import ApiCallWarningDialog
+            from PySide6.QtWidgets import QDialog
+            dialog = ApiCallWarningDialog(window, file_count=len(rows))
+            result = dialog.exec()
+            if result != QDialog.Accepted:
+                return
+        except Exception as e:
+            print(f"[DEBUG] Failed to show ApiCallWarningDialog: {e}")
+    # --- END WARNING DIALOG ---
 
+    _start_generation(window, api_key, model, service, rows, row_map, mode)
+
+def collect_generation_rows(window):
+    # The selected key/model/service and the rows picked by the generate mode combo, after the
+    # usual checks; None (with a message already shown) when there is nothing to run.
     # Always fetch API key, model, and service from api_key_section if available
     api_key = None
     model = None
@@ -130,9 +445,8 @@ def batch_generate_metadata(window):
         else:
             mode = "all"
     rows = []
-    all_rows = window.db.get_all_files()
     if mode == "all":
-        rows = all_rows
+        rows = window.db.get_all_files()
     elif mode == "selected":
         table_widget = window.table.table
         selected_ids = []
@@ -147,9 +461,9 @@ def batch_generate_metadata(window):
                     except Exception:
                         print(f"[DEBUG] Failed to parse id from checkbox row {row_idx}: {id_data}")
         print(f"[DEBUG] Selected IDs for generate: {selected_ids}")
-        rows = [row for row in all_rows if row[0] in selected_ids]
+        rows = window.db.get_files_by_ids(selected_ids)
     elif mode == "failed":
-        rows = [row for row in all_rows if row[6] == "failed"]
+        rows = window.db.get_files_by_status(["failed"])
     if mode == "selected" and not selected_ids:
         print("[DEBUG] No rows checked for Selected Only mode.")
         from PySide6.QtWidgets import QMessageBox
@@ -174,20 +488,9 @@ def batch_generate_metadata(window):
         QMessageBox.critical(window, "File Not Found", msg)
         return
     # --- END FILE EXISTENCE CHECK ---
+    return api_key, model, service, rows, row_map, mode
 
-    # --- WARNING DIALOG FOR > 1000 FILES ---
-    if mode == "all" and len(rows) >= 1000:
-        try:
-            from dialogs.api_call_warning_dialog import ApiCallWarningDialog
-            from PySide6.QtWidgets import QDialog
-            dialog = ApiCallWarningDialog(window, file_count=len(rows))
-            result = dialog.exec()
-            if result != QDialog.Accepted:
-                return
-        except Exception as e:
-            print(f"[DEBUG] Failed to show ApiCallWarningDialog: {e}")
-    # --- END WARNING DIALOG ---
-
+def _start_generation(window, api_key, model, service, rows, row_map, mode, job_id=None):
     window.table.progress_bar.setVisible(True)
     window.table.progress_bar.setMinimum(0)
     window.table.progress_bar.setMaximum(len(rows))
@@ -197,14 +500,15 @@ def batch_generate_metadata(window):
     QApplication.processEvents()
 
     stop_flag = {'stop': False}
+    refresh_rate_limits()
     if service == "gemini":
-        from helpers.ai_helper.gemini_helper import generate_metadata_gemini, track_gemini_generation_time
-        def metadata_func(api_key, model, image_path, prompt=None, stop_flag=None):
+        from helpers.ai_helper.gemini_helper import generate_metadata_gemini, generate_metadata_gemini_group, track_gemini_generation_time
+        def metadata_func(api_key, model, image_path, prompt=None, stop_flag=None, image_bytes=None):
             if stop_flag and stop_flag.get('stop'):
-                return {'title': '', 'description': '', 'tags': '', 'category': {}, 'token_input': 0, 'token_output': 0, 'token_total': 0, 'image_path': image_path, 'error_message': ''}
+                return {'title': '', 'description': '', 'tags': '', 'category': {}, 'token_input': 0, 'token_output': 0, 'token_total': 0, 'image_path': image_path, 'error_message': '', 'failure_kind': None}
             import time
             t0 = time.perf_counter()
-            title, description, tags, category, error_message, token_input, token_output, token_total = generate_metadata_gemini(api_key, model, image_path, prompt, stop_flag)
+            title, description, tags, category, error_message, token_input, token_output, token_total, failure_kind = generate_metadata_gemini(api_key, model, image_path, prompt, stop_flag, image_bytes)
             t1 = time.perf_counter()
             duration_ms = int((t1 - t0) * 1000)
             gen_time, avg_time, longest_time, last_time = track_gemini_generation_time(duration_ms)
@@ -221,16 +525,25 @@ def batch_generate_metadata(window):
                 "token_output": token_output,
                 "token_total": token_total,
                 "image_path": image_path,
-                "error_message": error_message
+                "error_message": error_message,
+                "failure_kind": failure_kind
             }
+        def group_metadata_func(api_key, model, image_paths, stop_flag=None, payloads=None):
+            t0 = time.perf_counter()
+            outcomes = generate_metadata_gemini_group(api_key, model, image_paths, stop_flag, payloads)
+            duration_ms = int((time.perf_counter() - t0) * 1000)
+            gen_time, avg_time, longest_time, last_time = track_gemini_generation_time(duration_ms)
+            if hasattr(window, "stats_section"):
+                window.stats_section.update_generation_times(gen_time, avg_time, longest_time, last_time)
+            return _group_results("Gemini", image_paths, outcomes)
     elif service == "openai":
-        from helpers.ai_helper.openai_helper import generate_metadata_openai, track_openai_generation_time
-        def metadata_func(api_key, model, image_path, prompt=None, stop_flag=None):
+        from helpers.ai_helper.openai_helper import generate_metadata_openai, generate_metadata_openai_group, track_openai_generation_time
+        def metadata_func(api_key, model, image_path, prompt=None, stop_flag=None, image_bytes=None):
             if stop_flag and stop_flag.get('stop'):
-                return {'title': '', 'description': '', 'tags': '', 'category': {}, 'token_input': 0, 'token_output': 0, 'token_total': 0, 'image_path': image_path, 'error_message': ''}
+                return {'title': '', 'description': '', 'tags': '', 'category': {}, 'token_input': 0, 'token_output': 0, 'token_total': 0, 'image_path': image_path, 'error_message': '', 'failure_kind': None}
             import time
             t0 = time.perf_counter()
-            title, description, tags, category, error_message, token_input, token_output, token_total = generate_metadata_openai(api_key, model, image_path, prompt, stop_flag)
+            title, description, tags, category, error_message, token_input, token_output, token_total, failure_kind = generate_metadata_openai(api_key, model, image_path, prompt, stop_flag, image_bytes)
             t1 = time.perf_counter()
             duration_ms = int((t1 - t0) * 1000)
             gen_time, avg_time, longest_time, last_time = track_openai_generation_time(duration_ms)
@@ -247,8 +560,17 @@ def batch_generate_metadata(window):
                 "token_output": token_output,
                 "token_total": token_total,
                 "image_path": image_path,
-                "error_message": error_message
+                "error_message": error_message,
+                "failure_kind": failure_kind
             }
+        def group_metadata_func(api_key, model, image_paths, stop_flag=None, payloads=None):
+            t0 = time.perf_counter()
+            outcomes = generate_metadata_openai_group(api_key, model, image_paths, stop_flag, payloads)
+            duration_ms = int((time.perf_counter() - t0) * 1000)
+            gen_time, avg_time, longest_time, last_time = track_openai_generation_time(duration_ms)
+            if hasattr(window, "stats_section"):
+                window.stats_section.update_generation_times(gen_time, avg_time, longest_time, last_time)
+            return _group_results("OpenAI", image_paths, outcomes)
     else:
         print(f"[DEBUG] Unknown service: {service}")
         from PySide6.QtWidgets import QMessageBox
@@ -258,18 +580,32 @@ def batch_generate_metadata(window):
         window.table.progress_bar.setFormat('')
         return
 
-    batch_size = get_batch_size()
-    total_files = len(rows)
-    batches = [rows[i:i+batch_size] for i in range(0, total_files, batch_size)]
+    table_widget = window.table.table
+    row_index = {}
+    for row_idx in range(table_widget.rowCount()):
+        item = table_widget.item(row_idx, 1)
+        if item:
+            row_index[item.data(Qt.UserRole)] = row_idx
+    api_keys = [api_key]
+    if hasattr(window, "api_key_section") and window.api_key_section.get_use_all_keys():
+        api_keys = _get_active_api_keys(window, service, api_key)
+    key_slots = [KeySlot(key, get_batch_size(), _create_concurrency_controller()) for key in api_keys]
+    if len(key_slots) > 1:
+        print(f"[MultiKey] Sharding {len(rows)} files across {len(key_slots)} {service} API keys")
+    if job_id is None:
+        job_id = window.db.create_generation_job(service, model, api_key, mode, rows)
     window._batch_processing_state = {
-        'batches': batches,
-        'current': 0,
+        'job_id': job_id,
         'errors': [],
         'api_key': api_key,
         'model': model,
         'service': service,
         'row_map': row_map,
+        'row_index': row_index,
+        'key_slots': key_slots,
+        'in_flight': set(),
         'metadata_func': metadata_func,
+        'group_metadata_func': group_metadata_func,
         'rows': rows,
         'should_stop': False,
         'worker': None,
@@ -278,7 +614,29 @@ def batch_generate_metadata(window):
     window.is_generating = True
     _set_gen_btn_stop_state(window, True)
     window._gen_total_time_start = time.perf_counter()
-    _run_next_batch(window)
+    _start_batch_worker(window)
+
+def _group_results(label, image_paths, outcomes):
+    # A title of None (an image the grouped response skipped) is kept: the worker records its
+    # tokens and sends the image again on its own.
+    results = []
+    for image_path, outcome in zip(image_paths, outcomes):
+        title, description, tags, category, error_message, token_input, token_output, token_total, failure_kind = outcome
+        if error_message:
+            print(f"[{label} ERROR] {error_message}")
+        results.append({
+            "title": title,
+            "description": description,
+            "tags": tags,
+            "category": category,
+            "token_input": token_input,
+            "token_output": token_output,
+            "token_total": token_total,
+            "image_path": image_path,
+            "error_message": error_message,
+            "failure_kind": failure_kind
+        })
+    return results
 
 def _set_gen_btn_blinking(window, blinking, color=None, text=None):
     if not hasattr(window, "gen_btn"):
@@ -349,43 +707,113 @@ def _set_gen_btn_stop_state(window, is_stop, is_stopping=False):
         btn.setStyleSheet("background-color: #4e9e20; color: white;")
         window._gen_btn_last_bg = "background-color: #4e9e20; color: white;"
 
-def _run_next_batch(window):
+def _create_concurrency_controller():
+    try:
+        settings = load_concurrency_config()
+    except Exception as e:
+        print(f"[AIMD] Failed to load concurrency config: {e}")
+        return None
+    if not settings["enabled"]:
+        return None
+    return AdaptiveConcurrencyController(
+        settings["initial"],
+        minimum=settings["minimum"],
+        maximum=settings["maximum"]
+    )
+
+def _get_active_api_keys(window, service, selected_api_key):
+    api_keys = [selected_api_key]
+    for entry in window.db.get_all_api_keys():
+        key_service, key, note, last_tested, status, key_model = entry
+        if not key or key in api_keys:
+            continue
+        if (key_service or "").lower() == service and status == "active":
+            api_keys.append(key)
+    return api_keys
+
+def _find_table_row(window, filepath):
+    state = window._batch_processing_state
+    table_widget = window.table.table
+    row_idx = state['row_index'].get(filepath)
+    if row_idx is not None:
+        item = table_widget.item(row_idx, 1)
+        if item and item.data(Qt.UserRole) == filepath:
+            return row_idx
+    for row_idx in range(table_widget.rowCount()):
+        item = table_widget.item(row_idx, 1)
+        if item and item.data(Qt.UserRole) == filepath:
+            state['row_index'][filepath] = row_idx
+            return row_idx
+    return None
+
+def _update_cached_row(window, row_data):
+    for i, cache_row in enumerate(window.table._all_rows_cache):
+        if cache_row[1] == row_data[1]:
+            cache_row_list = list(cache_row)
+            cache_row_list[:len(row_data)] = row_data
+            window.table._all_rows_cache[i] = tuple(cache_row_list)
+            break
+
+def _start_batch_worker(window):
     state = window._batch_processing_state
     if state.get('should_stop', False):
         _on_generation_finished(window, state['errors'], stopped=True)
         return
-    if state['current'] >= len(state['batches']):
-        _on_generation_finished(window, state['errors'])
-        return
-    batch = state['batches'][state['current']]
     api_key = state['api_key']
     model = state['model']
     service = state['service']
     row_map = state['row_map']
     metadata_func = state['metadata_func']
+    group_metadata_func = state.get('group_metadata_func')
     rows = state['rows']
     stop_flag = state.get('stop_flag')
-    batch_indices = []
-    table_widget = window.table.table
-    for row in batch:
-        filepath = row[1]
-        # Update status in _all_rows_cache to "processing" for this filepath
-        for i, cache_row in enumerate(window.table._all_rows_cache):
-            if cache_row[1] == filepath:
-                cache_row_list = list(cache_row)
-                if len(cache_row_list) > 6:
-                    cache_row_list[6] = "processing"
-                    window.table._all_rows_cache[i] = tuple(cache_row_list)
-                break
-        # Update status in database to "processing"
-        window.db.update_file_status(filepath, "processing")
-        for row_idx in range(table_widget.rowCount()):
-            item = table_widget.item(row_idx, 1)
-            if item and item.data(Qt.UserRole) == filepath:
-                batch_indices.append(row_idx)
-                window.table.set_row_status_color(row_idx, "processing")
-    worker = BatchWorker(api_key, model, batch, service, metadata_func, row_map, stop_flag=stop_flag)
+    key_slots = state.get('key_slots')
+    worker = BatchWorker(api_key, model, rows, service, metadata_func, row_map, stop_flag=stop_flag, key_slots=key_slots, group_metadata_func=group_metadata_func)
     state['worker'] = worker
+    job_id = state.get('job_id')
+    write_buffer = ResultWriteBuffer(window.db, job_id, service, model, on_flushed=lambda: update_token_stats_ui(window))
+    state['write_buffer'] = write_buffer
+    def on_row_started(row):
+        filepath = row[1]
+        state['in_flight'].add(filepath)
+        write_buffer.add_started(filepath)
+        row_idx = _find_table_row(window, filepath)
+        if row_idx is not None:
+            window.table.set_row_status_color(row_idx, "processing")
+    def on_row_finished(row, result):
+        file_id, filepath = row[0], row[1]
+        state['in_flight'].discard(filepath)
+        if state.get('should_stop', False) or (stop_flag and stop_flag.get('stop')):
+            return
+        if not isinstance(result, dict):
+            write_buffer.add_result((file_id, filepath, None, None, None, None, "No result", 0, 0, 0))
+            row_idx = _find_table_row(window, filepath)
+            if row_idx is not None:
+                window.table.set_row_status_color(row_idx, "failed")
+            return
+        title = result.get("title")
+        description = result.get("description")
+        tags = result.get("tags")
+        token_input = result.get("token_input")
+        token_output = result.get("token_output")
+        token_total = result.get("token_total")
+        category = result.get("category")
+        status = "success" if title else "failed"
+        write_buffer.add_result((file_id, filepath, title or '', description, tags, category,
+                                 result.get("error_message"), token_input, token_output, token_total))
+        row_data = (file_id, filepath, row[2], title, description, tags, status)
+        _update_cached_row(window, row_data)
+        row_idx = _find_table_row(window, filepath)
+        if row_idx is not None:
+            window.table.update_row_data(row_idx, row_data)
+            window.table.set_row_status_color(row_idx, status)
+    def on_row_usage(row, result):
+        # Recorded even after a stop: the tokens were billed either way.
+        write_buffer.add_usage((row[1], result.get("token_input"), result.get("token_output"), result.get("token_total")))
+    def on_key_dropped(dropped_key, reason):
+        if reason == "invalid":
+            window.db.update_api_key_status(dropped_key, "invalid")
+            discard_client(service, dropped_key)
     def on_progress(cur, total):
         if state.get('should_stop', False) or (stop_flag and stop_flag.get('stop')):
             window.table.progress_bar.setFormat('Stopping...')
@@ -395,20 +823,19 @@ def _run_next_batch(window):
         else:
             window.table.progress_bar.setFormat('Generating metadata...')
             window.table.progress_bar.setMinimum(0)
-            window.table.progress_bar.setMaximum(len(rows))
-            window.table.progress_bar.setValue(state['current'] * get_batch_size() + cur)
-            _set_gen_btn_stop_state(window, True)
+            window.table.progress_bar.setMaximum(total)
+            window.table.progress_bar.setValue(cur)
         from PySide6.QtWidgets import QApplication
         QApplication.processEvents()
     def on_finished(errors):
+        write_buffer.flush()
         if state.get('should_stop', False) or (stop_flag and stop_flag.get('stop')):
-            for row in batch:
-                filepath = row[1]
-                window.db.update_file_status(filepath, "stopped")
-                for row_idx in range(table_widget.rowCount()):
-                    item = table_widget.item(row_idx, 1)
-                    if item and item.data(Qt.UserRole) == filepath:
-                        window.table.set_row_status_color(row_idx, "stopped")
+            window.db.set_status_many(state['in_flight'], "stopped")
+            for filepath in list(state['in_flight']):
+                row_idx = _find_table_row(window, filepath)
+                if row_idx is not None:
+                    window.table.set_row_status_color(row_idx, "stopped")
+            state['in_flight'].clear()
             window.table.refresh_table()
             window.table.progress_bar.setFormat('Stopped')
             window.table.progress_bar.setValue(0)
@@ -419,49 +846,13 @@ def _run_next_batch(window):
             QApplication.processEvents()
             _on_generation_finished(window, state['errors'], stopped=True)
             return
-        cache_results = worker._results
-        for idx, result in cache_results:
-            if not isinstance(result, dict):
-                continue
-            image_path = result.get("image_path")
-            title = result.get("title")
-            description = result.get("description")
-            tags = result.get("tags")
-            token_input = result.get("token_input")
-            token_output = result.get("token_output")
-            token_total = result.get("token_total")
-            category = result.get("category")
-            if category is not None:
-                file_id = None
-                for row in batch:
-                    if row[1] == image_path:
-                        file_id = row[0]
-                        break
-                if file_id is not None and isinstance(category, dict) and len(category) > 0:
-                    window.db.save_category_mapping(file_id, category)
-            window.db.update_metadata(image_path, title, description, tags, status="success" if title else "failed")
-            window.db.insert_api_token_stats(image_path, service, model, token_input, token_output, token_total)
-        update_token_stats_ui(window)
-        for row in batch:
-            filepath = row[1]
-            for row_idx in range(table_widget.rowCount()):
-                item = table_widget.item(row_idx, 1)
-                if item and item.data(Qt.UserRole) == filepath:
-                    if any(r.get("image_path") == filepath and r.get("title") for _, r in cache_results if isinstance(r, dict)):
-                        window.table.set_row_status_color(row_idx, "success")
-                    else:
-                        window.table.set_row_status_color(row_idx, "failed")
-        window.table.refresh_table()
-        window.table.progress_bar.setFormat('Generating metadata...')
-        window.table.progress_bar.setMinimum(0)
-        window.table.progress_bar.setMaximum(len(rows))
-        _set_gen_btn_stop_state(window, True)
-        from PySide6.QtWidgets import QApplication
-        QApplication.processEvents()
-        state['current'] += 1
         if errors:
             state['errors'].extend(errors)
-        _run_next_batch(window)
+        _on_generation_finished(window, state['errors'])
+    worker.signals.row_started.connect(on_row_started)
+    worker.signals.row_finished.connect(on_row_finished)
+    worker.signals.row_usage.connect(on_row_usage)
+    worker.signals.key_dropped.connect(on_key_dropped)
     worker.signals.progress.connect(on_progress)
     worker.signals.finished.connect(on_finished)
     worker.start()
@@ -489,23 +880,34 @@ def stop_generate_metadata(window):
             from PySide6.QtWidgets import QApplication
             QApplication.processEvents()
             worker.stop()
+        if state.get('write_buffer') is not None:
+            state['write_buffer'].flush()
     window.is_generating = False
     window.table.refresh_table()
     print("[STOP] Metadata generation stopped and UI reset.")
 
 def _on_generation_finished(window, errors, stopped=False):
     window.is_generating = False
+    state = getattr(window, '_batch_processing_state', None)
+    if state and state.get('write_buffer') is not None:
+        state['write_buffer'].flush()
+    if state and state.get('job_id') is not None:
+        window.db.finish_generation_job(state['job_id'], "stopped" if stopped else "completed")
+    if state and state.get('service') == "gemini":
+        from helpers.ai_helper.gemini_cache_helper import release_prompt_caches
+        release_prompt_caches()
     _set_gen_btn_stop_state(window, False)
     table_widget = window.table.table
     if stopped:
+        stopped_paths = []
         for row in range(table_widget.rowCount()):
             status_item = table_widget.item(row, 8)
             if status_item and status_item.text().lower() == "stopping":
                 filepath_item = table_widget.item(row, 1)
                 if filepath_item:
-                    filepath = filepath_item.text()
-                    window.db.update_file_status(filepath, "stopped")
+                    stopped_paths.append(filepath_item.text())
                 window.table.set_row_status_color(row, "stopped")
+        window.db.set_status_many(stopped_paths, "stopped")
         window.table.progress_bar.setFormat('Stopped')
         window.table.progress_bar.setValue(0)
         window.table.progress_bar.setMinimum(0)
@@ -528,6 +930,51 @@ def _on_generation_finished(window, errors, stopped=False):
         for err in errors:
             print(err)
 
+def resume_interrupted_generation(window):
+    job = window.db.get_interrupted_generation_job()
+    if not job:
+        return
+    job_id = job['id']
+    if job['remaining'] == 0:
+        window.db.finish_generation_job(job_id, "completed")
+        return
+    from PySide6.QtWidgets import QMessageBox
+    answer = QMessageBox.question(
+        window,
+        "Resume Generation",
+        f"A metadata generation job started at {job['created_at']} was interrupted.\n\n"
+        f"{job['remaining']} of {job['total']} files were not finished.\n"
+        "Do you want to resume it now?",
+        QMessageBox.Yes | QMessageBox.No
+    )
+    if answer != QMessageBox.Yes:
+        window.db.abandon_generation_job(job_id)
+        window.table.refresh_table()
+        return
+    rows = []
+    missing = []
+    for row in window.db.get_unfinished_job_files(job_id):
+        if os.path.isfile(row[1]):
+            rows.append(row)
+        else:
+            missing.append((row[0], row[1], None, None, None, None, "File not found", 0, 0, 0))
+    if missing:
+        window.db.record_generation_results(job_id, job['service'], job['model'], missing)
+    service = (job['service'] or "").lower()
+    model = job['model']
+    api_key = job['api_key']
+    known_keys = [entry[1] for entry in window.db.get_all_api_keys() if (entry[0] or "").lower() == service]
+    if api_key not in known_keys:
+        api_key = known_keys[0] if known_keys else None
+    if not rows or not api_key or not model:
+        window.db.abandon_generation_job(job_id)
+        window.table.refresh_table()
+        if rows:
+            QMessageBox.warning(window, "Resume Generation", f"No {service} API key is available to resume this job.")
+        return
+    print(f"[RESUME] Resuming job {job_id}: {len(rows)} files left")
+    _start_generation(window, api_key, model, service, rows, {}, job['mode'], job_id=job_id)
+
 def update_token_stats_ui(window):
     if hasattr(window, "stats_section") and hasattr(window.stats_section, "update_token_stats"):
         token_input, token_output, token_total = window.db.get_token_stats_sum()
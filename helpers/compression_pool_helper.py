@@ -0,0 +1,91 @@
+import os
+import threading
+import multiprocessing
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from helpers.image_compression_helper import get_max_image_dimension, is_compressible_image
+from helpers.payload_cache_helper import load_payload
+
+# Decoding and JPEG encoding are CPU-bound and would serialize on the GIL inside the API worker
+# threads, so they run in a separate process pool that is kept alive for the whole session.
+_compression_pool = None
+_compression_pool_lock = threading.Lock()
+
+def get_compression_pool_size():
+    return max(1, (os.cpu_count() or 2) - 1)
+
+def get_compression_pool():
+    global _compression_pool
+    with _compression_pool_lock:
+        if _compression_pool is None:
+            # Always spawn: forking a process that already runs Qt and worker threads is unsafe.
+            _compression_pool = ProcessPoolExecutor(
+                max_workers=get_compression_pool_size(),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _compression_pool
+
+def shutdown_compression_pool():
+    global _compression_pool
+    with _compression_pool_lock:
+        pool = _compression_pool
+        _compression_pool = None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def reset_compression_pool():
+    # A worker process that dies (e.g. a decoder crash) breaks the whole pool; start a fresh one.
+    print("[Compression] Process pool is broken, restarting it")
+    shutdown_compression_pool()
+
+class CompressionPrefetcher:
+    # Keeps the next files of a job compressing in the background so the encoded payload is ready
+    # by the time an API slot frees up. Payloads stay cached until the row is finished, so a row
+    # that is requeued on another key is not compressed twice.
+    def __init__(self, service):
+        self.max_dimension = get_max_image_dimension(service)
+        self.workers = get_compression_pool_size()
+        self._futures = {}
+
+    def fill(self, pending, capacity):
+        lookahead = capacity + self.workers
+        if len(self._futures) >= lookahead:
+            return
+        pool = None
+        for row in islice(pending, lookahead):
+            if len(self._futures) >= lookahead:
+                break
+            file_id, image_path = row[0], row[1]
+            if file_id in self._futures or not is_compressible_image(image_path):
+                continue
+            if pool is None:
+                pool = get_compression_pool()
+            try:
+                self._futures[file_id] = pool.submit(load_payload, image_path, self.max_dimension)
+            except Exception as e:
+                print(f"[Compression] Failed to queue {image_path}: {e}")
+                reset_compression_pool()
+                return
+
+    def get(self, row):
+        return self._futures.get(row[0])
+
+    def discard(self, row):
+        self._futures.pop(row[0], None)
+
+    def cancel_all(self):
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+
+def wait_for_payload(future):
+    if future is None:
+        return None
+    try:
+        return future.result()
+    except Exception as e:
+        # The API helper compresses in-thread when no payload is available.
+        print(f"[Compression] Background compression failed, falling back: {e}")
+        if type(e).__name__ == "BrokenProcessPool":
+            reset_compression_pool()
+        return None
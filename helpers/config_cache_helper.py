@@ -0,0 +1,33 @@
+import os
+import json
+import threading
+from config import BASE_PATH
+
+AI_CONFIG_PATH = os.path.join(BASE_PATH, "configs", "ai_config.json")
+
+# ai_config.json is read on every file of a job (prompt, compression quality, batch size, ...),
+# so the parsed document is kept and only re-read when the file's mtime or size changes.
+# Callers must treat the returned dict as read-only; it is shared between threads.
+_config_cache = {}
+_config_cache_lock = threading.Lock()
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+def load_json_config(path):
+    signature = _file_signature(path)
+    cached = _config_cache.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    with _config_cache_lock:
+        cached = _config_cache.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        _config_cache[path] = (signature, data)
+        return data
+
+def load_ai_config():
+    return load_json_config(AI_CONFIG_PATH)
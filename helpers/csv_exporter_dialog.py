@@ -95,8 +95,7 @@ class CSVExporterDialog(QDialog):
         # Get file count for progress tracking
         from database.db_operation import ImageTeaDB
         db = ImageTeaDB()
-        files = db.get_all_files()
-        total_files = len(files)
+        total_files = db.count_files()
         
         if total_files == 0:
             from PySide6.QtWidgets import QMessageBox
@@ -75,8 +75,7 @@ class FileImportThread(QThread):
         # Get existing file paths once to avoid repeated database queries
         existing_file_paths = set()
         try:
-            existing_files = self.db.get_all_files()
-            existing_file_paths = {row[1] for row in existing_files}
+            existing_file_paths = self.db.get_existing_filepaths(self.file_paths)
         except Exception as e:
             print(f"[IMPORT WARNING] Could not load existing files: {e}")
         
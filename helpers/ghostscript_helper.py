@@ -0,0 +1,143 @@
+import os
+import re
+import ctypes
+import threading
+import subprocess
+from config import BASE_PATH
+
+# Ambil Ghostscript dari tools/ghostscript/gswin64c.exe
+GHOSTSCRIPT_PATH = os.path.join(BASE_PATH, "tools", "ghostscript", "gswin64c.exe")
+# gswin64c.exe is only a thin console wrapper around this DLL.
+GHOSTSCRIPT_DLL_PATH = os.path.join(BASE_PATH, "tools", "ghostscript", "gsdll64.dll")
+
+GS_ARG_ENCODING_UTF8 = 1
+GS_ERROR_QUIT = -101
+
+BOUNDING_BOX_PATTERN = re.compile(rb"%%(HiRes)?BoundingBox:\s*(-?[\d.]+)\s+(-?[\d.]+)\s+(-?[\d.]+)\s+(-?[\d.]+)")
+MEDIA_BOX_PATTERN = re.compile(rb"/MediaBox\s*\[\s*(-?[\d.]+)\s+(-?[\d.]+)\s+(-?[\d.]+)\s+(-?[\d.]+)\s*\]")
+DOS_EPS_MAGIC = b"\xc5\xd0\xd3\xc6"
+PAGE_SIZE_SCAN_BYTES = 1024 * 1024
+
+# Starting gswin64c.exe costs a process launch plus a full interpreter start per file, which
+# dominates on vector-heavy catalogues. The DLL is loaded once per process instead (the compression
+# pool keeps its worker processes alive) and only a fresh interpreter instance is created per file.
+# Ghostscript is not built thread-safe, so only one instance may run per process at a time.
+_gs_library = None
+_gs_library_loaded = False
+_gs_lock = threading.Lock()
+
+def _load_ghostscript_library():
+    global _gs_library, _gs_library_loaded
+    if _gs_library_loaded:
+        return _gs_library
+    _gs_library_loaded = True
+    if os.name != "nt" or not os.path.isfile(GHOSTSCRIPT_DLL_PATH):
+        return None
+    try:
+        library = ctypes.WinDLL(GHOSTSCRIPT_DLL_PATH)
+        library.gsapi_new_instance.argtypes = [ctypes.POINTER(ctypes.c_void_p), ctypes.c_void_p]
+        library.gsapi_set_arg_encoding.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        library.gsapi_init_with_args.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.POINTER(ctypes.c_char_p)]
+        library.gsapi_exit.argtypes = [ctypes.c_void_p]
+        library.gsapi_delete_instance.argtypes = [ctypes.c_void_p]
+        _gs_library = library
+    except Exception as e:
+        print(f"Ghostscript DLL unavailable, falling back to {GHOSTSCRIPT_PATH}: {e}")
+    return _gs_library
+
+def _run_with_library(library, args):
+    with _gs_lock:
+        instance = ctypes.c_void_p()
+        code = library.gsapi_new_instance(ctypes.byref(instance), None)
+        if code < 0:
+            raise RuntimeError(f"gsapi_new_instance failed with code {code}")
+        try:
+            library.gsapi_set_arg_encoding(instance, GS_ARG_ENCODING_UTF8)
+            encoded_args = [arg.encode("utf-8") for arg in args]
+            argv = (ctypes.c_char_p * len(encoded_args))(*encoded_args)
+            code = library.gsapi_init_with_args(instance, len(encoded_args), argv)
+            exit_code = library.gsapi_exit(instance)
+            if code == GS_ERROR_QUIT:
+                code = 0
+            if code == 0 and exit_code < 0:
+                code = exit_code
+            if code < 0:
+                raise RuntimeError(f"Ghostscript failed with code {code}")
+        finally:
+            library.gsapi_delete_instance(instance)
+
+def run_ghostscript(args):
+    # args[0] is the program name, exactly as for the command line.
+    library = _load_ghostscript_library()
+    if library is not None:
+        _run_with_library(library, args)
+    else:
+        subprocess.run(args, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+def _read_postscript_header(input_path):
+    with open(input_path, "rb") as f:
+        data = f.read(PAGE_SIZE_SCAN_BYTES)
+        if data.startswith(DOS_EPS_MAGIC) and len(data) >= 12:
+            # DOS EPS binary header: the PostScript section starts at the offset stored in bytes 4-8.
+            offset = int.from_bytes(data[4:8], "little")
+            f.seek(offset)
+            data = f.read(PAGE_SIZE_SCAN_BYTES)
+    return data
+
+def get_vector_page_size(input_path):
+    # Page size in points, read from the EPS bounding box or the first PDF MediaBox; None when unknown.
+    try:
+        if os.path.splitext(input_path)[1].lower() == ".pdf":
+            with open(input_path, "rb") as f:
+                match = MEDIA_BOX_PATTERN.search(f.read(PAGE_SIZE_SCAN_BYTES))
+            values = match.groups() if match else None
+        else:
+            values = None
+            for match in BOUNDING_BOX_PATTERN.finditer(_read_postscript_header(input_path)):
+                values = match.groups()[1:]
+                if match.group(1):
+                    break
+        if not values:
+            return None
+        x0, y0, x1, y1 = (float(v) for v in values)
+    except (OSError, ValueError):
+        return None
+    width, height = abs(x1 - x0), abs(y1 - y0)
+    if width <= 0 or height <= 0:
+        return None
+    return width, height
+
+def build_ghostscript_args(input_path, output_path, quality, max_dimension=None):
+    is_pdf = os.path.splitext(input_path)[1].lower() == ".pdf"
+    args = [
+        GHOSTSCRIPT_PATH,
+        "-q",
+        "-dBATCH",
+        "-dNOPAUSE",
+        "-dSAFER",
+        "-sDEVICE=jpeg",
+        f"-dJPEGQ={quality}",
+        "-dFirstPage=1",
+        "-dLastPage=1",
+    ]
+    if max_dimension:
+        # Render straight at the upload size: the page is fitted into a fixed pixel box with the
+        # artwork's aspect ratio, so nothing is rendered at 300 dpi only to be thrown away.
+        page_size = get_vector_page_size(input_path)
+        if page_size:
+            scale = max_dimension / max(page_size)
+            width = max(1, round(page_size[0] * scale))
+            height = max(1, round(page_size[1] * scale))
+        else:
+            width = height = max_dimension
+        args += [
+            f"-g{width}x{height}",
+            "-dFIXEDMEDIA",
+            "-dPDFFitPage" if is_pdf else "-dEPSFitPage",
+            "-dTextAlphaBits=4",
+            "-dGraphicsAlphaBits=4",
+        ]
+    else:
+        args.append("-r300")
+    args += [f"-sOutputFile={output_path}", input_path]
+    return args
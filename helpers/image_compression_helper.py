@@ -1,8 +1,12 @@
+import io
 import os
+import re
 import sys
-import json
-import subprocess
+import uuid
+import xml.etree.ElementTree as ET
 from PIL import Image
+from helpers.config_cache_helper import load_ai_config
+from helpers.ghostscript_helper import build_ghostscript_args, run_ghostscript
 import config
 
 BASE_PATH = config.BASE_PATH
@@ -21,20 +25,50 @@ PILLOW_FORMATS = set()
 for ext, fmt in Image.registered_extensions().items():
     PILLOW_FORMATS.add(ext.lower())
 
-# Ambil Ghostscript dari tools/ghostscript/gswin64c.exe
-GHOSTSCRIPT_PATH = os.path.join(BASE_PATH, "tools", "ghostscript", "gswin64c.exe")
+SVG_LENGTH_PATTERN = re.compile(r"\s*([\d.]+)\s*(?:px|pt|pc|mm|cm|in|em|ex)?\s*$")
+
+VIDEO_EXTENSIONS = {'.mp4', '.mpeg', '.mov', '.avi', '.flv', '.mpg', '.webm', '.wmv', '.3gp', '.3gpp'}
 
 def ensure_temp_folder():
     temp_folder = os.path.join(BASE_PATH, "temp", "images")
     os.makedirs(temp_folder, exist_ok=True)
     return temp_folder
 
+def make_temp_path(suffix):
+    # Unique per task so concurrent workers never overwrite or clean up each other's files.
+    return os.path.join(ensure_temp_folder(), f"{uuid.uuid4().hex}{suffix}")
+
 def get_compression_quality():
-    config_path = os.path.join(BASE_PATH, "configs", "ai_config.json")
-    with open(config_path, "r", encoding="utf-8") as f:
-        config_json = json.load(f)
+    config_json = load_ai_config()
     return config_json["compression_quality"]
 
+def get_max_image_dimension(service):
+    # Long edge the provider actually looks at: Gemini tiles images at 768x768 and OpenAI rescales
+    # to a 768px short side, so anything bigger only adds upload size and image tokens. 0 disables it.
+    config_json = load_ai_config()
+    return int(config_json.get("max_image_dimension", {}).get(service, 0) or 0)
+
+def fit_within(size, max_dimension):
+    width, height = size
+    if not max_dimension or max(width, height) <= max_dimension:
+        return None
+    scale = max_dimension / float(max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def downscale_image(img, max_dimension):
+    target = fit_within(img.size, max_dimension)
+    if target is None:
+        return img
+    # JPEG decoders can scale by 1/2, 1/4 or 1/8 in the DCT domain while decoding, which is far
+    # cheaper than decoding the full frame; draft() is a no-op for other formats.
+    img.draft("RGB", target)
+    factor = min(img.size[0] // target[0], img.size[1] // target[1])
+    if factor >= 2:
+        img = img.reduce(factor)
+    if img.size != target:
+        img = img.resize(target, Image.LANCZOS)
+    return img
+
 def cleanup_temp_folder():
     temp_folder = ensure_temp_folder()
     for filename in os.listdir(temp_folder):
@@ -45,19 +79,10 @@ def cleanup_temp_folder():
         except Exception as e:
             print(f"Error cleaning temp file {file_path}: {e}")
 
-def convert_eps_pdf_to_jpg(input_path, output_path, quality):
+def convert_eps_pdf_to_jpg(input_path, output_path, quality, max_dimension=None):
     try:
-        args = [
-            GHOSTSCRIPT_PATH,
-            "-dBATCH",
-            "-dNOPAUSE",
-            "-sDEVICE=jpeg",
-            f"-dJPEGQ={quality}",
-            "-r300",
-            f"-sOutputFile={output_path}",
-            input_path
-        ]
-        subprocess.run(args, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        args = build_ghostscript_args(input_path, output_path, quality, max_dimension)
+        run_ghostscript(args)
         if os.path.exists(output_path):
             return output_path
         else:
@@ -67,46 +92,104 @@ def convert_eps_pdf_to_jpg(input_path, output_path, quality):
         print(f"Ghostscript error: {e}")
         return None
 
-def convert_svg_to_jpg(input_path, output_path, quality):
+def convert_eps_pdf_to_jpeg_bytes(input_path, quality, max_dimension=None):
+    # Ghostscript can only write to a file, so it gets a unique temp file that is removed right away.
+    output_path = make_temp_path(".jpg")
+    try:
+        if not convert_eps_pdf_to_jpg(input_path, output_path, quality, max_dimension):
+            return None
+        with open(output_path, "rb") as f:
+            return f.read()
+    finally:
+        try:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+        except Exception as e:
+            print(f"Error cleaning temp file {output_path}: {e}")
+
+def get_svg_aspect_ratio(input_path):
+    # Width / height of the root <svg>, from its viewBox or plain width/height; None when unknown.
     try:
-        import cairosvg
-        temp_png = output_path.replace(".jpg", ".png")
-        cairosvg.svg2png(url=input_path, write_to=temp_png)
-        with Image.open(temp_png) as img:
-            rgb_img = img.convert("RGB")
-            rgb_img.save(output_path, "JPEG", quality=quality, optimize=True)
-        os.remove(temp_png)
-        return output_path
+        with open(input_path, "rb") as f:
+            for _, element in ET.iterparse(f, events=("start",)):
+                view_box = element.get("viewBox")
+                if view_box:
+                    parts = view_box.replace(",", " ").split()
+                    if len(parts) == 4 and float(parts[2]) > 0 and float(parts[3]) > 0:
+                        return float(parts[2]) / float(parts[3])
+                width = SVG_LENGTH_PATTERN.match(element.get("width") or "")
+                height = SVG_LENGTH_PATTERN.match(element.get("height") or "")
+                if width and height and float(height.group(1)) > 0:
+                    return float(width.group(1)) / float(height.group(1))
+                return None
+    except (ET.ParseError, OSError, ValueError):
+        return None
+    return None
+
+def convert_svg_to_png_bytes(input_path, max_dimension=None):
+    import cairosvg
+    size = {}
+    if max_dimension:
+        # Cairo renders straight at the requested long edge and keeps the aspect ratio when only
+        # one side is given. Small icons are rendered up to the target too, vectors scale cleanly.
+        aspect_ratio = get_svg_aspect_ratio(input_path)
+        if aspect_ratio is not None and aspect_ratio < 1:
+            size["output_height"] = max_dimension
+        else:
+            size["output_width"] = max_dimension
+    return cairosvg.svg2png(url=input_path, **size)
+
+def convert_svg_to_jpeg_bytes(input_path, quality, max_dimension=None):
+    try:
+        png_bytes = convert_svg_to_png_bytes(input_path, max_dimension)
+        with Image.open(io.BytesIO(png_bytes)) as img:
+            return encode_jpeg(downscale_image(img, max_dimension), quality)
     except Exception as e:
         print(f"CairoSVG error: {e}")
         return None
 
-def compress_and_save_image(image_path):
-    cleanup_temp_folder()
-    temp_folder = ensure_temp_folder()
+def render_vector_to_bytes(input_path, max_dimension):
+    # Encoded raster for SVG/EPS/PDF previews, rendered at the size the view needs without temp files.
+    ext = os.path.splitext(input_path)[1].lower()
+    if ext == ".svg":
+        try:
+            return convert_svg_to_png_bytes(input_path, max_dimension)
+        except Exception as e:
+            print(f"CairoSVG error: {e}")
+            return None
+    if ext in (".eps", ".pdf"):
+        return convert_eps_pdf_to_jpeg_bytes(input_path, get_compression_quality(), max_dimension)
+    return None
+
+def encode_jpeg(img, quality):
+    buffer = io.BytesIO()
+    img.convert("RGB").save(buffer, "JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+def is_video_file(image_path):
+    return os.path.splitext(image_path)[1].lower() in VIDEO_EXTENSIONS
+
+def is_compressible_image(image_path):
+    ext = os.path.splitext(image_path)[1].lower()
+    if ext in VIDEO_EXTENSIONS:
+        return False
+    return ext in (".eps", ".pdf", ".svg") or ext in PILLOW_FORMATS
+
+def compress_image_to_bytes(image_path, max_dimension=None):
     quality = get_compression_quality()
     ext = os.path.splitext(image_path)[1].lower()
-    filename = os.path.splitext(os.path.basename(image_path))[0] + ".jpg"
-    save_path = os.path.join(temp_folder, filename)
 
     if ext in (".eps", ".pdf"):
-        return convert_eps_pdf_to_jpg(image_path, save_path, quality)
+        return convert_eps_pdf_to_jpeg_bytes(image_path, quality, max_dimension)
     elif ext == ".svg":
-        return convert_svg_to_jpg(image_path, save_path, quality)
+        return convert_svg_to_jpeg_bytes(image_path, quality, max_dimension)
     elif ext in PILLOW_FORMATS:
         try:
             with Image.open(image_path) as img:
-                rgb_img = img.convert("RGB")
-                rgb_img.save(
-                    save_path,
-                    "JPEG",
-                    quality=quality,
-                    optimize=True
-                )
-                return save_path
+                return encode_jpeg(downscale_image(img, max_dimension), quality)
         except Exception as e:
             print(f"Error compressing image: {e}")
             return None
     else:
         print(f"Error: File extension {ext} is not supported by Pillow or converters.")
-        return None
\ No newline at end of file
+        return None
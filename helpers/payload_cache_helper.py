@@ -0,0 +1,134 @@
+import os
+import uuid
+import hashlib
+import threading
+from config import BASE_PATH
+from helpers.config_cache_helper import load_ai_config
+from helpers.image_compression_helper import compress_image_to_bytes, get_compression_quality
+
+PAYLOAD_CACHE_DIR = os.path.join(BASE_PATH, "temp", "payload_cache")
+# Bump when the preprocessing pipeline changes so stale payloads are not reused.
+PAYLOAD_FORMAT = "jpeg-v3"
+
+# Encoded upload payloads are stored under a key derived from the source file's content plus the
+# preprocessing parameters, so reruns ("failed" mode, regenerating after a prompt tweak) skip
+# decoding and encoding entirely. The cache is shared by the compression worker processes:
+# entries are written atomically, a hit refreshes the file mtime, and whichever process has
+# written enough new data trims the oldest entries back under the byte budget.
+_digests = {}
+_cache_lock = threading.Lock()
+_bytes_since_trim = 0
+
+def get_payload_cache_budget():
+    config_json = load_ai_config()
+    return max(0, int(config_json.get("payload_cache_mb", 512))) * 1024 * 1024
+
+def get_file_digest(path):
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    digest = _digests.get(memo_key)
+    if digest is None:
+        hasher = hashlib.blake2b(digest_size=20)
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        _digests[memo_key] = digest
+    return digest
+
+def get_payload_key(image_path, max_dimension, quality):
+    raw = f"{get_file_digest(image_path)}|{int(max_dimension or 0)}|{quality}|{PAYLOAD_FORMAT}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def _payload_path(key):
+    return os.path.join(PAYLOAD_CACHE_DIR, f"{key}.jpg")
+
+def read_cached_payload(key):
+    path = _payload_path(key)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        print(f"[PayloadCache] Failed to read {path}: {e}")
+        return None
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+    return data or None
+
+def write_cached_payload(key, data, budget):
+    global _bytes_since_trim
+    path = _payload_path(key)
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.makedirs(PAYLOAD_CACHE_DIR, exist_ok=True)
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"[PayloadCache] Failed to write {path}: {e}")
+        try:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        except OSError:
+            pass
+        return
+    with _cache_lock:
+        _bytes_since_trim += len(data)
+        should_trim = _bytes_since_trim >= budget // 10
+        if should_trim:
+            _bytes_since_trim = 0
+    if should_trim:
+        trim_payload_cache(budget)
+
+def trim_payload_cache(budget=None):
+    if budget is None:
+        budget = get_payload_cache_budget()
+    entries = []
+    try:
+        with os.scandir(PAYLOAD_CACHE_DIR) as it:
+            for entry in it:
+                if not entry.name.endswith(".jpg"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except FileNotFoundError:
+        return
+    total = sum(size for _, size, _ in entries)
+    if total <= budget:
+        return
+    # Least recently used first; trim a little below the budget so the next writes do not
+    # immediately trigger another pass.
+    target = budget * 9 // 10
+    entries.sort()
+    for mtime, size, path in entries:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+def load_payload(image_path, max_dimension=None):
+    budget = get_payload_cache_budget()
+    if budget <= 0:
+        return compress_image_to_bytes(image_path, max_dimension)
+    try:
+        key = get_payload_key(image_path, max_dimension, get_compression_quality())
+    except OSError as e:
+        print(f"[PayloadCache] Failed to hash {image_path}: {e}")
+        return compress_image_to_bytes(image_path, max_dimension)
+    data = read_cached_payload(key)
+    if data is not None:
+        return data
+    data = compress_image_to_bytes(image_path, max_dimension)
+    if data:
+        write_cached_payload(key, data, budget)
+    return data
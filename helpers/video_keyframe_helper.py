@@ -0,0 +1,127 @@
+from helpers.config_cache_helper import load_ai_config
+
+# Candidate frames sampled per requested keyframe; the scene-change pass picks among them.
+CANDIDATES_PER_KEYFRAME = 4
+# Frames darker than this mean (0-255) are fades or black slates and are never picked.
+MIN_FRAME_BRIGHTNESS = 12
+# Skip the first and last few percent where fades and slates usually sit.
+EDGE_MARGIN = 0.03
+
+def get_video_mode():
+    # "upload" sends the whole clip (Gemini only), "keyframes" sends a few sampled frames.
+    config_json = load_ai_config()
+    mode = str(config_json.get("video_mode", "upload")).lower()
+    return mode if mode in ("upload", "keyframes") else "upload"
+
+def get_keyframe_settings():
+    config_json = load_ai_config()
+    return (
+        max(1, int(config_json.get("keyframe_count", 6))),
+        max(64, int(config_json.get("keyframe_max_dimension", 512))),
+        int(config_json["compression_quality"])
+    )
+
+def keyframe_prompt_note(frame_count):
+    return (
+        f"The {frame_count} images are keyframes sampled in chronological order from a single video clip. "
+        "Write the metadata for the video as a whole, not for an individual still image.\n\n"
+    )
+
+def _frame_signature(cv2, frame):
+    small = cv2.resize(frame, (64, 36), interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, [16, 8], [0, 180, 0, 256])
+    cv2.normalize(hist, hist)
+    brightness = float(small.mean())
+    return hist, brightness
+
+def _read_candidates(cv2, cap, frame_count, candidate_count):
+    start = int(frame_count * EDGE_MARGIN)
+    end = max(start + 1, int(frame_count * (1 - EDGE_MARGIN)))
+    step = max(1, (end - start) // candidate_count)
+    candidates = []
+    for position in range(start, end, step):
+        if len(candidates) >= candidate_count:
+            break
+        cap.set(cv2.CAP_PROP_POS_FRAMES, position)
+        ok, frame = cap.read()
+        if not ok or frame is None:
+            continue
+        candidates.append((position, frame))
+    return candidates
+
+def _read_sequential(cap, candidate_count, stride):
+    # Fallback for containers that report no frame count or cannot seek.
+    candidates = []
+    position = 0
+    while len(candidates) < candidate_count:
+        ok, frame = cap.read()
+        if not ok or frame is None:
+            break
+        if position % stride == 0:
+            candidates.append((position, frame))
+        position += 1
+    return candidates
+
+def select_keyframes(cv2, candidates, count):
+    # Score every candidate by how different it is from the previous one (HSV histogram distance),
+    # then keep the strongest scene changes while spreading picks over the clip.
+    scored = []
+    previous_hist = None
+    for index, (position, frame) in enumerate(candidates):
+        hist, brightness = _frame_signature(cv2, frame)
+        if brightness < MIN_FRAME_BRIGHTNESS:
+            continue
+        if previous_hist is None:
+            change = 1.0
+        else:
+            change = cv2.compareHist(previous_hist, hist, cv2.HISTCMP_BHATTACHARYYA)
+        previous_hist = hist
+        scored.append((change, index, position, frame))
+    if not scored:
+        scored = [(0.0, index, position, frame) for index, (position, frame) in enumerate(candidates)]
+    if len(scored) <= count:
+        return [frame for _, _, _, frame in scored]
+    min_gap = max(1, len(candidates) // (count * 2))
+    chosen = []
+    for change, index, position, frame in sorted(scored, key=lambda item: item[0], reverse=True):
+        if all(abs(index - other[1]) >= min_gap for other in chosen):
+            chosen.append((change, index, position, frame))
+        if len(chosen) >= count:
+            break
+    chosen.sort(key=lambda item: item[1])
+    return [frame for _, _, _, frame in chosen]
+
+def _encode_frame(cv2, frame, max_dimension, quality):
+    height, width = frame.shape[:2]
+    scale = max_dimension / float(max(width, height))
+    if scale < 1:
+        frame = cv2.resize(frame, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    return buffer.tobytes() if ok else None
+
+def extract_keyframes(video_path, count=None, max_dimension=None, quality=None):
+    import cv2
+    default_count, default_dimension, default_quality = get_keyframe_settings()
+    count = count or default_count
+    max_dimension = max_dimension or default_dimension
+    quality = quality or default_quality
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            print(f"Keyframe error: cannot open video {video_path}")
+            return []
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        candidate_count = count * CANDIDATES_PER_KEYFRAME
+        candidates = []
+        if frame_count > 0:
+            candidates = _read_candidates(cv2, cap, frame_count, candidate_count)
+        if not candidates:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            fps = cap.get(cv2.CAP_PROP_FPS) or 25
+            candidates = _read_sequential(cap, candidate_count, max(1, int(fps)))
+    finally:
+        cap.release()
+    frames = select_keyframes(cv2, candidates, count)
+    encoded = [_encode_frame(cv2, frame, max_dimension, quality) for frame in frames]
+    return [data for data in encoded if data]
@@ -0,0 +1,107 @@
+import os
+import ssl
+import sys
+import json
+import time
+import argparse
+import statistics
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import OpenAI, DefaultHttpxClient
+from helpers.ai_helper.client_registry_helper import get_client
+
+# Compares a new OpenAI client per request with the shared client from client_registry_helper,
+# against a local keep-alive stand-in for the Responses API. Plain HTTP by default; pass a
+# self-signed --cert/--key to include the TLS handshake a new client pays on every request, e.g.
+#   openssl req -x509 -newkey rsa:2048 -nodes -subj /CN=127.0.0.1 -addext subjectAltName=IP:127.0.0.1 \
+#     -keyout key.pem -out cert.pem
+#   python tools/bench_client_reuse.py --cert cert.pem --key key.pem
+
+RESPONSE = {
+    "id": "resp_bench",
+    "object": "response",
+    "created_at": 0,
+    "model": "bench",
+    "status": "completed",
+    "output": [{
+        "type": "message",
+        "id": "msg_bench",
+        "role": "assistant",
+        "status": "completed",
+        "content": [{"type": "output_text", "text": "{\"title\": \"bench\"}", "annotations": []}],
+    }],
+    "usage": {
+        "input_tokens": 1,
+        "output_tokens": 1,
+        "total_tokens": 2,
+        "input_tokens_details": {"cached_tokens": 0},
+        "output_tokens_details": {"reasoning_tokens": 0},
+    },
+    "parallel_tool_calls": True,
+    "tool_choice": "auto",
+    "tools": [],
+}
+
+class ResponsesHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send headers and body in one write; two small writes on a kept-alive socket stall on
+    # Nagle and delayed ACKs (~40 ms) and would hide the difference being measured.
+    wbufsize = 65536
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        body = json.dumps(RESPONSE).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_server(cert=None, key=None):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ResponsesHandler)
+    scheme = "http"
+    if cert:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"{scheme}://127.0.0.1:{server.server_address[1]}/v1"
+
+def measure(get_openai_client, requests):
+    get_openai_client().responses.create(model="bench", input="warm up")
+    timings = []
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        get_openai_client().responses.create(model="bench", input="bench")
+        timings.append((time.perf_counter() - t0) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.9)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark provider client reuse")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--cert")
+    parser.add_argument("--key")
+    args = parser.parse_args()
+
+    base_url = start_server(args.cert, args.key)
+    verify = args.cert if args.cert else True
+    make_client = lambda: OpenAI(api_key="bench", base_url=base_url, max_retries=0,
+                                 http_client=DefaultHttpxClient(verify=verify))
+    print(f"[Bench] {args.requests} sequential responses.create calls against {base_url}")
+    for label, get_openai_client in (
+        ("new client per request", make_client),
+        ("shared registry client", lambda: get_client("openai", "bench", make_client)),
+    ):
+        median, p90 = measure(get_openai_client, args.requests)
+        print(f"[Bench] {label}: median {median:.2f} ms, p90 {p90:.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import re
+import sys
+import json
+import itertools
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+
+# Local stand-in for the Gemini and OpenAI batch APIs, for trying the offline batch job mode without
+# an account or a 24h wait. Start it with "python tools/fake_batch_server.py [port]" and point
+# batch_job.base_url in configs/ai_config.json at it (the URLs are printed on start). Every job
+# finishes on its second poll; a file whose name starts with "bad" gets a per-request error.
+
+FILES = {}
+BATCHES = {}
+UPLOAD_SESSIONS = {}
+_ids = itertools.count(1)
+_lock = threading.Lock()
+
+def _next_id():
+    with _lock:
+        return next(_ids)
+
+def _fake_metadata(prompt):
+    match = re.search(r"Filename: (\S+)", prompt)
+    filename = match.group(1) if match else "unknown"
+    meta = {
+        "title": f"Fake title for {filename}",
+        "description": "Fake description from the local batch server",
+        "tags": ["fake", "batch", "tag"],
+        "category": {"shutterstock": {"primary": 1, "secondary": 2}, "adobe_stock": 3},
+    }
+    return meta, filename
+
+def _iter_jsonl(data):
+    for line in data.decode("utf-8").splitlines():
+        if line.strip():
+            yield json.loads(line)
+
+def run_gemini_batch(payload):
+    lines = []
+    for request in _iter_jsonl(payload):
+        prompt = request["request"]["contents"][0]["parts"][-1]["text"]
+        meta, filename = _fake_metadata(prompt)
+        if filename.startswith("bad"):
+            lines.append({"key": request["key"], "error": {"code": 400, "message": "Rejected by the fake batch server"}})
+            continue
+        lines.append({
+            "key": request["key"],
+            "response": {
+                "candidates": [{"content": {"parts": [{"text": json.dumps(meta)}]}}],
+                "usageMetadata": {"promptTokenCount": 1200, "candidatesTokenCount": 150, "totalTokenCount": 1350},
+            },
+        })
+    return "\n".join(json.dumps(line) for line in lines).encode("utf-8")
+
+def run_openai_batch(payload):
+    output = []
+    errors = []
+    for request in _iter_jsonl(payload):
+        prompt = request["body"]["input"][0]["content"][0]["text"]
+        meta, filename = _fake_metadata(prompt)
+        if filename.startswith("bad"):
+            errors.append({
+                "id": f"req_{_next_id()}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 400, "body": {"error": {"message": "Rejected by the fake batch server"}}},
+                "error": None,
+            })
+            continue
+        output.append({
+            "id": f"req_{_next_id()}",
+            "custom_id": request["custom_id"],
+            "response": {
+                "status_code": 200,
+                "body": {
+                    "output": [{"type": "message", "content": [{"type": "output_text", "text": json.dumps(meta)}]}],
+                    "usage": {"input_tokens": 1100, "output_tokens": 140, "total_tokens": 1240},
+                },
+            },
+            "error": None,
+        })
+    encode = lambda lines: "\n".join(json.dumps(line) for line in lines).encode("utf-8")
+    return encode(output), encode(errors)
+
+class FakeBatchHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        print(f"[FakeBatch] {self.command} {self.path}")
+
+    def _send_json(self, obj, headers=None, code=200):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_raw(self, data):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _gemini_job(self, name):
+        batch = BATCHES[name]
+        metadata = {"name": name, "displayName": batch["display_name"], "state": "BATCH_STATE_RUNNING"}
+        if batch["polls"] >= 2:
+            output_name = f"files/out{name.split('/')[1]}"
+            if output_name not in FILES:
+                FILES[output_name] = run_gemini_batch(FILES[batch["input"]])
+            metadata["state"] = "BATCH_STATE_SUCCEEDED"
+            metadata["output"] = {"responsesFile": output_name}
+        return {"name": name, "metadata": metadata}
+
+    def _openai_batch(self, batch_id):
+        batch = BATCHES[batch_id]
+        status = "in_progress"
+        output_file_id = error_file_id = None
+        if batch["polls"] >= 2:
+            output_file_id, error_file_id = f"file-out-{batch_id}", f"file-err-{batch_id}"
+            if output_file_id not in FILES:
+                FILES[output_file_id], FILES[error_file_id] = run_openai_batch(FILES[batch["input"]])
+            status = "completed"
+        return {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": "/v1/responses",
+            "input_file_id": batch["input"],
+            "completion_window": "24h",
+            "status": status,
+            "created_at": 0,
+            "output_file_id": output_file_id,
+            "error_file_id": error_file_id,
+            "metadata": batch["metadata"],
+        }
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._read_body()
+        # Gemini: resumable file upload, then batchGenerateContent.
+        if path.startswith("/upload/v1beta/files"):
+            session_id = _next_id()
+            UPLOAD_SESSIONS[session_id] = b""
+            upload_url = f"http://{self.headers['Host']}/upload-session/{session_id}"
+            return self._send_json({}, {"x-goog-upload-url": upload_url, "x-goog-upload-status": "active"})
+        if path.startswith("/upload-session/"):
+            session_id = int(path.rsplit("/", 1)[1])
+            UPLOAD_SESSIONS[session_id] += body
+            name = f"files/in{session_id}"
+            FILES[name] = UPLOAD_SESSIONS[session_id]
+            return self._send_json({"file": {"name": name, "state": "ACTIVE"}}, {"x-goog-upload-status": "final"})
+        if path.endswith(":batchGenerateContent"):
+            request = json.loads(body)["batch"]
+            name = f"batches/{_next_id()}"
+            BATCHES[name] = {"input": request["inputConfig"]["fileName"], "display_name": request.get("displayName"), "polls": 0}
+            return self._send_json({"name": name, "metadata": {"name": name, "displayName": request.get("displayName"), "state": "BATCH_STATE_PENDING"}})
+        # OpenAI: multipart file upload, then a batch over it.
+        if path == "/v1/files":
+            boundary = self.headers["Content-Type"].split("boundary=")[1].encode()
+            part = [part for part in body.split(b"--" + boundary) if b'name="file"' in part][0]
+            data = part.split(b"\r\n\r\n", 1)[1].rsplit(b"\r\n", 1)[0]
+            file_id = f"file-{_next_id()}"
+            FILES[file_id] = data
+            return self._send_json({"id": file_id, "object": "file", "bytes": len(data), "created_at": 0, "filename": "input.jsonl", "purpose": "batch", "status": "processed"})
+        if path == "/v1/batches":
+            request = json.loads(body)
+            batch_id = f"batch_{_next_id()}"
+            BATCHES[batch_id] = {"input": request["input_file_id"], "metadata": request.get("metadata") or {}, "polls": 0}
+            return self._send_json(self._openai_batch(batch_id))
+        self._send_json({"error": {"message": f"Unknown endpoint {path}"}}, code=404)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/v1beta/batches":
+            jobs = [self._gemini_job(name) for name in BATCHES if name.startswith("batches/")]
+            return self._send_json({"operations": jobs})
+        match = re.match(r"/v1beta/(batches/\d+)$", path)
+        if match:
+            BATCHES[match.group(1)]["polls"] += 1
+            return self._send_json(self._gemini_job(match.group(1)))
+        if ":download" in path:
+            name = "files/" + path.split("/files/")[1].split(":")[0]
+            return self._send_raw(FILES[name])
+        if path == "/v1/batches":
+            batches = [self._openai_batch(batch_id) for batch_id in BATCHES if batch_id.startswith("batch_")]
+            return self._send_json({"object": "list", "data": batches, "has_more": False})
+        match = re.match(r"/v1/batches/(\w+)$", path)
+        if match:
+            BATCHES[match.group(1)]["polls"] += 1
+            return self._send_json(self._openai_batch(match.group(1)))
+        match = re.match(r"/v1/files/([\w-]+)/content$", path)
+        if match:
+            return self._send_raw(FILES[match.group(1)])
+        self._send_json({"error": {"message": f"Unknown endpoint {path}"}}, code=404)
+
+def start_server(port=0):
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeBatchHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeBatchHandler)
+    print("[FakeBatch] Set batch_job.base_url in configs/ai_config.json to:")
+    print(f'[FakeBatch]   "gemini": "http://127.0.0.1:{port}"')
+    print(f'[FakeBatch]   "openai": "http://127.0.0.1:{port}/v1"')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -1,6 +1,9 @@
-from PySide6.QtWidgets import QWidget, QHBoxLayout, QComboBox, QLabel, QSpacerItem, QSizePolicy, QPushButton
+from PySide6.QtWidgets import QWidget, QHBoxLayout, QComboBox, QLabel, QSpacerItem, QSizePolicy, QPushButton, QCheckBox
 from PySide6.QtCore import Signal, Slot, QUrl
 from PySide6.QtGui import QDesktopServices
+import json
+import os
+from config import BASE_PATH
 
 class ApiKeySectionWidget(QWidget):
     api_key_changed = Signal(str, str, str)  # api_key, service, model
@@ -29,6 +32,13 @@ class ApiKeySectionWidget(QWidget):
         self.api_key_combo.setMaximumWidth(550)
         layout.addWidget(self.api_key_combo)
 
+        self.use_all_keys_check = QCheckBox("Use all keys")
+        self.use_all_keys_check.setToolTip(
+            "Spread the generation job across every active API key of the selected service.\n"
+            "Keys that run out of quota during the job are skipped automatically."
+        )
+        layout.addWidget(self.use_all_keys_check)
+
         self.tested_label = QLabel()
         self.get_api_btn = QPushButton("Get FREE API Key")
         self.get_api_btn.setVisible(False)
@@ -53,12 +63,37 @@ class ApiKeySectionWidget(QWidget):
         self.model_combo.currentIndexChanged.connect(self._on_model_combo_changed)
         self.api_key_combo.currentIndexChanged.connect(self._on_api_combo_changed)
 
+        self.config_path = os.path.join(BASE_PATH, "configs", "ai_config.json")
+        self._load_use_all_keys()
+        self.use_all_keys_check.toggled.connect(self._save_use_all_keys)
+
         self._populate_models()
         if self.model_combo.count() > 0:
             self._on_model_combo_changed(self.model_combo.currentIndex())
         else:
             self._refresh_api_key_combo(None)
 
+    def _load_use_all_keys(self):
+        try:
+            with open(self.config_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.use_all_keys_check.setChecked(bool(data.get("use_all_api_keys", False)))
+        except Exception as e:
+            print(f"Failed to load multi-key setting: {e}")
+
+    def _save_use_all_keys(self, checked):
+        try:
+            with open(self.config_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            data = {}
+        data["use_all_api_keys"] = bool(checked)
+        try:
+            with open(self.config_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+        except Exception as e:
+            print(f"Failed to save multi-key setting: {e}")
+
     def eventFilter(self, obj, event):
         from PySide6.QtCore import QEvent
         if obj == self.model_combo and event.type() == QEvent.MouseButtonPress:
@@ -165,6 +200,9 @@ class ApiKeySectionWidget(QWidget):
     def get_current_model(self):
         return self.selected_model_name
 
+    def get_use_all_keys(self):
+        return self.use_all_keys_check.isChecked()
+
     def refresh(self):
         self._populate_models()
         if self.model_combo.count() > 0:
@@ -8,6 +8,7 @@ import os
 import subprocess
 from helpers.file_importer import import_files
 from helpers.metadata_helper.metadata_operation import write_metadata_to_images, write_metadata_to_videos
+from helpers.batch_job_helper import submit_batch_job, check_batch_jobs
 from dialogs.csv_exporter_dialog import CSVExporterDialog
 from dialogs.edit_prompt_dialog import EditPromptDialog
 from dialogs.custom_prompt_dialog import CustomPromptDialog
@@ -133,6 +134,19 @@ def setup_main_menu(window):
     export_metadata_action.triggered.connect(show_export_dialog)
     metadata_menu.addAction(export_metadata_action)
 
+    metadata_menu.addSeparator()
+    submit_batch_job_action = QAction(qta.icon('fa6s.clock'), "Submit as Batch Job (Offline)", window)
+    def do_submit_batch_job():
+        submit_batch_job(window)
+    submit_batch_job_action.triggered.connect(do_submit_batch_job)
+    metadata_menu.addAction(submit_batch_job_action)
+
+    check_batch_jobs_action = QAction(qta.icon('fa6s.rotate'), "Check Batch Jobs Now", window)
+    def do_check_batch_jobs():
+        check_batch_jobs(window)
+    check_batch_jobs_action.triggered.connect(do_check_batch_jobs)
+    metadata_menu.addAction(check_batch_jobs_action)
+
     prompt_menu = QMenu("Prompt", menubar)
     edit_prompt_action = QAction(qta.icon('fa6s.pen-to-square'), "Edit Prompt", window)
     def open_edit_prompt():
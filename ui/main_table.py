@@ -532,6 +532,9 @@ class ImageTableWidget(QWidget):
         self.table.customContextMenuRequested.connect(self._show_context_menu)
         self.table.cellDoubleClicked.connect(self._on_cell_double_clicked)
         self._all_rows_cache = []
+        self._visible_rows = []
+        self._search_text = None
+        self._search_results = []
         self.grid_manager = GridManager()
         self.grid_manager.set_status_color_func(self._status_color)
         self.grid_manager.setup_grid_click_handler(self.thumbnail_content, self._on_thumbnail_clicked)
@@ -578,57 +581,58 @@ class ImageTableWidget(QWidget):
 
     def _filter_table(self, text):
         text = text.strip().lower()
-        if not text:
-            self._all_rows_cache = list(self.db.get_all_files())
         if not self._all_rows_cache:
             self._all_rows_cache = list(self.db.get_all_files())
         self.table.setRowCount(0)
-        for row in self._all_rows_cache:
-            if not text or self._row_matches_search(row, text):
-                row_idx = self.table.rowCount()
-                self.table.insertRow(row_idx)
-                checkbox_item = QTableWidgetItem()
-                checkbox_item.setFlags(Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
-                checkbox_item.setCheckState(Qt.Unchecked)
-                checkbox_item.setData(Qt.UserRole, row[0])
-                self.table.setItem(row_idx, 0, checkbox_item)
-                display_values = list(row[1:7])
-                if len(display_values) > 0:
-                    short_fp = self._shorten_filepath(display_values[0])
-                    fp_item = QTableWidgetItem(short_fp)
-                    fp_item.setData(Qt.UserRole, display_values[0])
-                    self.table.setItem(row_idx, 1, fp_item)
-                    for col, val in enumerate(display_values[1:], start=2):
-                        item = QTableWidgetItem(str(val) if val is not None else "")
-                        if col == 2:
-                            item.setTextAlignment(Qt.AlignCenter)
-                        self.table.setItem(row_idx, col, item)
-                title_val = row[3] if len(row) > 3 and row[3] is not None else ""
-                title_len = len(title_val)
-                title_len_item = QTableWidgetItem(str(title_len))
-                title_len_item.setTextAlignment(Qt.AlignCenter)
-                self.table.setItem(row_idx, 6, title_len_item)
-                tags_val = row[5] if len(row) > 5 and row[5] is not None else ""
-                tag_count = len([t for t in tags_val.split(",") if t.strip()]) if tags_val else 0
-                tag_count_item = QTableWidgetItem(str(tag_count))
-                tag_count_item.setTextAlignment(Qt.AlignCenter)
-                self.table.setItem(row_idx, 7, tag_count_item)
-                status_val = row[6] if len(row) > 6 and row[6] is not None else ""
-                status_item = QTableWidgetItem(str(status_val))
-                status_item.setTextAlignment(Qt.AlignCenter)
-                self.table.setItem(row_idx, 8, status_item)
-                color = self._status_color(status_val)
-                for col in range(self.table.columnCount()):
-                    item = self.table.item(row_idx, col)
-                    if item:
-                        item.setBackground(QBrush(color))
+        rows = self._search_rows(text) if text else self._all_rows_cache
+        self._visible_rows = rows
+        for row in rows:
+            row_idx = self.table.rowCount()
+            self.table.insertRow(row_idx)
+            checkbox_item = QTableWidgetItem()
+            checkbox_item.setFlags(Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
+            checkbox_item.setCheckState(Qt.Unchecked)
+            checkbox_item.setData(Qt.UserRole, row[0])
+            self.table.setItem(row_idx, 0, checkbox_item)
+            display_values = list(row[1:7])
+            if len(display_values) > 0:
+                short_fp = self._shorten_filepath(display_values[0])
+                fp_item = QTableWidgetItem(short_fp)
+                fp_item.setData(Qt.UserRole, display_values[0])
+                self.table.setItem(row_idx, 1, fp_item)
+                for col, val in enumerate(display_values[1:], start=2):
+                    item = QTableWidgetItem(str(val) if val is not None else "")
+                    if col == 2:
+                        item.setTextAlignment(Qt.AlignCenter)
+                    self.table.setItem(row_idx, col, item)
+            title_val = row[3] if len(row) > 3 and row[3] is not None else ""
+            title_len = len(title_val)
+            title_len_item = QTableWidgetItem(str(title_len))
+            title_len_item.setTextAlignment(Qt.AlignCenter)
+            self.table.setItem(row_idx, 6, title_len_item)
+            tags_val = row[5] if len(row) > 5 and row[5] is not None else ""
+            tag_count = len([t for t in tags_val.split(",") if t.strip()]) if tags_val else 0
+            tag_count_item = QTableWidgetItem(str(tag_count))
+            tag_count_item.setTextAlignment(Qt.AlignCenter)
+            self.table.setItem(row_idx, 7, tag_count_item)
+            status_val = row[6] if len(row) > 6 and row[6] is not None else ""
+            status_item = QTableWidgetItem(str(status_val))
+            status_item.setTextAlignment(Qt.AlignCenter)
+            self.table.setItem(row_idx, 8, status_item)
+            color = self._status_color(status_val)
+            for col in range(self.table.columnCount()):
+                item = self.table.item(row_idx, col)
+                if item:
+                    item.setBackground(QBrush(color))
         self._emit_stats()
 
-    def _row_matches_search(self, row, text):
-        for value in row[1:6]:
-            if value and text in str(value).lower():
-                return True
-        return False
+    def _search_rows(self, text):
+        # Ranked FTS5 query in SQLite, run once per search text; the thumbnail and details tabs
+        # reuse the table's result.
+        if text != self._search_text:
+            self._search_results = self.db.search_files(text)
+            self._search_text = text
+        return self._search_results
 
     def _shorten_filepath(self, path):
         if not path:
@@ -737,6 +741,8 @@ class ImageTableWidget(QWidget):
                         row_list[6] = status
                         self._all_rows_cache[i] = tuple(row_list)
                     break
+            # Search results carry their own copy of the row; query again on the next refresh.
+            self._search_text = None
 
     def _status_color(self, status):
         if status == "processing":
@@ -751,6 +757,8 @@ class ImageTableWidget(QWidget):
             return QColor(200, 40, 40, int(0.18 * 255))
         elif status == "draft":
             return QColor(120, 120, 120, int(0.18 * 255))
+        elif status == "queued":
+            return QColor(60, 140, 230, int(0.2 * 255))
         return QColor(0, 0, 0, int(0.1 * 255))
 
     def update_row_data(self, row_idx, row_data):
@@ -778,6 +786,7 @@ class ImageTableWidget(QWidget):
 
     def refresh_table(self):
         self._all_rows_cache = list(self.db.get_all_files())
+        self._search_text = None
         self._filter_table(self.search_edit.text())
         total_files = self.table.rowCount()
         if total_files >= 100:
@@ -807,9 +816,9 @@ class ImageTableWidget(QWidget):
         files = []
         text = self.search_edit.text().strip().lower()
         if not text:
-            files = list(self.db.get_all_files())
+            files = list(self._all_rows_cache)
         else:
-            files = [row for row in self._all_rows_cache if self._row_matches_search(row, text)]
+            files = self._search_rows(text)
         files_data = []
         for row in files:
             file_info = {
@@ -910,8 +919,8 @@ class ImageTableWidget(QWidget):
         selected_rows = self.table.selectionModel().selectedRows()
         if selected_rows:
             idx = selected_rows[0].row()
-            if 0 <= idx < len(self._all_rows_cache):
-                row = self._all_rows_cache[idx]
+            if 0 <= idx < len(self._visible_rows):
+                row = self._visible_rows[idx]
                 title = row[3] if len(row) > 3 and row[3] is not None else ""
                 tags = row[5] if len(row) > 5 and row[5] is not None else ""
                 title_length = len(title)
@@ -1008,9 +1017,9 @@ class ImageTableWidget(QWidget):
         rows = []
         text = self.search_edit.text().strip().lower()
         if not text:
-            rows = list(self.db.get_all_files())
+            rows = list(self._all_rows_cache)
         else:
-            rows = [row for row in self._all_rows_cache if self._row_matches_search(row, text)]
+            rows = self._search_rows(text)
         # Remove cache for files not in rows
         current_filepaths = set(row[1] for row in rows)
         for filepath in list(self.details_card_cache.keys()):
@@ -1206,20 +1215,11 @@ class ImageTableWidget(QWidget):
                     print(f"Video preview error: {e}")
             elif ext in {'.svg', '.eps', '.pdf'}:
                 try:
-                    from helpers.image_compression_helper import ensure_temp_folder, convert_eps_pdf_to_jpg, convert_svg_to_jpg, get_compression_quality
-                    temp_folder = ensure_temp_folder()
-                    quality = get_compression_quality()
-                    filename = os.path.splitext(os.path.basename(filepath))[0] + "_preview.jpg"
-                    temp_jpg_path = os.path.join(temp_folder, filename)
-                    if not os.path.exists(temp_jpg_path):
-                        if ext == '.svg':
-                            temp_jpg = convert_svg_to_jpg(filepath, temp_jpg_path, quality)
-                        elif ext in ('.eps', '.pdf'):
-                            temp_jpg = convert_eps_pdf_to_jpg(filepath, temp_jpg_path, quality)
-                    else:
-                        temp_jpg = temp_jpg_path
-                    if temp_jpg and os.path.exists(temp_jpg):
-                        pixmap = QPixmap(temp_jpg)
+                    from helpers.image_compression_helper import render_vector_to_bytes
+                    image_data = render_vector_to_bytes(filepath, target_size)
+                    if image_data:
+                        pixmap = QPixmap()
+                        pixmap.loadFromData(image_data)
                         if not pixmap.isNull():
                             pixmap = pixmap.scaled(target_size, target_size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
                             self._preview_cache[filepath] = pixmap
@@ -1,4 +1,4 @@
-from PySide6.QtWidgets import QWidget, QHBoxLayout, QSpinBox, QSizePolicy, QLabel, QSpacerItem, QVBoxLayout
+from PySide6.QtWidgets import QWidget, QHBoxLayout, QSpinBox, QCheckBox, QSizePolicy, QLabel, QSpacerItem, QVBoxLayout
 from PySide6.QtCore import Qt
 import json
 import os
@@ -39,7 +39,13 @@ class PromptSectionWidget(QWidget):
         self.batch_size_spin = QSpinBox()
         self.batch_size_spin.setRange(1, 20)
         self.batch_size_spin.setSizePolicy(QSizePolicy.Policy.Fixed, QSizePolicy.Policy.Fixed)
-        self.batch_size_spin.setToolTip("Number of files processed per batch.\nMaximum is 20 per batch.")
+        self.batch_size_spin.setToolTip("Number of files processed at the same time.\nWith adaptive concurrency enabled this is the starting point;\nit grows while the API keeps up and shrinks on rate limits.")
+
+        per_request_label = QLabel("Per Request")
+        self.per_request_spin = QSpinBox()
+        self.per_request_spin.setRange(1, 10)
+        self.per_request_spin.setSizePolicy(QSizePolicy.Policy.Fixed, QSizePolicy.Policy.Fixed)
+        self.per_request_spin.setToolTip("Number of images sent together in one API request.\nThe long prompt is sent once per request, so higher values\nuse fewer prompt tokens and fewer requests. Videos are always sent alone.")
 
         compression_label = QLabel("Compression")
         self.cache_spin = QSpinBox()
@@ -47,6 +53,9 @@ class PromptSectionWidget(QWidget):
         self.cache_spin.setSizePolicy(QSizePolicy.Policy.Fixed, QSizePolicy.Policy.Fixed)
         self.cache_spin.setToolTip("Compression quality (1-100).\nLower value = higher compression, more efficient internet data usage.")
 
+        self.keyframes_checkbox = QCheckBox("Video Keyframes")
+        self.keyframes_checkbox.setToolTip("Send a few scene-change keyframes instead of uploading the whole video.\nMuch faster for long footage and also works with OpenAI.")
+
         main_layout = QHBoxLayout()
         main_layout.setAlignment(Qt.AlignmentFlag.AlignLeft)
         main_layout.setContentsMargins(0, 0, 0, 0)
@@ -60,8 +69,11 @@ class PromptSectionWidget(QWidget):
         main_layout.addWidget(self.tag_count_spin)
         main_layout.addWidget(batch_size_label)
         main_layout.addWidget(self.batch_size_spin)
+        main_layout.addWidget(per_request_label)
+        main_layout.addWidget(self.per_request_spin)
         main_layout.addWidget(compression_label)
         main_layout.addWidget(self.cache_spin)
+        main_layout.addWidget(self.keyframes_checkbox)
         main_layout.addItem(QSpacerItem(0, 0, QSizePolicy.Expanding, QSizePolicy.Minimum))
 
         outer_layout.addLayout(main_layout)
@@ -73,7 +85,9 @@ class PromptSectionWidget(QWidget):
         self.max_desc_spin.valueChanged.connect(self.save_prompt_config)
         self.tag_count_spin.valueChanged.connect(self.save_prompt_config)
         self.batch_size_spin.valueChanged.connect(self.save_prompt_config)
+        self.per_request_spin.valueChanged.connect(self.save_prompt_config)
         self.cache_spin.valueChanged.connect(self.save_prompt_config)
+        self.keyframes_checkbox.toggled.connect(self.save_prompt_config)
         self.load_prompt_config()
 
     def load_prompt_config(self):
@@ -86,7 +100,9 @@ class PromptSectionWidget(QWidget):
             self.max_desc_spin.setValue(data["max_description_length"])
             self.tag_count_spin.setValue(data["required_tag_count"])
             self.batch_size_spin.setValue(min(max(data["batch_size"], 1), 20))
+            self.per_request_spin.setValue(min(max(data.get("images_per_request", 1), 1), 10))
             self.cache_spin.setValue(data["compression_quality"])
+            self.keyframes_checkbox.setChecked(data.get("video_mode", "upload") == "keyframes")
         except Exception as e:
             print(f"Failed to load prompt config: {e}")
         self._loading = False
@@ -104,7 +120,9 @@ class PromptSectionWidget(QWidget):
         data["max_description_length"] = self.max_desc_spin.value()
         data["required_tag_count"] = self.tag_count_spin.value()
         data["batch_size"] = self.batch_size_spin.value()
+        data["images_per_request"] = self.per_request_spin.value()
         data["compression_quality"] = self.cache_spin.value()
+        data["video_mode"] = "keyframes" if self.keyframes_checkbox.isChecked() else "upload"
         try:
             with open(self.config_path, "w", encoding="utf-8") as f:
                 json.dump(data, f, indent=2, ensure_ascii=False)
@@ -89,7 +89,7 @@ class PropertiesWidget(QWidget):
             for value_label in self.fields:
                 value_label.setText("")
             if self.db:
-                files = self.db.get_all_files()
+                files = self.db.get_files_page(limit=1)
                 if files:
                     first_row = files[0]
                     title = first_row[3] if len(first_row) > 3 and first_row[3] is not None else ""
@@ -217,23 +217,13 @@ class PropertiesWidget(QWidget):
                     self.preview_label.setText("Cannot preview video")
             elif ext in {'.svg', '.eps', '.pdf'}:
                 try:
-                    temp_jpg = None
-                    from helpers.image_compression_helper import ensure_temp_folder, convert_eps_pdf_to_jpg, convert_svg_to_jpg, get_compression_quality
-                    temp_folder = ensure_temp_folder()
-                    quality = get_compression_quality()
-                    filename = os.path.splitext(os.path.basename(filepath))[0] + "_preview.jpg"
-                    temp_jpg_path = os.path.join(temp_folder, filename)
-                    if not os.path.exists(temp_jpg_path):
-                        if ext == '.svg':
-                            temp_jpg = convert_svg_to_jpg(filepath, temp_jpg_path, quality)
-                        elif ext in ('.eps', '.pdf'):
-                            temp_jpg = convert_eps_pdf_to_jpg(filepath, temp_jpg_path, quality)
-                    else:
-                        temp_jpg = temp_jpg_path
-                    if temp_jpg and os.path.exists(temp_jpg):
-                        pixmap = QPixmap(temp_jpg)
+                    from helpers.image_compression_helper import render_vector_to_bytes
+                    preview_width = self.preview_label.width() if self.preview_label.width() > 0 else 220
+                    image_data = render_vector_to_bytes(filepath, max(preview_width, 200))
+                    if image_data:
+                        pixmap = QPixmap()
+                        pixmap.loadFromData(image_data)
                         if not pixmap.isNull():
-                            preview_width = self.preview_label.width() if self.preview_label.width() > 0 else 220
                             pixmap = pixmap.scaled(preview_width, 200, Qt.KeepAspectRatio, Qt.SmoothTransformation)
                             self._preview_cache[filepath] = pixmap
                             self.preview_label.setPixmap(pixmap)